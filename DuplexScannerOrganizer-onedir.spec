@@ -0,0 +1,57 @@
+# -*- mode: python ; coding: utf-8 -*-
+# Fast-start profile: a onedir build (nothing is unpacked at launch), without UPX
+# (no decompression at launch) and without the modules the app never imports.
+# Build with: pyinstaller DuplexScannerOrganizer-onedir.spec
+
+excludes = [
+    # Development and test tooling of the standard library
+    'unittest', 'doctest', 'pdb', 'pydoc', 'pydoc_data', 'lib2to3', 'test',
+    'tkinter.test', 'idlelib', 'turtle', 'turtledemo', 'distutils', 'setuptools',
+    'pip', 'ensurepip', 'venv',
+    # Network and server modules, the GUI works on local files only
+    'xmlrpc', 'http.server', 'ftplib', 'smtplib', 'imaplib', 'poplib', 'telnetlib',
+    # Optional AES backends of PyPDF2, scanner output is not encrypted
+    'Crypto', 'Cryptodome', 'cryptography',
+]
+
+a = Analysis(
+    ['app.py'],
+    pathex=[],
+    binaries=[],
+    datas=[],
+    hiddenimports=[],
+    hookspath=[],
+    hooksconfig={},
+    runtime_hooks=[],
+    excludes=excludes,
+    noarchive=False,
+    optimize=0,
+)
+pyz = PYZ(a.pure)
+
+exe = EXE(
+    pyz,
+    a.scripts,
+    [],
+    exclude_binaries=True,
+    name='DuplexScannerOrganizer',
+    debug=False,
+    bootloader_ignore_signals=False,
+    strip=False,
+    upx=False,
+    console=False,
+    disable_windowed_traceback=False,
+    argv_emulation=False,
+    target_arch=None,
+    codesign_identity=None,
+    entitlements_file=None,
+)
+coll = COLLECT(
+    exe,
+    a.binaries,
+    a.datas,
+    strip=False,
+    upx=False,
+    upx_exclude=[],
+    name='DuplexScannerOrganizer',
+)
@@ -2,10 +2,51 @@ import tkinter as tk
 import tkinter.messagebox as messagebox
 from tkinter import filedialog, ttk
 import os
+import queue
 import subprocess
 import platform
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 
-from scan_tools import organize_scan_pdf, merge_2_pdfs_after_scan, get_total_pages
+# How often the Tk main loop drains progress events from the worker thread
+POLL_INTERVAL_MS = 100
+
+# The box of a page in the preview strip, and the space around it
+PREVIEW_THUMBNAIL_SIZE = (96, 128)
+PREVIEW_SLOT_WIDTH = PREVIEW_THUMBNAIL_SIZE[0] + 12
+
+# Threads decoding the thumbnails, apart from the job thread
+PREVIEW_WORKERS = 2
+
+# Set by benchmark.py to close the window as soon as it is drawn
+STARTUP_PROBE_ENV = "DUPLEX_STARTUP_PROBE"
+
+
+def load_scan_tools():
+    """
+    import scan_tools, and PyPDF2 with it, on first use: the window shows up before the pdf
+    machinery is loaded. a plain import statement, not importlib, so PyInstaller still finds
+    it and bundles it
+    :return: the scan_tools module
+    """
+    import scan_tools
+
+    return scan_tools
+
+
+def file_key(path):
+    """
+    :return: (size, mtime) of a file, to notice when it changed after it was prefetched
+    """
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def close_prefetched(future):
+    """Done callback releasing the file of a prefetch"""
+    if not future.cancelled() and not future.exception():
+        future.result()[1]()
 
 
 class ModernPDFApp:
@@ -41,10 +82,46 @@ class ModernPDFApp:
         self.odd_pages_path = ""
         self.even_pages_path = ""
 
+        # PDF jobs run on a worker thread and report back through this queue
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.events = queue.Queue()
+        self.cancel_event = threading.Event()
+        self.job_running = False
+        self.job_started_at = 0.0
+        self.polling = False
+
+        # Selected files are parsed on the worker thread before Organize is pressed
+        self.prefetched = {}  # path -> Future of (reader, close function, file key)
+        self.page_counts = {}  # path -> page count of the prefetched file
+        self.prefetch_pending = 0
+        self.auto_page_count = ""
+
+        # Then the page images are compared, to check that the back sides line up
+        self.alignment = {}  # tuple of paths -> list of issues, None while checking
+        self.arrange_queued = False  # Organize was pressed before the check was over
+
+        # The preview strip only draws the pages in view, their thumbnails are decoded on
+        # their own threads so the strip fills in even while a job runs
+        self.thumbnail_executor = ThreadPoolExecutor(max_workers=PREVIEW_WORKERS)
+        self.thumbnails_lock = threading.Lock()
+        self.thumbnails = None  # ThumbnailRenderer, created on first use
+        self.preview_plan = []  # (path, page index) in output order
+        self.preview_slots = {}  # (path, page index) -> slot in the strip
+        self.preview_items = {}  # slot -> canvas items of the slots drawn
+        self.preview_images = {}  # slot -> PhotoImage of the slots drawn
+        self.preview_wanted = frozenset()  # pages in or near the view
+        self.thumbnail_requests = set()  # pages queued or being rendered
+        self.preview_unavailable = None
+
         self.create_modern_ui()
 
         # Bind the Escape key to exit full screen
         self.root.bind("<Escape>", self.exit_fullscreen)
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+
+        # Load the pdf machinery on the worker thread once the window is drawn, so it is
+        # usually ready before the first click
+        self.root.after_idle(self.executor.submit, load_scan_tools)
 
     def setup_styles(self):
         """Configure modern styling for ttk widgets"""
@@ -123,6 +200,9 @@ class ModernPDFApp:
         # File selection section
         self.create_file_selection(main_frame)
 
+        # Thumbnails of the pages in their output order
+        self.create_preview_section(main_frame)
+
         # Action buttons
         self.create_action_buttons(main_frame)
 
@@ -177,7 +257,7 @@ the result to your Documents/Duplex scan folder."""
 
         ttk.Label(
             page_frame,
-            text="Total number of pages in your document:",
+            text="Total number of pages in your document (optional):",
             style="Instruction.TLabel",
         ).pack(anchor=tk.W)
 
@@ -256,6 +336,30 @@ the result to your Documents/Duplex scan folder."""
         # Dynamic content based on mode
         self.update_file_selection_ui()
 
+    def create_preview_section(self, parent):
+        """Create the thumbnail strip showing the pages in their output order"""
+        preview_frame = ttk.LabelFrame(parent, text="Preview", padding="10")
+        preview_frame.pack(fill=tk.X, pady=(0, 20))
+
+        self.preview_canvas = tk.Canvas(
+            preview_frame,
+            height=PREVIEW_THUMBNAIL_SIZE[1] + 24,
+            background="#dcdad5",
+            highlightthickness=0,
+            xscrollincrement=PREVIEW_SLOT_WIDTH,
+        )
+        self.preview_canvas.pack(fill=tk.X)
+        scrollbar = ttk.Scrollbar(
+            preview_frame, orient=tk.HORIZONTAL, command=self.scroll_preview
+        )
+        scrollbar.pack(fill=tk.X)
+        self.preview_canvas.config(xscrollcommand=scrollbar.set)
+
+        self.preview_canvas.bind("<Configure>", lambda event: self.draw_preview())
+        for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+            self.preview_canvas.bind(sequence, self.on_preview_wheel)
+        self.update_preview()
+
     def create_action_buttons(self, parent):
         """Create the action buttons"""
         button_frame = ttk.Frame(parent)
@@ -279,6 +383,16 @@ the result to your Documents/Duplex scan folder."""
         )
         self.process_button.pack(side=tk.LEFT)
 
+        # Cancel button, only enabled while a job is running
+        self.cancel_button = ttk.Button(
+            button_frame,
+            text="✖ Cancel",
+            command=self.cancel_job,
+            style="Action.TButton",
+            state=tk.DISABLED,
+        )
+        self.cancel_button.pack(side=tk.LEFT, padx=(10, 0))
+
     def create_status_section(self, parent):
         """Create the status section"""
         self.status_frame = ttk.Frame(parent)
@@ -291,9 +405,17 @@ the result to your Documents/Duplex scan folder."""
         )
         self.status_label.pack()
 
+        # Pages/sec and ETA of the running job
+        self.progress_label = ttk.Label(
+            self.status_frame, text="", style="Instruction.TLabel"
+        )
+        self.progress_label.pack()
+
     def on_mode_change(self):
         """Handle mode change"""
+        self.arrange_queued = False
         self.update_file_selection_ui()
+        self.update_preview()
         self.update_status("Mode changed. Please select your file(s).")
 
     def update_file_selection_ui(self):
@@ -341,6 +463,8 @@ the result to your Documents/Duplex scan folder."""
 
     def select_files(self):
         """Handle file selection"""
+        # Organize was pressed for the previous selection
+        self.arrange_queued = False
         try:
             if self.radio_var.get() == "one_file":
                 self.file_path = filedialog.askopenfilename(
@@ -352,6 +476,7 @@ the result to your Documents/Duplex scan folder."""
                     filename = os.path.basename(self.file_path)
                     self.file_display.config(text=f"✓ {filename}", foreground="#27ae60")
                     self.update_status(f"Selected: {filename}", "#27ae60")
+                    self.prefetch(self.file_path)
                 else:
                     self.update_status("No file selected", "#e74c3c")
             else:
@@ -366,6 +491,7 @@ the result to your Documents/Duplex scan folder."""
                     self.odd_file_display.config(
                         text=f"✓ {odd_filename}", foreground="#27ae60"
                     )
+                    self.prefetch(self.odd_pages_path)
 
                     # Select even pages file
                     self.even_pages_path = filedialog.askopenfilename(
@@ -381,15 +507,311 @@ the result to your Documents/Duplex scan folder."""
                         self.update_status(
                             "Both files selected successfully", "#27ae60"
                         )
+                        self.prefetch(self.even_pages_path)
                     else:
                         self.update_status(
                             "Please select the even pages file", "#e74c3c"
                         )
                 else:
                     self.update_status("No files selected", "#e74c3c")
+            self.release_prefetched()
+            self.update_preview()
         except Exception as e:
             self.update_status(f"Error selecting files: {str(e)}", "#e74c3c")
 
+    def selected_paths(self):
+        """The files of the current mode that were selected"""
+        if self.radio_var.get() == "one_file":
+            paths = [self.file_path]
+        else:
+            paths = [self.odd_pages_path, self.even_pages_path]
+        return [path for path in paths if path]
+
+    def prefetch(self, path):
+        """Open and parse a selected file on the worker thread"""
+        future = self.prefetched.get(path)
+        if future is not None:
+            if not future.done():
+                return
+            try:
+                if not future.exception() and future.result()[2] == file_key(path):
+                    self.fill_page_count()
+                    self.verify_alignment()
+                    return
+            except OSError:
+                pass
+            if self.job_running:
+                return
+            # The file changed since it was parsed
+            self.page_counts.pop(path, None)
+            self.forget_alignment(path)
+            self.forget_thumbnails(path)
+            self.prefetched.pop(path).add_done_callback(close_prefetched)
+        self.prefetch_pending += 1
+        self.prefetched[path] = self.executor.submit(self.run_prefetch, path)
+        self.start_polling()
+
+    def run_prefetch(self, path):
+        """Worker thread body of prefetch"""
+        try:
+            key = file_key(path)
+            pdf_reader, close = load_scan_tools().preload_pdf(path)
+        except Exception as e:
+            self.events.put(("prefetch_failed", path, e))
+            raise
+        self.events.put(("prefetched", path, len(pdf_reader.pages)))
+        return pdf_reader, close, key
+
+    def release_prefetched(self, keep=None):
+        """Close the prefetched files that are no longer selected"""
+        if self.job_running:
+            # The job may be using them, finish_job calls this again
+            return
+        keep = self.selected_paths() if keep is None else keep
+        for path in list(self.prefetched):
+            if path not in keep:
+                self.page_counts.pop(path, None)
+                self.forget_alignment(path)
+                self.forget_thumbnails(path)
+                self.prefetched.pop(path).add_done_callback(close_prefetched)
+
+    def take_prefetched(self, path):
+        """
+        The prefetched reader of a file, or None if it failed or the file changed.
+        Called on the worker thread, while release_prefetched leaves the readers alone.
+        """
+        future = self.prefetched.get(path)
+        if future is None or not future.done() or future.exception():
+            return None
+        pdf_reader, _, key = future.result()
+        try:
+            if file_key(path) != key:
+                return None
+        except OSError:
+            return None
+        return pdf_reader
+
+    def fill_page_count(self):
+        """Fill in the page count of the prefetched files, unless the user typed one"""
+        counts = [self.page_counts.get(path) for path in self.selected_paths()]
+        if self.radio_var.get() == "two_files":
+            if len(counts) == 2 and None not in counts and counts[0] != counts[1]:
+                self.update_status(
+                    f"Odd pages file: {counts[0]} pages, "
+                    f"even pages file: {counts[1]} pages",
+                    "#e74c3c",
+                )
+                return
+        if not counts or None in counts:
+            return
+
+        if self.num_pages_entry.get().strip() in ("", self.auto_page_count):
+            self.auto_page_count = str(counts[0])
+            self.num_pages_entry.delete(0, tk.END)
+            self.num_pages_entry.insert(0, self.auto_page_count)
+
+    def verify_alignment(self):
+        """Compare the page images of the selection on the worker thread"""
+        paths = tuple(self.selected_paths())
+        expected = 1 if self.radio_var.get() == "one_file" else 2
+        if len(paths) != expected or any(
+            path not in self.page_counts for path in paths
+        ):
+            return
+        if paths in self.alignment:
+            return
+        self.alignment[paths] = None
+        self.prefetch_pending += 1
+        self.executor.submit(self.run_verification, paths)
+        self.start_polling()
+
+    def run_verification(self, paths):
+        """Worker thread body of verify_alignment"""
+        try:
+            issues = load_scan_tools().verify_scan_alignment(*paths)
+        except Exception as e:
+            # Without numpy, or with images it can't read, the check is skipped
+            print(f"Could not check the page alignment: {e}")
+            issues = None
+        self.events.put(("verified", paths, issues))
+
+    def forget_alignment(self, path):
+        """Drop the alignment results involving a file"""
+        for paths in [paths for paths in self.alignment if path in paths]:
+            del self.alignment[paths]
+
+    def confirm_alignment(self):
+        """Ask before arranging a selection whose back sides don't line up"""
+        paths = tuple(self.selected_paths())
+        issues = self.alignment.get(paths)
+        if issues is None:
+            if paths in self.alignment or self.prefetch_pending:
+                # poll_events presses Organize again once the check is over
+                self.arrange_queued = True
+                self.update_status(
+                    "Checking that the pages line up, the PDF will be organized next...",
+                    "#f39c12",
+                )
+                return False
+            return True
+        if not issues:
+            return True
+        return messagebox.askyesno(
+            "Page Alignment Warning",
+            "\n\n".join(issues) + "\n\nArrange the pages anyway?",
+        )
+
+    def update_preview(self):
+        """Lay out the preview strip for the output order of the selection"""
+        paths = self.selected_paths()
+        counts = [self.page_counts.get(path) for path in paths]
+        expected = 1 if self.radio_var.get() == "one_file" else 2
+        plan = []
+        if len(paths) == expected and None not in counts:
+            scan_tools = load_scan_tools()
+            if expected == 1:
+                page_order = scan_tools.duplex_page_order(counts[0])
+                plan = [(paths[0], page) for page in page_order]
+            else:
+                page_order = scan_tools.interleave_page_order(*counts)
+                plan = [(paths[source], page) for source, page in page_order]
+        if plan == self.preview_plan and self.preview_items:
+            return
+
+        self.preview_plan = plan
+        self.preview_slots = {entry: slot for slot, entry in enumerate(plan)}
+        self.preview_items.clear()
+        self.preview_images.clear()
+        canvas = self.preview_canvas
+        canvas.delete("all")
+        height = PREVIEW_THUMBNAIL_SIZE[1] + 24
+        canvas.config(scrollregion=(0, 0, len(plan) * PREVIEW_SLOT_WIDTH, height))
+        canvas.xview_moveto(0)
+        if not plan:
+            canvas.create_text(
+                8,
+                height / 2,
+                anchor=tk.W,
+                text="The pages will show up here in their new order",
+                font=("Segoe UI", 10),
+                fill="#555555",
+            )
+        self.draw_preview()
+
+    def draw_preview(self):
+        """Draw the slots in view, drop the others and queue the missing thumbnails"""
+        if not self.preview_plan:
+            return
+        canvas = self.preview_canvas
+        left = canvas.canvasx(0)
+        first = max(0, int(left // PREVIEW_SLOT_WIDTH))
+        last = min(
+            len(self.preview_plan),
+            int((left + canvas.winfo_width()) // PREVIEW_SLOT_WIDTH) + 1,
+        )
+        for slot in [slot for slot in self.preview_items if not first <= slot < last]:
+            canvas.delete(*self.preview_items.pop(slot))
+            self.preview_images.pop(slot, None)
+        for slot in range(first, last):
+            if slot not in self.preview_items:
+                self.draw_preview_slot(slot)
+
+        if self.preview_unavailable:
+            return
+        # Render a screen ahead on each side, so scrolling finds the pages ready
+        span = last - first
+        ahead = list(range(first, last)) + [
+            slot
+            for offset in range(1, span + 1)
+            for slot in (last - 1 + offset, first - offset)
+            if 0 <= slot < len(self.preview_plan)
+        ]
+        self.preview_wanted = frozenset(self.preview_plan[slot] for slot in ahead)
+        for slot in ahead:
+            self.request_thumbnail(self.preview_plan[slot])
+
+    def draw_preview_slot(self, slot):
+        """Draw the frame and number of a page in the strip, and its thumbnail if ready"""
+        width, height = PREVIEW_THUMBNAIL_SIZE
+        x = slot * PREVIEW_SLOT_WIDTH + (PREVIEW_SLOT_WIDTH - width) / 2
+        self.preview_items[slot] = [
+            self.preview_canvas.create_rectangle(
+                x, 2, x + width, 2 + height, outline="#bdc3c7", fill="#ecf0f1"
+            ),
+            self.preview_canvas.create_text(
+                x + width / 2,
+                height + 14,
+                text=str(slot + 1),
+                font=("Segoe UI", 9),
+                fill="#2c3e50",
+            ),
+        ]
+        if self.thumbnails is not None:
+            data = self.thumbnails.cached(*self.preview_plan[slot])
+            if data is not None:
+                self.show_thumbnail(slot, data)
+
+    def show_thumbnail(self, slot, data):
+        """Put a rendered thumbnail in its slot"""
+        width, height = PREVIEW_THUMBNAIL_SIZE
+        x = slot * PREVIEW_SLOT_WIDTH + PREVIEW_SLOT_WIDTH / 2
+        image = tk.PhotoImage(data=data, format="PPM")
+        self.preview_images[slot] = image
+        self.preview_items[slot].append(
+            self.preview_canvas.create_image(x, 2 + height / 2, image=image)
+        )
+
+    def scroll_preview(self, *args):
+        """Scrollbar command of the strip"""
+        self.preview_canvas.xview(*args)
+        self.draw_preview()
+
+    def on_preview_wheel(self, event):
+        """Scroll the strip a few pages per wheel step"""
+        step = -3 if event.num == 4 or getattr(event, "delta", 0) > 0 else 3
+        self.preview_canvas.xview_scroll(step, "units")
+        self.draw_preview()
+
+    def request_thumbnail(self, entry):
+        """Render the thumbnail of a (path, page index) on the thumbnail threads"""
+        if entry in self.thumbnail_requests:
+            return
+        if self.thumbnails is not None and self.thumbnails.cached(*entry) is not None:
+            return
+        self.thumbnail_requests.add(entry)
+        self.thumbnail_executor.submit(self.run_thumbnail, entry)
+        self.start_polling()
+
+    def thumbnail_renderer(self):
+        """The ThumbnailRenderer, created on the thumbnail threads on first use"""
+        with self.thumbnails_lock:
+            if self.thumbnails is None:
+                import thumbnails
+
+                self.thumbnails = thumbnails.ThumbnailRenderer(PREVIEW_THUMBNAIL_SIZE)
+            return self.thumbnails
+
+    def run_thumbnail(self, entry):
+        """Thumbnail thread body of request_thumbnail"""
+        data = error = None
+        # Pages scrolled out of view before their turn are skipped
+        if entry in self.preview_wanted:
+            try:
+                data = self.thumbnail_renderer().render(*entry)
+            except ImportError as e:
+                error = str(e)
+            except Exception as e:
+                print(f"Could not render page {entry[1] + 1} of {entry[0]}: {e}")
+        self.events.put(("thumbnail", entry, data, error))
+
+    def forget_thumbnails(self, path):
+        """Drop the thumbnails of a file, and the strip showing them"""
+        if self.thumbnails is not None:
+            self.thumbnails.forget(path)
+        if any(entry[0] == path for entry in self.preview_slots):
+            self.preview_plan = []
+            self.preview_slots = {}
+
     def open_folder(self, folder_path):
         """Open the folder containing the output file"""
         try:
@@ -405,22 +827,18 @@ the result to your Documents/Duplex scan folder."""
     def arrange(self):
         """Process and arrange the PDF files"""
         try:
-            # Validate page count input
-            if not self.num_pages_entry.get().strip():
-                messagebox.showerror(
-                    "Input Error", "Please enter the total number of pages."
-                )
-                return
-
-            try:
-                num_pages = int(self.num_pages_entry.get())
-                if num_pages <= 0:
-                    raise ValueError("Page count must be positive")
-            except ValueError:
-                messagebox.showerror(
-                    "Input Error", "Please enter a valid positive number for pages."
-                )
-                return
+            # The page count is optional, the page images are checked anyway
+            num_pages = None
+            if self.num_pages_entry.get().strip():
+                try:
+                    num_pages = int(self.num_pages_entry.get())
+                    if num_pages <= 0:
+                        raise ValueError("Page count must be positive")
+                except ValueError:
+                    messagebox.showerror(
+                        "Input Error", "Please enter a valid positive number for pages."
+                    )
+                    return
 
             # Validate filename input
             filename = self.filename_entry.get().strip()
@@ -439,16 +857,14 @@ the result to your Documents/Duplex scan folder."""
                 )
                 return
 
-            self.update_status("Processing PDF...", "#f39c12")
-            self.root.update()
+            if self.job_running:
+                return
 
             error_message = (
                 "The number of pages you entered doesn't match the total pages in your PDF(s). "
                 "Please check that all pages were scanned correctly."
             )
 
-            output_path = None
-
             if self.radio_var.get() == "one_file":
                 if not self.file_path:
                     messagebox.showerror(
@@ -462,13 +878,18 @@ the result to your Documents/Duplex scan folder."""
                     )
                     return
 
-                actual_pages = get_total_pages(self.file_path)
-                if num_pages == actual_pages:
-                    output_path = organize_scan_pdf(
-                        self.file_path, custom_filename=filename
+                scan_tools = load_scan_tools()
+                actual_pages = scan_tools.get_total_pages(self.file_path)
+                if num_pages in (None, actual_pages):
+                    if not self.confirm_alignment():
+                        return
+                    self.start_job(
+                        scan_tools.organize_scan_pdf,
+                        (self.file_path,),
+                        {"custom_filename": filename},
+                        "✓ PDF organized successfully!",
+                        {"pdf_reader": self.file_path},
                     )
-                    self.update_status("✓ PDF organized successfully!", "#27ae60")
-                    self.show_success_message(output_path)
                 else:
                     self.update_status("Error: Page count mismatch", "#e74c3c")
                     messagebox.showerror(
@@ -492,17 +913,23 @@ the result to your Documents/Duplex scan folder."""
                     )
                     return
 
-                odd_total = get_total_pages(self.odd_pages_path)
-                even_total = get_total_pages(self.even_pages_path)
-
-                if num_pages == odd_total == even_total:
-                    output_path = merge_2_pdfs_after_scan(
-                        self.odd_pages_path,
-                        self.even_pages_path,
-                        custom_filename=filename,
+                scan_tools = load_scan_tools()
+                odd_total = scan_tools.get_total_pages(self.odd_pages_path)
+                even_total = scan_tools.get_total_pages(self.even_pages_path)
+
+                if num_pages is None or num_pages == odd_total == even_total:
+                    if not self.confirm_alignment():
+                        return
+                    self.start_job(
+                        scan_tools.merge_2_pdfs_after_scan,
+                        (self.odd_pages_path, self.even_pages_path),
+                        {"custom_filename": filename},
+                        "✓ PDFs merged successfully!",
+                        {
+                            "odd_pdf_reader": self.odd_pages_path,
+                            "even_pdf_reader": self.even_pages_path,
+                        },
                     )
-                    self.update_status("✓ PDFs merged successfully!", "#27ae60")
-                    self.show_success_message(output_path)
                 else:
                     self.update_status("Error: Page count mismatch", "#e74c3c")
                     messagebox.showerror(
@@ -520,6 +947,162 @@ the result to your Documents/Duplex scan folder."""
                 f"An error occurred while processing your PDF:\n\n{str(e)}",
             )
 
+    def start_job(self, function, args, kwargs, success_message, prefetched=None):
+        """
+        Run a scan_tools function on the worker thread. prefetched maps reader arguments
+        of the function to the file whose prefetched reader they should get.
+        """
+        self.job_running = True
+        self.job_started_at = time.monotonic()
+        self.cancel_event.clear()
+        self.process_button.config(state=tk.DISABLED)
+        self.cancel_button.config(state=tk.NORMAL)
+        self.update_status("Processing PDF...", "#f39c12")
+        self.progress_label.config(text="")
+
+        self.executor.submit(
+            self.run_job, function, args, kwargs, success_message, prefetched or {}
+        )
+        self.start_polling()
+
+    def start_polling(self):
+        """Drain the worker events until the job and the prefetches are over"""
+        if not self.polling:
+            self.polling = True
+            self.root.after(POLL_INTERVAL_MS, self.poll_events)
+
+    def run_job(self, function, args, kwargs, success_message, prefetched):
+        """Worker thread body: never touches Tk, only posts events"""
+        # The prefetches were queued first on this thread, so they are finished
+        for name, path in prefetched.items():
+            kwargs = dict(kwargs, **{name: self.take_prefetched(path)})
+
+        def progress_callback(done, total):
+            self.events.put(("progress", done, total))
+            return not self.cancel_event.is_set()
+
+        try:
+            output_path = function(*args, progress_callback=progress_callback, **kwargs)
+            self.events.put(("done", output_path, success_message))
+        except Exception as e:
+            if isinstance(e, load_scan_tools().OperationCancelled):
+                self.events.put(("cancelled",))
+            else:
+                self.events.put(("error", e))
+
+    def poll_events(self):
+        """Drain the worker events on the Tk main thread"""
+        while True:
+            try:
+                event = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if event[0] == "progress":
+                self.show_progress(event[1], event[2])
+            elif event[0] == "prefetched":
+                self.prefetch_pending -= 1
+                self.page_counts[event[1]] = event[2]
+                self.fill_page_count()
+                self.verify_alignment()
+                self.update_preview()
+            elif event[0] == "prefetch_failed":
+                self.prefetch_pending -= 1
+                self.update_status(
+                    f"Can't read {os.path.basename(event[1])}: {event[2]}", "#e74c3c"
+                )
+            elif event[0] == "verified":
+                self.prefetch_pending -= 1
+                if event[1] in self.alignment:
+                    self.alignment[event[1]] = event[2] or []
+                if (
+                    event[1] == tuple(self.selected_paths())
+                    and event[2] is not None
+                    and not self.job_running
+                ):
+                    if event[2]:
+                        self.update_status(f"⚠ {event[2][0]}", "#e74c3c")
+                    else:
+                        self.update_status(
+                            "✓ The back sides line up with the fronts", "#27ae60"
+                        )
+            elif event[0] == "thumbnail":
+                self.thumbnail_requests.discard(event[1])
+                slot = self.preview_slots.get(event[1])
+                if event[3] and not self.preview_unavailable:
+                    # Without numpy the strip only shows the page order
+                    self.preview_unavailable = event[3]
+                    print(f"No thumbnails: {event[3]}")
+                elif (
+                    event[2] is not None
+                    and slot in self.preview_items
+                    and slot not in self.preview_images
+                ):
+                    self.show_thumbnail(slot, event[2])
+            elif event[0] == "done":
+                self.finish_job()
+                self.update_status(event[2], "#27ae60")
+                self.show_success_message(event[1])
+            elif event[0] == "cancelled":
+                self.finish_job()
+                self.update_status("Operation cancelled", "#e74c3c")
+            elif event[0] == "error":
+                self.finish_job()
+                self.update_status(f"Error: {str(event[1])}", "#e74c3c")
+                messagebox.showerror(
+                    "Processing Error",
+                    f"An error occurred while processing your PDF:\n\n{str(event[1])}",
+                )
+
+        if self.arrange_queued and not self.prefetch_pending and not self.job_running:
+            self.arrange_queued = False
+            self.arrange()
+
+        if self.job_running or self.prefetch_pending or self.thumbnail_requests:
+            self.root.after(POLL_INTERVAL_MS, self.poll_events)
+        else:
+            self.polling = False
+
+    def show_progress(self, done, total):
+        """Show pages/sec and ETA of the running job"""
+        elapsed = time.monotonic() - self.job_started_at
+        rate = done / elapsed if elapsed > 0 else 0.0
+        if done >= total:
+            self.update_status("Writing output file...", "#f39c12")
+            self.progress_label.config(text=f"{total} pages, {rate:.1f} pages/sec")
+            return
+
+        eta = (total - done) / rate if rate > 0 else 0.0
+        minutes, seconds = divmod(int(eta), 60)
+        self.update_status(f"Processing page {done} of {total}...", "#f39c12")
+        self.progress_label.config(
+            text=f"{rate:.1f} pages/sec, ETA {minutes}:{seconds:02d}"
+        )
+
+    def finish_job(self):
+        """Reset the UI after a job ended"""
+        self.job_running = False
+        self.process_button.config(state=tk.NORMAL)
+        self.cancel_button.config(state=tk.DISABLED)
+        self.progress_label.config(text="")
+        self.release_prefetched()
+
+    def cancel_job(self):
+        """Ask the running job to stop at the next page"""
+        if self.job_running:
+            self.cancel_event.set()
+            self.update_status("Cancelling...", "#f39c12")
+
+    def on_close(self):
+        """Stop the running job and close the window"""
+        self.cancel_event.set()
+        self.release_prefetched(keep=())
+        self.executor.shutdown(wait=False)
+        self.thumbnail_executor.shutdown(wait=False, cancel_futures=True)
+        if self.thumbnails is not None:
+            self.thumbnails.close()
+        self.root.destroy()
+
     def show_success_message(self, output_path):
         """Show success message with clickable folder link"""
         folder_path = os.path.dirname(output_path)
@@ -565,4 +1148,6 @@ the result to your Documents/Duplex scan folder."""
 if __name__ == "__main__":
     root = tk.Tk()
     app = ModernPDFApp(root)
+    if os.environ.get(STARTUP_PROBE_ENV):
+        root.after_idle(root.destroy)
     root.mainloop()
@@ -0,0 +1,402 @@
+import argparse
+import contextlib
+import datetime
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+PAGE_SIZES = {"letter": (612, 792), "a4": (595, 842)}
+
+CASES = (
+    "get_total_pages",
+    "organize_scan_pdf",
+    "organize_scan_pdf_streaming",
+    "merge_2_pdfs_after_scan",
+    "merge_pdfs",
+    "merge_pdfs_streaming",
+)
+
+
+def write_synthetic_pdf(path, page_numbers, page_size=(612, 792), image_kb=0, seed=0):
+    """
+    write a pdf that looks like a scanner output: every page shows its page number and, when
+    image_kb is set, a full-page grayscale image of about that size (random, so incompressible)
+    :param path: the pdf to write
+    :param page_numbers: the number printed on each page, in file order
+    :param page_size: (width, height) in points
+    :param image_kb: the weight of the embedded image of each page, 0 for none
+    :param seed: seed of the image content, for reproducible files
+    """
+    rng = random.Random(seed)
+    width, height = page_size
+    side = int((image_kb * 1024) ** 0.5)
+    offsets = {}
+    kids = []
+
+    with open(path, "wb") as pdf_file:
+
+        def write_object(number, data):
+            offsets[number] = pdf_file.tell()
+            pdf_file.write(b"%d 0 obj\n" % number + data + b"\nendobj\n")
+
+        pdf_file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+
+        number = 4
+        for page_number in page_numbers:
+            resources = b"/Font << /F1 3 0 R >>"
+            content = b""
+            if side:
+                image = rng.randbytes(side * side)
+                write_object(
+                    number,
+                    b"<< /Type /XObject /Subtype /Image /Width %d /Height %d "
+                    b"/ColorSpace /DeviceGray /BitsPerComponent 8 /Length %d >>\n"
+                    b"stream\n" % (side, side, len(image)) + image + b"\nendstream",
+                )
+                resources += b" /XObject << /Im0 %d 0 R >>" % number
+                content = b"q %d 0 0 %d 0 0 cm /Im0 Do Q " % (width, height)
+                number += 1
+
+            content += b"BT /F1 24 Tf 72 72 Td (Page %d) Tj ET" % page_number
+            write_object(
+                number,
+                b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream",
+            )
+            write_object(
+                number + 1,
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                b"/Resources << %s >> /Contents %d 0 R >>"
+                % (width, height, resources, number),
+            )
+            kids.append(number + 1)
+            number += 2
+
+        write_object(
+            2,
+            b"<< /Type /Pages /Kids [%s] /Count %d >>"
+            % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)),
+        )
+
+        xref_offset = pdf_file.tell()
+        pdf_file.write(b"xref\n0 %d\n0000000000 65535 f \n" % number)
+        for object_number in range(1, number):
+            pdf_file.write(b"%010d 00000 n \n" % offsets[object_number])
+        pdf_file.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (number, xref_offset)
+        )
+
+
+def generate_duplex_scan(folder, pages, page_size=(612, 792), image_kb=0, parts=10):
+    """
+    generate the inputs of every benchmark case: a one-file duplex scan (odd pages, then even
+    pages in reverse), the same scan split into odd and even files, and a set of parts to merge
+    :param folder: where to write the files
+    :param pages: the number of pages of the document
+    :param page_size: (width, height) in points
+    :param image_kb: the weight of the embedded image of each page
+    :param parts: the number of files for the merge cases
+    :return: dict with the paths of 'scan', 'odd', 'even' and 'parts'
+    """
+    odd_pages = list(range(1, pages + 1, 2))
+    even_pages = list(range(pages - pages % 2, 0, -2))
+    paths = {
+        "scan": os.path.join(folder, "scan.pdf"),
+        "odd": os.path.join(folder, "scan_odd.pdf"),
+        "even": os.path.join(folder, "scan_even.pdf"),
+        "parts": [],
+    }
+    write_synthetic_pdf(paths["scan"], odd_pages + even_pages, page_size, image_kb, 1)
+    write_synthetic_pdf(paths["odd"], odd_pages, page_size, image_kb, 2)
+    write_synthetic_pdf(paths["even"], even_pages, page_size, image_kb, 3)
+
+    part_size = max(1, -(-pages // parts))
+    for index, start in enumerate(range(1, pages + 1, part_size)):
+        path = os.path.join(folder, f"part_{index:03d}.pdf")
+        page_numbers = range(start, min(pages, start + part_size - 1) + 1)
+        write_synthetic_pdf(path, page_numbers, page_size, image_kb, 10 + index)
+        paths["parts"].append(path)
+    return paths
+
+
+def peak_rss_kb():
+    """
+    :return: the peak resident memory of the current process in KB, None where unsupported
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes, Linux reports kilobytes
+    return peak // 1024 if sys.platform == "darwin" else peak
+
+
+def open_descriptors():
+    """
+    :return: the number of open file descriptors, None where /proc is not available
+    """
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return None
+
+
+def run_case(case, paths, output_dir):
+    """
+    run one benchmark case in the current process, this is executed in a fresh worker process
+    so that the peak memory belongs to this case only
+    :return: dict with the wall time, peak rss, bytes written and descriptor growth
+    """
+    import scan_tools
+
+    descriptors = open_descriptors()
+    output = os.path.join(output_dir, f"{case}.pdf")
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if case == "get_total_pages":
+            scan_tools.get_total_pages(paths["scan"])
+            output = None
+        elif case.startswith("organize_scan_pdf"):
+            output = scan_tools.organize_scan_pdf(
+                paths["scan"],
+                custom_filename=case,
+                output_dir=output_dir,
+                streaming=case.endswith("_streaming"),
+            )
+        elif case == "merge_2_pdfs_after_scan":
+            output = scan_tools.merge_2_pdfs_after_scan(
+                paths["odd"], paths["even"], custom_filename=case, output_dir=output_dir
+            )
+        elif case.startswith("merge_pdfs"):
+            scan_tools.merge_pdfs(
+                paths["parts"], output, streaming=case.endswith("_streaming")
+            )
+        else:
+            raise ValueError(f"Unknown case: {case}")
+    seconds = time.perf_counter() - started
+
+    result = {
+        "seconds": seconds,
+        "peak_rss_kb": peak_rss_kb(),
+        "bytes_written": os.path.getsize(output) if output else 0,
+        "descriptor_growth": None,
+    }
+    if descriptors is not None:
+        result["descriptor_growth"] = open_descriptors() - descriptors
+    if output:
+        os.remove(output)
+    return result
+
+
+def run_benchmarks(cases, paths, output_dir, repeat=3):
+    """
+    run every case repeat times, each run in a new process
+    :return: list of per-case results
+    """
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for case in cases:
+        runs = []
+        for _ in range(repeat):
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                runs.append(executor.submit(run_case, case, paths, output_dir).result())
+        seconds = [run["seconds"] for run in runs]
+        peaks = [run["peak_rss_kb"] for run in runs if run["peak_rss_kb"] is not None]
+        results.append(
+            {
+                "case": case,
+                "seconds_min": round(min(seconds), 6),
+                "seconds_median": round(statistics.median(seconds), 6),
+                "peak_rss_kb": max(peaks) if peaks else None,
+                "bytes_written": runs[-1]["bytes_written"],
+                "descriptor_growth": runs[-1]["descriptor_growth"],
+                "runs": [round(value, 6) for value in seconds],
+            }
+        )
+        print(
+            f"{case:<30} {results[-1]['seconds_median']:>10.4f} s "
+            f"{results[-1]['peak_rss_kb'] or 0:>10} KB",
+            file=sys.stderr,
+        )
+    return results
+
+
+def compare_results(baseline, results, threshold=0.10):
+    """
+    compare a run with a baseline run
+    :param baseline: the parsed JSON of a previous run
+    :param results: the results of this run
+    :param threshold: relative slowdown of the median time that counts as a regression
+    :return: list of regression messages
+    """
+    previous = {result["case"]: result for result in baseline["results"]}
+    regressions = []
+    for result in results:
+        before = previous.get(result["case"])
+        if not before or not before.get("seconds_median") or "error" in result:
+            continue
+        ratio = result["seconds_median"] / before["seconds_median"]
+        if ratio > 1 + threshold:
+            regressions.append(
+                f"{result['case']}: {before['seconds_median']:.4f} s -> "
+                f"{result['seconds_median']:.4f} s ({(ratio - 1) * 100:.0f}% slower)"
+            )
+    return regressions
+
+
+def measure_startup(command, repeat=5, env=None):
+    """
+    time a command from launch to exit, repeat times
+    :param command: the command line as a list
+    :param env: extra environment variables
+    :return: dict with the min and median seconds and the runs, or the error of the first
+             failed run
+    """
+    full_env = dict(os.environ, **(env or {}))
+    runs = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        completed = subprocess.run(
+            command, env=full_env, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            lines = completed.stderr.strip().splitlines()
+            return {"error": lines[-1] if lines else f"exit {completed.returncode}"}
+        runs.append(time.perf_counter() - started)
+    return {
+        "seconds_min": round(min(runs), 6),
+        "seconds_median": round(statistics.median(runs), 6),
+        "runs": [round(value, 6) for value in runs],
+    }
+
+
+def run_startup_benchmarks(repeat=5, bundle=None):
+    """
+    time the cold start of the GUI: the import of app.py, the script until its window is
+    drawn and, when given, the frozen bundle until its window is drawn. the window cases
+    need a display.
+    :param bundle: path of the PyInstaller executable
+    :return: list of per-case results
+    """
+    from app import STARTUP_PROBE_ENV
+
+    here = os.path.dirname(os.path.abspath(__file__))
+    probe = {STARTUP_PROBE_ENV: "1"}
+    commands = [
+        ("import_app", [sys.executable, "-c", "import app"], None),
+        ("script_window", [sys.executable, os.path.join(here, "app.py")], probe),
+    ]
+    if bundle:
+        commands.append(("bundle_window", [os.path.abspath(bundle)], probe))
+
+    results = []
+    for case, command, env in commands:
+        result = {"case": case}
+        result.update(measure_startup(command, repeat, env))
+        results.append(result)
+        if "error" in result:
+            print(f"{case:<30} failed: {result['error']}", file=sys.stderr)
+        else:
+            print(f"{case:<30} {result['seconds_median']:>10.4f} s", file=sys.stderr)
+    return results
+
+
+def parse_page_size(value):
+    if value in PAGE_SIZES:
+        return PAGE_SIZES[value]
+    try:
+        width, height = (int(part) for part in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError("use letter, a4 or WIDTHxHEIGHT in points")
+    return width, height
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Benchmark scan_tools on synthetic duplex scans."
+    )
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument(
+        "--page-size", type=parse_page_size, default="letter", help="letter, a4 or WxH"
+    )
+    parser.add_argument(
+        "--image-kb", type=int, default=200, help="image weight per page, 0 for none"
+    )
+    parser.add_argument("--parts", type=int, default=10, help="files for merge_pdfs")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=list(CASES))
+    parser.add_argument("-o", "--output", help="write the results to this JSON file")
+    parser.add_argument(
+        "--startup",
+        action="store_true",
+        help="time the GUI cold start instead of the pdf operations",
+    )
+    parser.add_argument(
+        "--bundle", help="with --startup, also time this PyInstaller executable"
+    )
+    parser.add_argument("--compare", help="a previous JSON result to compare with")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.10,
+        help="relative slowdown reported as a regression (default: 0.10)",
+    )
+    args = parser.parse_args(argv)
+
+    if args.startup:
+        results = run_startup_benchmarks(args.repeat, args.bundle)
+        config = {"startup": True, "bundle": args.bundle, "repeat": args.repeat}
+    else:
+        with tempfile.TemporaryDirectory(prefix="scan_bench_") as work_dir:
+            output_dir = os.path.join(work_dir, "out")
+            os.makedirs(output_dir)
+            paths = generate_duplex_scan(
+                work_dir, args.pages, args.page_size, args.image_kb, args.parts
+            )
+            results = run_benchmarks(args.cases, paths, output_dir, args.repeat)
+        config = {
+            "pages": args.pages,
+            "page_size": list(args.page_size),
+            "image_kb": args.image_kb,
+            "parts": args.parts,
+            "repeat": args.repeat,
+        }
+
+    report = {
+        "created": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": config,
+        "results": results,
+    }
+    if args.output:
+        with open(args.output, "w") as output_file:
+            json.dump(report, output_file, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare_results(
+                json.load(baseline_file), results, args.threshold
+            )
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
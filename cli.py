@@ -0,0 +1,793 @@
+import argparse
+import contextlib
+import glob
+import itertools
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from journal import (
+    BatchJournal,
+    job_key,
+    job_outputs,
+    job_partial_outputs,
+    plan_job_outputs,
+    remove_partial_outputs,
+)
+from metrics import JsonLinesSink, PrometheusTextSink, capture_metrics
+from page_index import PageIndex
+from result_cache import ResultCache
+from scan_tools import (
+    BLANK_INK_THRESHOLD,
+    EVEN_BATCH_ORDERS,
+    OPTIMIZE_IMAGE_DPI,
+    OPTIMIZE_IMAGE_QUALITY,
+    SEPARATOR_MAX_DISTANCE,
+    append_pages,
+    organize_scan_pdf,
+    merge_2_pdfs_after_scan,
+    merge_batches_after_scan,
+    merge_pdfs,
+    merge_pdfs_parallel,
+    get_page_fingerprints,
+    get_total_pages,
+    split_scan_pdf,
+    verify_scan_alignment,
+)
+
+PAIRING_RULES = ("sequential", "suffix")
+
+DEFAULT_CACHE_MB = 1024
+
+# The modes whose output holds the pages of their inputs, indexed with their fingerprints
+INDEXED_MODES = ("organize", "merge2", "batches", "merge", "index")
+
+
+def collect_pdf_paths(inputs):
+    """
+    expand the command line inputs into a sorted list of pdf paths
+    :param inputs: files, directories or glob patterns
+    :return: list of pdf paths, without duplicates
+    """
+    paths = []
+    for item in inputs:
+        if os.path.isdir(item):
+            matches = glob.glob(os.path.join(item, "*.pdf"))
+        elif glob.has_magic(item):
+            matches = glob.glob(item)
+        else:
+            matches = [item]
+        paths.extend(sorted(path for path in matches if path.lower().endswith(".pdf")))
+
+    seen = set()
+    return [path for path in paths if not (path in seen or seen.add(path))]
+
+
+def pair_odd_even(paths, rule="sequential", odd_suffix="_odd", even_suffix="_even"):
+    """
+    pair the odd pages files with the even pages files
+    :param paths: sorted list of pdf paths
+    :param rule: 'sequential' pairs consecutive files (odd first), 'suffix' matches
+                 <name><odd_suffix>.pdf with <name><even_suffix>.pdf
+    :param odd_suffix: suffix of the odd pages files for the 'suffix' rule
+    :param even_suffix: suffix of the even pages files for the 'suffix' rule
+    :return: (list of (odd, even) pairs, list of files left without a partner)
+    """
+    if rule == "sequential":
+        pairs = list(zip(paths[0::2], paths[1::2]))
+        unpaired = [paths[-1]] if len(paths) % 2 else []
+        return pairs, unpaired
+
+    if rule != "suffix":
+        raise ValueError(f"Unknown pairing rule: {rule}")
+
+    odd_files, even_files, unpaired = {}, {}, []
+    for path in paths:
+        stem = os.path.splitext(path)[0]
+        if stem.endswith(odd_suffix):
+            odd_files[stem[: -len(odd_suffix)]] = path
+        elif stem.endswith(even_suffix):
+            even_files[stem[: -len(even_suffix)]] = path
+        else:
+            unpaired.append(path)
+
+    pairs = []
+    for key in sorted(odd_files):
+        if key in even_files:
+            pairs.append((odd_files[key], even_files.pop(key)))
+        else:
+            unpaired.append(odd_files[key])
+    unpaired.extend(even_files.values())
+    return pairs, unpaired
+
+
+def run_job(job):
+    """
+    run one collation job, this is the function executed in the worker processes
+    :param job: dict with 'mode' ('organize', 'merge2', 'batches', 'split', 'merge',
+                'append' or 'index'),
+                'inputs' and the optional 'output_dir', 'output', 'custom_filename',
+                'streaming', 'deduplicate', 'metrics', 'cache_dir', 'cache_max_bytes', for
+                the collation modes 'remove_blank_backs' and 'blank_threshold', for the
+                batches mode 'odd_batches' and 'even_order', for the split mode 'separator'
+                and 'max_distance', and for the merge mode 'parallel', 'workers', 'fan_in'
+                and 'compare_serial'. 'optimize', 'image_dpi', 'image_quality' and
+                'linearize' apply to all modes but split and merge --parallel, 'verify' to
+                organize and merge2, 'index' (the page index database) to all modes but
+                split. the index mode only adds its input to the page index, the append
+                mode adds the pages of its inputs to the existing 'output'.
+    :return: the job summary as a dict, with the stage records under 'metrics' when asked,
+             'cache' ('hit' or 'miss') when a cache is used and the 'alignment' messages
+             when the alignment is verified, and the 'duplicates' found in the page index
+             when one is used. the output of the split mode is the list of the document
+             files.
+    """
+    summary = {
+        "job": job.get("job"),
+        "mode": job["mode"],
+        "inputs": job["inputs"],
+        "output": None,
+    }
+    started = time.perf_counter()
+    records = None
+    cache = None
+    if job.get("cache_dir") and job["mode"] in ("organize", "merge2"):
+        cache = ResultCache(
+            job["cache_dir"], job.get("cache_max_bytes", DEFAULT_CACHE_MB * 1024**2)
+        )
+    index = None
+    try:
+        # Keep stdout for the machine-readable summary
+        with contextlib.ExitStack() as stack:
+            stack.enter_context(contextlib.redirect_stdout(sys.stderr))
+            if job.get("metrics"):
+                records = stack.enter_context(capture_metrics())
+            if job.get("verify") and job["mode"] in ("organize", "merge2"):
+                alignment = verify_job_alignment(job)
+                if alignment is not None:
+                    summary["alignment"] = alignment
+            fingerprints = None
+            if job.get("index") and job["mode"] in INDEXED_MODES:
+                index = PageIndex(job["index"])
+                fingerprints = job_fingerprints(job)
+                if fingerprints is not None:
+                    summary["duplicates"] = find_duplicates(
+                        index, fingerprints, exclude=job["inputs"]
+                    )
+            if job["mode"] == "organize":
+                output = organize_scan_pdf(
+                    job["inputs"][0],
+                    custom_filename=job.get("custom_filename"),
+                    output_dir=job.get("output_dir"),
+                    streaming=job.get("streaming", False),
+                    deduplicate=job.get("deduplicate", False),
+                    cache=cache,
+                    remove_blank_backs=job.get("remove_blank_backs", False),
+                    blank_threshold=job.get("blank_threshold", BLANK_INK_THRESHOLD),
+                    **optimize_options(job),
+                    linearize=job.get("linearize", False),
+                )
+            elif job["mode"] == "merge2":
+                output = merge_2_pdfs_after_scan(
+                    job["inputs"][0],
+                    job["inputs"][1],
+                    custom_filename=job.get("custom_filename"),
+                    output_dir=job.get("output_dir"),
+                    streaming=job.get("streaming", False),
+                    deduplicate=job.get("deduplicate", False),
+                    cache=cache,
+                    remove_blank_backs=job.get("remove_blank_backs", False),
+                    blank_threshold=job.get("blank_threshold", BLANK_INK_THRESHOLD),
+                    **optimize_options(job),
+                    linearize=job.get("linearize", False),
+                )
+            elif job["mode"] == "batches":
+                odd_batches = job["odd_batches"]
+                output = merge_batches_after_scan(
+                    job["inputs"][:odd_batches],
+                    job["inputs"][odd_batches:],
+                    custom_filename=job.get("custom_filename"),
+                    output_dir=job.get("output_dir"),
+                    streaming=job.get("streaming", False),
+                    deduplicate=job.get("deduplicate", False),
+                    even_order=job.get("even_order", "stack"),
+                    remove_blank_backs=job.get("remove_blank_backs", False),
+                    blank_threshold=job.get("blank_threshold", BLANK_INK_THRESHOLD),
+                    **optimize_options(job),
+                    linearize=job.get("linearize", False),
+                )
+            elif job["mode"] == "split":
+                output = split_scan_pdf(
+                    job["inputs"][0],
+                    job["separator"],
+                    custom_filename=job.get("custom_filename"),
+                    output_dir=job.get("output_dir"),
+                    deduplicate=job.get("deduplicate", False),
+                    max_distance=job.get("max_distance", SEPARATOR_MAX_DISTANCE),
+                )
+            elif job["mode"] == "merge" and job.get("parallel"):
+                output = job["output"]
+                merge_pdfs_parallel(
+                    job["inputs"],
+                    output,
+                    workers=job.get("workers"),
+                    fan_in=job.get("fan_in", 8),
+                    work_dir=job.get("work_dir"),
+                )
+            elif job["mode"] == "merge":
+                output = job["output"]
+                merge_pdfs(
+                    job["inputs"],
+                    output,
+                    streaming=job.get("streaming", False),
+                    deduplicate=job.get("deduplicate", False),
+                    **optimize_options(job),
+                    linearize=job.get("linearize", False),
+                )
+            elif job["mode"] == "append":
+                output = job["output"]
+                append_pages(
+                    output,
+                    job["inputs"],
+                    deduplicate=job.get("deduplicate", False),
+                )
+            elif job["mode"] == "index":
+                output = job["inputs"][0]
+            else:
+                raise ValueError(f"Unknown mode: {job['mode']}")
+            if fingerprints is not None:
+                # The pages of the output are the pages of the inputs, already fingerprinted
+                index.add(output, fingerprints)
+        outputs = output if isinstance(output, list) else [output]
+        summary.update(
+            status="ok",
+            output=output,
+            pages=sum(get_total_pages(path) for path in outputs),
+            bytes=sum(os.path.getsize(path) for path in outputs),
+        )
+    except Exception as e:
+        summary.update(status="error", error=f"{type(e).__name__}: {e}")
+    finally:
+        if index is not None:
+            index.close()
+    summary["seconds"] = round(time.perf_counter() - started, 4)
+    if cache is not None and summary["status"] == "ok":
+        summary["cache"] = "hit" if cache.stats()["hits"] else "miss"
+    if records is not None:
+        # The records go back to the parent process, which owns the sinks
+        summary["metrics"] = records
+
+    if job.get("compare_serial") and summary["status"] == "ok":
+        summary.update(compare_with_serial_merge(job["inputs"], summary["seconds"]))
+    return summary
+
+
+def verify_job_alignment(job):
+    """
+    :param job: an organize or merge2 job, see run_job
+    :return: the messages of verify_scan_alignment, or None if numpy is not installed. the
+             check is only advice: when it fails, the message says so and the job goes on.
+    """
+    try:
+        issues = verify_scan_alignment(*job["inputs"][:2])
+    except ImportError:
+        return None
+    except Exception as e:
+        issues = [f"Could not check the page alignment: {type(e).__name__}: {e}"]
+    for issue in issues:
+        print(f"Alignment: {issue}")
+    return issues
+
+
+def job_fingerprints(job):
+    """
+    :param job: a job, see run_job
+    :return: the page hashes of the inputs of the job, in order, or None if numpy is not
+             installed
+    """
+    try:
+        return [
+            fingerprint
+            for path in job["inputs"]
+            for fingerprint in get_page_fingerprints(path)
+        ]
+    except ImportError:
+        return None
+
+
+def find_duplicates(index, fingerprints, exclude=()):
+    """
+    :param index: the PageIndex
+    :param fingerprints: the page hashes of a new scan
+    :param exclude: the paths that don't count, e.g. the inputs themselves
+    :return: the files of the index holding most of the pages, see PageIndex.lookup
+    """
+    duplicates = index.lookup(fingerprints, exclude=exclude)
+    for duplicate in duplicates:
+        print(
+            f"Possible duplicate: {duplicate['pages']} of the pages are already in "
+            f"{duplicate['path']}"
+        )
+    return duplicates
+
+
+def optimize_options(job):
+    """
+    :param job: a job, see run_job
+    :return: the keyword arguments of the optimization pass
+    """
+    return {
+        "optimize": job.get("optimize", False),
+        "image_dpi": job.get("image_dpi", OPTIMIZE_IMAGE_DPI),
+        "image_quality": job.get("image_quality", OPTIMIZE_IMAGE_QUALITY),
+    }
+
+
+def compare_with_serial_merge(input_paths, seconds):
+    """
+    time the serial merge_pdfs path on the same inputs, to report the parallel speedup
+    :param input_paths: the inputs of the merge
+    :param seconds: the wall time of the parallel merge
+    :return: dict with 'serial_seconds' and 'speedup'
+    """
+    with tempfile.TemporaryDirectory() as work_dir:
+        started = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stderr):
+            merge_pdfs(input_paths, os.path.join(work_dir, "serial.pdf"))
+        serial_seconds = time.perf_counter() - started
+    return {
+        "serial_seconds": round(serial_seconds, 4),
+        "speedup": round(serial_seconds / seconds, 2) if seconds else None,
+    }
+
+
+def build_jobs(args):
+    """
+    turn the parsed command line into a list of jobs
+    :param args: the argparse namespace
+    :return: (list of jobs, list of error summaries for inputs that can't become jobs)
+    """
+    paths = collect_pdf_paths(args.inputs)
+    jobs, errors = [], []
+
+    if args.mode == "organize":
+        jobs = [{"mode": "organize", "inputs": [path]} for path in paths]
+    elif args.mode == "merge2":
+        pairs, unpaired = pair_odd_even(
+            paths, args.pairing, args.odd_suffix, args.even_suffix
+        )
+        jobs = [{"mode": "merge2", "inputs": list(pair)} for pair in pairs]
+        errors = [
+            {
+                "job": None,
+                "mode": "merge2",
+                "inputs": [path],
+                "output": None,
+                "status": "error",
+                "error": "no matching odd/even file",
+                "seconds": 0.0,
+            }
+            for path in unpaired
+        ]
+    elif args.mode == "batches":
+        odd_batches = args.odd_batches
+        if odd_batches is None:
+            odd_batches = (len(paths) + 1) // 2
+        jobs = [
+            {
+                "mode": "batches",
+                "inputs": paths,
+                "odd_batches": odd_batches,
+                "even_order": args.even_order,
+            }
+        ]
+    elif args.mode == "split":
+        jobs = [
+            {
+                "mode": "split",
+                "inputs": [path],
+                "separator": args.separator,
+                "max_distance": args.max_distance,
+            }
+            for path in paths
+        ]
+    elif args.mode == "index":
+        jobs = [{"mode": "index", "inputs": [path]} for path in paths]
+    elif args.mode == "append":
+        jobs = [{"mode": "append", "inputs": paths, "output": args.output}]
+    elif args.mode == "merge":
+        jobs = [
+            {
+                "mode": "merge",
+                "inputs": paths,
+                "output": args.output,
+                "parallel": args.parallel,
+                "workers": args.workers,
+                "fan_in": args.fan_in,
+                "compare_serial": args.compare_serial,
+            }
+        ]
+
+    for job_id, job in enumerate(jobs, start=1):
+        job["job"] = job_id
+        job["output_dir"] = args.output_dir
+        job["streaming"] = args.streaming
+        job["deduplicate"] = args.deduplicate
+        job["metrics"] = bool(args.metrics_jsonl or args.metrics_prom)
+        job["cache_dir"] = args.cache_dir
+        job["cache_max_bytes"] = args.cache_size * 1024**2
+        job["remove_blank_backs"] = args.remove_blank
+        job["blank_threshold"] = args.blank_threshold
+        job["optimize"] = args.optimize
+        job["linearize"] = args.linearize
+        job["verify"] = args.verify
+        job["image_dpi"] = args.image_dpi
+        job["image_quality"] = args.image_quality
+        job["index"] = args.index
+    return jobs, errors
+
+
+def run_jobs(jobs, workers=None, journal=None):
+    """
+    spread the jobs across a process pool and yield each summary as soon as it is ready.
+    only twice as many jobs as workers are submitted at a time, so an interrupted run only
+    leaves those unfinished.
+    :param jobs: list of jobs, see run_job
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param journal: a BatchJournal: the jobs it has as done are skipped, the partial outputs
+                    of the jobs it has as interrupted are removed, and the other jobs are
+                    recorded as started before they are submitted and as done or failed
+                    after
+    :return: generator of job summaries
+    """
+    entries = []  # (job, journal key)
+    for job in jobs:
+        key = None
+        if journal is not None:
+            try:
+                key = job_key(job)
+            except OSError as e:
+                # A missing or unreadable input fails its job, not the batch
+                yield {
+                    "job": job.get("job"),
+                    "mode": job["mode"],
+                    "inputs": job["inputs"],
+                    "output": None,
+                    "status": "error",
+                    "error": f"{type(e).__name__}: {e}",
+                    "seconds": 0.0,
+                }
+                continue
+            record = journal.finished(key)
+            if record is not None:
+                yield skipped_summary(job, record)
+                continue
+            started = journal.interrupted(key)
+            if started is not None:
+                for path in remove_partial_outputs(started):
+                    print(f"Removed the partial output {path}", file=sys.stderr)
+        entries.append((job, key))
+    if not entries:
+        return
+
+    def start(entry):
+        job, key = entry
+        if key is not None:
+            # The names are fixed first, so a later run removes only what this job wrote
+            job = plan_job_outputs(job)
+            journal.record(
+                key,
+                "started",
+                job=job.get("job"),
+                inputs=job["inputs"],
+                **job_partial_outputs(job),
+            )
+        return job
+
+    def finish(entry, summary):
+        key = entry[1]
+        if key is not None:
+            state = "done" if summary["status"] == "ok" else "failed"
+            output = summary["output"]
+            if output is not None:
+                # The next run may start from another folder
+                output = [os.path.abspath(path) for path in job_outputs(output)]
+            journal.record(key, state, job=summary["job"], output=output)
+        return summary
+
+    if workers == 1 or len(entries) == 1:
+        for entry in entries:
+            yield finish(entry, run_job(start(entry)))
+        return
+
+    workers = workers or os.cpu_count() or 1
+    queued = iter(entries)
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(run_job, start(entry)): entry
+            for entry in itertools.islice(queued, workers * 2)
+        }
+        while futures:
+            finished, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in finished:
+                entry = futures.pop(future)
+                yield finish(entry, future.result())
+                entry = next(queued, None)
+                if entry is not None:
+                    futures[executor.submit(run_job, start(entry))] = entry
+
+
+def skipped_summary(job, record):
+    """
+    :param job: a job an earlier run finished, see run_job
+    :param record: its 'done' record in the journal
+    :return: the summary printed instead of running it again
+    """
+    return {
+        "job": job.get("job"),
+        "mode": job["mode"],
+        "inputs": job["inputs"],
+        "output": record["output"] if job["mode"] == "split" else record["output"][0],
+        "status": "ok",
+        "journal": "skipped",
+    }
+
+
+def open_metrics_sinks(jsonl_path=None, prometheus_path=None):
+    """
+    :param jsonl_path: file receiving one JSON line per job, or None
+    :param prometheus_path: file rewritten with the Prometheus counters, or None
+    :return: list of metrics hooks
+    """
+    sinks = []
+    if jsonl_path:
+        sinks.append(JsonLinesSink(jsonl_path))
+    if prometheus_path:
+        sinks.append(PrometheusTextSink(prometheus_path))
+    return sinks
+
+
+def export_metrics(summary, sinks):
+    """
+    send the stage records of a job summary to the sinks, and keep only the stage timings
+    in the summary
+    :param summary: a summary returned by run_job
+    :param sinks: the hooks of open_metrics_sinks
+    """
+    records = summary.pop("metrics", None)
+    if not records:
+        return
+    for record in records:
+        for sink in sinks:
+            sink(record)
+    summary["stages"] = {
+        stage: round(seconds, 4) for stage, seconds in records[-1]["stages"].items()
+    }
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        description="Collate duplex scans without the GUI. "
+        "Prints one JSON summary line per job."
+    )
+    parser.add_argument(
+        "mode",
+        choices=("organize", "merge2", "batches", "split", "merge", "append", "index"),
+        help="organize: one file per scan, merge2: odd and even files, "
+        "batches: several odd batches then several even batches of one document, "
+        "split: one file per scan, cut into documents at the separator sheets, "
+        "merge: concatenate all inputs, "
+        "index: add files already collated to the page index",
+    )
+    parser.add_argument("inputs", nargs="+", help="pdf files, directories or globs")
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "-d",
+        "--output-dir",
+        default=None,
+        help="output folder (default: Documents/Duplex scan)",
+    )
+    parser.add_argument(
+        "-o",
+        "--output",
+        help="output file of the merge mode, or the pdf the append mode adds the input "
+        "pages to (required for both)",
+    )
+    parser.add_argument(
+        "--pairing",
+        choices=PAIRING_RULES,
+        default="sequential",
+        help="how merge2 pairs odd and even files (default: sequential)",
+    )
+    parser.add_argument(
+        "--odd-batches",
+        type=int,
+        default=None,
+        help="batches: how many of the inputs are odd side batches (default: half)",
+    )
+    parser.add_argument(
+        "--even-order",
+        choices=EVEN_BATCH_ORDERS,
+        default="stack",
+        help="batches: 'stack' if the whole stack was flipped at once, 'per_batch' if "
+        "each batch was flipped on its own (default: stack)",
+    )
+    parser.add_argument(
+        "--separator",
+        metavar="PDF",
+        help="split: a scan of the separator sheet (required for split)",
+    )
+    parser.add_argument(
+        "--max-distance",
+        type=int,
+        default=SEPARATOR_MAX_DISTANCE,
+        help=f"split: bits of the 64 bit page fingerprint that may differ from the "
+        f"separator (default: {SEPARATOR_MAX_DISTANCE})",
+    )
+    parser.add_argument("--odd-suffix", default="_odd")
+    parser.add_argument("--even-suffix", default="_even")
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="write pages as they are copied, for scans too large for memory",
+    )
+    parser.add_argument(
+        "--deduplicate",
+        action="store_true",
+        help="store identical images, fonts and profiles only once in the output",
+    )
+    parser.add_argument(
+        "--remove-blank",
+        action="store_true",
+        help="drop the back sides without ink (needs numpy, and Pillow for JPEG scans)",
+    )
+    parser.add_argument(
+        "--blank-threshold",
+        type=float,
+        default=BLANK_INK_THRESHOLD,
+        help=f"share of dark pixels below which a back side is blank "
+        f"(default: {BLANK_INK_THRESHOLD})",
+    )
+    parser.add_argument(
+        "--no-verify",
+        dest="verify",
+        action="store_false",
+        help="organize and merge2: don't check from the page images that the back sides "
+        "line up with the fronts",
+    )
+    parser.add_argument(
+        "--optimize",
+        action="store_true",
+        help="compress the content streams and downsample the images finer than "
+        "--image-dpi to JPEG (Pillow needed for the images)",
+    )
+    parser.add_argument(
+        "--image-dpi",
+        type=int,
+        default=OPTIMIZE_IMAGE_DPI,
+        help=f"--optimize: target resolution of the images (default: {OPTIMIZE_IMAGE_DPI})",
+    )
+    parser.add_argument(
+        "--image-quality",
+        type=int,
+        default=OPTIMIZE_IMAGE_QUALITY,
+        help=f"--optimize: JPEG quality of the re-encoded images "
+        f"(default: {OPTIMIZE_IMAGE_QUALITY})",
+    )
+    parser.add_argument(
+        "--linearize",
+        action="store_true",
+        help="write linearized (fast web view) pdfs, whose first page shows in a browser "
+        "before the whole file is downloaded",
+    )
+    parser.add_argument(
+        "--parallel",
+        action="store_true",
+        help="merge: combine the inputs with a reduction tree across the workers",
+    )
+    parser.add_argument(
+        "--fan-in",
+        type=int,
+        default=8,
+        help="merge --parallel: files combined by each node of the tree (default: 8)",
+    )
+    parser.add_argument(
+        "--compare-serial",
+        action="store_true",
+        help="merge --parallel: also time the serial merge and report the speedup",
+    )
+    parser.add_argument(
+        "--metrics-jsonl",
+        metavar="PATH",
+        help="append the time spent in each stage of every job to this JSON lines file",
+    )
+    parser.add_argument(
+        "--metrics-prom",
+        metavar="PATH",
+        help="write cumulative stage timings to this file in the Prometheus text format",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        help="reuse the output of identical organize and merge2 jobs kept in this folder",
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=DEFAULT_CACHE_MB,
+        help=f"size of the cache in MB, the oldest entries are evicted "
+        f"(default: {DEFAULT_CACHE_MB})",
+    )
+    parser.add_argument(
+        "--index",
+        metavar="DB",
+        help="page index: report the files that already hold the pages of each job, "
+        "then add the output (required for index)",
+    )
+    parser.add_argument(
+        "--journal",
+        metavar="PATH",
+        help="record the state of every job in this file: run the same command again "
+        "after a crash to skip the finished jobs and clean up the unfinished ones",
+    )
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.mode in ("merge", "append") and not args.output:
+        parser.error(f"the {args.mode} mode requires --output")
+    if args.mode == "split" and not args.separator:
+        parser.error("the split mode requires --separator")
+    if args.mode == "index" and not args.index:
+        parser.error("the index mode requires --index")
+
+    jobs, errors = build_jobs(args)
+    sinks = open_metrics_sinks(args.metrics_jsonl, args.metrics_prom)
+    failed = len(errors)
+    for summary in errors:
+        print(json.dumps(summary), flush=True)
+
+    journal = None
+    if args.journal:
+        journal = BatchJournal(args.journal)
+
+    cache_results = {"hit": 0, "miss": 0}
+    skipped = 0
+    try:
+        for summary in run_jobs(jobs, args.workers, journal):
+            failed += summary["status"] != "ok"
+            skipped += summary.get("journal") == "skipped"
+            if "cache" in summary:
+                cache_results[summary["cache"]] += 1
+            export_metrics(summary, sinks)
+            print(json.dumps(summary), flush=True)
+    finally:
+        if journal is not None:
+            journal.close()
+
+    if journal is not None:
+        print(
+            f"Journal: {skipped} jobs finished by an earlier run were skipped",
+            file=sys.stderr,
+        )
+
+    if args.cache_dir:
+        print(
+            f"Cache: {cache_results['hit']} hits, {cache_results['miss']} misses",
+            file=sys.stderr,
+        )
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
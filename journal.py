@@ -0,0 +1,189 @@
+import glob
+import hashlib
+import json
+import os
+import secrets
+import shutil
+import threading
+import time
+
+from scan_tools import (
+    MERGE_WORK_DIR_PREFIX,
+    PARTIAL_SUFFIX,
+    default_output_dir,
+    generate_output_path,
+    unique_name_suffix,
+)
+
+# The job entries that don't change what a job writes
+_VOLATILE_KEYS = ("job", "metrics", "workers", "compare_serial", "work_dir")
+
+
+def job_key(job):
+    """
+    identify a job across runs by its mode, its options and its inputs. an input is
+    identified by its path, size and modification time, so an input replaced since the job
+    ran makes it a new job.
+    :param job: a job, see cli.run_job
+    :return: the key as a hex string
+    """
+    inputs = []
+    for path in job["inputs"]:
+        stat = os.stat(path)
+        inputs.append([os.path.abspath(path), stat.st_size, stat.st_mtime_ns])
+    description = {
+        key: value
+        for key, value in job.items()
+        if key not in _VOLATILE_KEYS and key != "inputs"
+    }
+    description["inputs"] = inputs
+    return hashlib.sha256(
+        json.dumps(description, sort_keys=True, default=str).encode()
+    ).hexdigest()
+
+
+def job_outputs(output):
+    """
+    :param output: the output of a job summary, a path or a list of paths (split mode)
+    :return: list of paths
+    """
+    if output is None:
+        return []
+    return output if isinstance(output, list) else [output]
+
+
+def plan_job_outputs(job):
+    """
+    fix the names a job writes before it is started, so the journal can record them: the
+    generated output name becomes the custom_filename of the job, and a parallel merge gets
+    its work folder
+    :param job: a job, see cli.run_job
+    :return: a copy of the job with 'custom_filename' or 'work_dir' set where needed
+    """
+    job = dict(job)
+    if job["mode"] in ("organize", "merge2", "batches") and not job.get(
+        "custom_filename"
+    ):
+        output = generate_output_path(
+            job["inputs"][0], output_dir=job.get("output_dir")
+        )
+        job["custom_filename"] = os.path.splitext(os.path.basename(output))[0]
+    elif job["mode"] == "split" and not job.get("custom_filename"):
+        base_filename = os.path.splitext(os.path.basename(job["inputs"][0]))[0]
+        job["custom_filename"] = f"{base_filename}_split_{unique_name_suffix()}"
+    elif job["mode"] == "merge" and job.get("parallel") and not job.get("work_dir"):
+        job["work_dir"] = os.path.join(
+            os.path.dirname(os.path.abspath(job["output"])),
+            MERGE_WORK_DIR_PREFIX + secrets.token_hex(6),
+        )
+    return job
+
+
+def job_partial_outputs(job):
+    """
+    :param job: a job planned by plan_job_outputs
+    :return: dict with 'partials', the glob patterns of the partial files of atomic_output
+             the job may leave behind, and 'work_dir', the work folder of a parallel merge
+    """
+    partials = []
+    if job["mode"] == "merge":
+        partials.append(glob.escape(os.path.abspath(job["output"])) + PARTIAL_SUFFIX)
+    elif job["mode"] in ("organize", "merge2", "batches", "split"):
+        folder = job.get("output_dir") or default_output_dir()
+        name = glob.escape(
+            os.path.abspath(os.path.join(folder, job["custom_filename"]))
+        )
+        # The documents of a split are numbered after the name
+        suffix = "_[0-9]*.pdf" if job["mode"] == "split" else ".pdf"
+        partials.append(name + suffix + PARTIAL_SUFFIX)
+    # The append mode undoes itself (see scan_tools.rollback_append), index writes nothing
+    return {"partials": partials, "work_dir": job.get("work_dir")}
+
+
+def remove_partial_outputs(record):
+    """
+    remove what a job interrupted by a crash left next to its output, as recorded when it
+    was started: its partial files and the work folder of a parallel merge. nothing else
+    is touched, other jobs may be writing to the same folder.
+    :param record: the 'started' record of the job in the journal
+    :return: list of the paths removed
+    """
+    removed = []
+    for pattern in record.get("partials") or []:
+        for path in glob.glob(pattern):
+            os.remove(path)
+            removed.append(path)
+    work_dir = record.get("work_dir")
+    if work_dir and os.path.isdir(work_dir):
+        shutil.rmtree(work_dir, ignore_errors=True)
+        removed.append(work_dir)
+    return removed
+
+
+class BatchJournal:
+    """
+    write-ahead journal of a batch run, one JSON line per state change of a job: 'started'
+    is written before the job is submitted, 'done' or 'failed' once its summary is back.
+    every line is flushed to the disk before going on, so after a crash or a reboot the
+    journal tells which jobs finished and which were in flight. a line torn by the crash is
+    ignored.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: the journal file, created if needed and appended to otherwise
+        """
+        self.path = path
+        self.lock = threading.Lock()
+        self.states = {}  # job key -> last record
+        line = "\n"
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as journal_file:
+                for line in journal_file:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    self.states[record["key"]] = record
+        self.journal_file = open(path, "a", encoding="utf-8")
+        if not line.endswith("\n"):
+            # Don't append to the line torn by the crash
+            self.journal_file.write("\n")
+
+    def record(self, key, state, **fields):
+        """
+        append a state change and flush it to the disk
+        :param key: the job_key of the job
+        :param state: 'started', 'done' or 'failed'
+        :param fields: more entries of the record, e.g. the output
+        """
+        record = dict(fields, key=key, state=state, time=round(time.time(), 3))
+        with self.lock:
+            self.journal_file.write(json.dumps(record) + "\n")
+            self.journal_file.flush()
+            os.fsync(self.journal_file.fileno())
+            self.states[key] = record
+
+    def finished(self, key):
+        """
+        :return: the 'done' record of a job whose outputs are all still there, or None
+        """
+        record = self.states.get(key)
+        if record is None or record["state"] != "done":
+            return None
+        outputs = job_outputs(record.get("output"))
+        if not outputs or not all(os.path.exists(path) for path in outputs):
+            return None
+        return record
+
+    def interrupted(self, key):
+        """
+        :return: the 'started' record of a job an earlier run never finished, or None
+        """
+        record = self.states.get(key)
+        if record is None or record["state"] != "started":
+            return None
+        return record
+
+    def close(self):
+        self.journal_file.close()
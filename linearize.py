@@ -0,0 +1,700 @@
+import re
+import zlib
+from io import BytesIO
+
+from PyPDF2 import PdfReader
+from PyPDF2.generic import ArrayObject, DictionaryObject, IndirectObject, StreamObject
+
+from stream_writer import PDF_HEADER
+
+# The linearization dictionary is the first object, its numbers are written with a fixed
+# width so the layout can be computed before the offsets are known
+_LINEARIZATION_DICT = (
+    b"<< /Linearized 1 /L %010d /H [ %010d %010d ] /O %d /E %010d /N %d /T %010d >>"
+)
+_FIRST_TRAILER = (
+    b"trailer\n<< /Size %d /Root %d 0 R%s /Prev %010d >>\nstartxref\n0\n%%%%EOF\n"
+)
+_MAIN_TRAILER = b"trailer\n<< /Size %d >>\nstartxref\n%d\n%%%%EOF\n"
+_XREF_ENTRY_SIZE = 20
+
+_PAGE_TREE_TYPES = ("/Page", "/Pages")
+
+# The entries of the catalog a viewer needs before showing the first page, the rest of
+# the document level objects (outlines, names, metadata) go to the end of the file
+_DOCUMENT_KEYS = (
+    "/ViewerPreferences",
+    "/PageMode",
+    "/Threads",
+    "/OpenAction",
+    "/AcroForm",
+)
+
+_LINEARIZED_RE = re.compile(
+    rb"(\d+) 0 obj\s*<<\s*/Linearized\s+1(.*?)>>\s*endobj", re.S
+)
+_PARAMETER_RES = {
+    name: re.compile(rb"/" + name.encode() + rb"\s+(\d+)") for name in "LOENT"
+}
+_HINT_RE = re.compile(rb"/H\s*\[\s*(\d+)\s+(\d+)")
+_XREF_RE = re.compile(rb"\s*xref\s+(\d+) (\d+)\s*?\n")
+_XREF_ENTRY_RE = re.compile(rb"(\d{10}) (\d{5}) ([nf])[ \r]?\n")
+_PREV_RE = re.compile(rb"/Prev\s+(\d+)")
+_HINT_STREAM_RE = re.compile(rb"(\d+) 0 obj\s*<<(.*?)>>\s*stream\r?\n", re.S)
+
+
+class _BitWriter:
+    """pack the integers of a hint table, most significant bit first"""
+
+    def __init__(self):
+        self.output = bytearray()
+        self.value = 0
+        self.bits = 0
+
+    def write(self, value, bits):
+        if value >> bits if bits else value:
+            raise ValueError(f"{value} doesn't fit in {bits} bits")
+        self.value = (self.value << bits) | value
+        self.bits += bits
+        while self.bits >= 8:
+            self.bits -= 8
+            self.output.append((self.value >> self.bits) & 0xFF)
+        self.value &= (1 << self.bits) - 1
+
+    def flush(self):
+        # Every item of a hint table starts on a byte boundary
+        if self.bits:
+            self.write(0, 8 - self.bits)
+
+
+class _BitReader:
+    def __init__(self, data):
+        self.data = data
+        self.position = 0  # in bits
+
+    def read(self, bits):
+        value = 0
+        for _ in range(bits):
+            byte = self.data[self.position >> 3]
+            value = (value << 1) | ((byte >> (7 - (self.position & 7))) & 1)
+            self.position += 1
+        return value
+
+    def flush(self):
+        self.position = (self.position + 7) & ~7
+
+
+def _references(value):
+    """
+    yield the indirect references held by a value, its direct dictionaries and arrays
+    included
+    """
+    pending = [value]
+    while pending:
+        value = pending.pop()
+        if isinstance(value, IndirectObject):
+            yield value
+        elif isinstance(value, dict):
+            pending.extend(reversed(list(dict.values(value))))
+        elif isinstance(value, ArrayObject):
+            pending.extend(reversed(value))
+
+
+def _reachable(reader, value, skip):
+    """
+    list the objects a value leads to, without going through the page tree
+    :param reader: the PdfReader of the value
+    :param value: a direct value
+    :param skip: set of (idnum, generation) not to follow, it receives the objects found
+    :return: list of (idnum, generation) in the order they were found
+    """
+    found = []
+    pending = [value]
+    while pending:
+        for reference in _references(pending.pop()):
+            key = (reference.idnum, reference.generation)
+            if key in skip:
+                continue
+            skip.add(key)
+            obj = reference.get_object()
+            if isinstance(obj, DictionaryObject) and (
+                obj.get("/Type") in _PAGE_TREE_TYPES or "/Kids" in obj
+            ):
+                continue
+            found.append(key)
+            pending.append(obj)
+            if isinstance(obj, StreamObject):
+                # The stream data is read again when the object is written
+                reader.resolved_objects.pop(
+                    (reference.generation, reference.idnum), None
+                )
+    return found
+
+
+class _Layout:
+    """
+    the objects of the linearized file in file order, with their new numbers. the pages after
+    the first come first in the numbering and the first page section last, as the
+    linearization format wants the object numbers of each part to be consecutive.
+    """
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.pages = list(reader.pages)
+        if not self.pages:
+            raise ValueError("a pdf without pages can't be linearized")
+        page_keys = [
+            (page.indirect_reference.idnum, page.indirect_reference.generation)
+            for page in self.pages
+        ]
+        root = reader.trailer.raw_get("/Root")
+        info = reader.trailer.raw_get("/Info") if "/Info" in reader.trailer else None
+        tree_keys = set(page_keys) | {(root.idnum, root.generation)}
+
+        # The objects each page needs, and the pages using each object
+        page_objects = []
+        users = {}
+        for index, page in enumerate(self.pages):
+            content = {key: value for key, value in page.items() if key != "/Parent"}
+            keys = _reachable(reader, content, set(tree_keys))
+            page_objects.append(keys)
+            for key in keys:
+                users.setdefault(key, set()).add(index)
+        self.shared_keys = {key for key, pages in users.items() if len(pages) > 1}
+
+        seen = tree_keys | set(users)
+        catalog = root.get_object()
+        document_keys = _reachable(
+            reader,
+            {key: value for key, value in catalog.items() if key in _DOCUMENT_KEYS},
+            seen,
+        )
+        outline_keys = (
+            _reachable(reader, ArrayObject([catalog.raw_get("/Outlines")]), seen)
+            if "/Outlines" in catalog
+            else []
+        )
+        other_keys = _reachable(
+            reader,
+            ArrayObject(
+                [
+                    value
+                    for key, value in catalog.items()
+                    if key not in _DOCUMENT_KEYS + ("/Pages", "/Outlines")
+                ]
+                + ([info] if info else [])
+            ),
+            seen,
+        )
+
+        # Main section: the pages after the first, each followed by its own objects, then
+        # the objects shared by several of them, then the page tree, the outlines and the
+        # other objects of the catalog, and the document info
+        self.numbers = {}  # (idnum, generation) -> new object number
+        self.sources = {}  # new object number -> page index or (idnum, generation)
+        self.next_number = 1
+        self.page_numbers = [None] * len(self.pages)
+        self.page_parts = [None] * len(self.pages)  # the numbers of each page's objects
+        for index in range(1, len(self.pages)):
+            self.page_parts[index] = self.add_page(index, page_keys[index])
+            for key in page_objects[index]:
+                if users[key] == {index}:
+                    self.page_parts[index].append(self.add(key))
+        self.shared_part = [
+            self.add(key)
+            for index in range(1, len(self.pages))
+            for key in page_objects[index]
+            if key in self.shared_keys
+            and 0 not in users[key]
+            and key not in self.numbers
+        ]
+        self.pages_number = self.allocate("pages")
+        self.outline_part = [self.add(key) for key in outline_keys]
+        for key in other_keys:
+            self.add(key)
+        self.info_number = (
+            self.numbers.get((info.idnum, info.generation)) if info else None
+        )
+        self.main_size = self.next_number
+
+        # First page section: the linearization dictionary, the catalog and the document
+        # level objects, the hint stream, then the first page and everything it uses
+        self.linearization_number = self.allocate("linearization")
+        self.catalog_number = self.add((root.idnum, root.generation))
+        for key in document_keys:
+            self.add(key)
+        self.hint_number = self.allocate("hint")
+        self.page_parts[0] = self.add_page(0, page_keys[0])
+        self.page_parts[0] += [self.add(key) for key in page_objects[0]]
+        self.size = self.next_number
+
+        # The shared objects each page refers to, as indexes in the shared object hint table.
+        # the first page lists none, all its objects are in the first page section.
+        first_page_index = {
+            number: position for position, number in enumerate(self.page_parts[0])
+        }
+        shared_index = {
+            number: len(self.page_parts[0]) + position
+            for position, number in enumerate(self.shared_part)
+        }
+        shared_index.update(first_page_index)
+        self.page_shared = [[]] + [
+            [
+                shared_index[self.numbers[key]]
+                for key in page_objects[index]
+                if key in self.shared_keys
+            ]
+            for index in range(1, len(self.pages))
+        ]
+
+    def allocate(self, source):
+        number = self.next_number
+        self.next_number += 1
+        self.sources[number] = source
+        return number
+
+    def add(self, key):
+        self.numbers[key] = self.allocate(key)
+        return self.numbers[key]
+
+    def add_page(self, index, key):
+        self.numbers[key] = self.page_numbers[index] = self.allocate(index)
+        return [self.numbers[key]]
+
+    def file_order(self):
+        """
+        :return: list of the object numbers after the first cross-reference section, in
+                 file order
+        """
+        return list(range(self.linearization_number + 1, self.size)) + list(
+            range(1, self.main_size)
+        )
+
+    def serialize_object(self, number):
+        """
+        :return: (bytes of the object, stream data or None) of a copied object
+        """
+        source = self.sources[number]
+        body = BytesIO()
+        if source == "pages":
+            kids = b" ".join(b"%d 0 R" % kid for kid in self.page_numbers)
+            body.write(
+                b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.pages))
+            )
+            return body.getvalue(), None
+        if isinstance(source, int):
+            # The inherited attributes were copied into the page by the reader
+            body.write(b"<<\n/Parent %d 0 R\n" % self.pages_number)
+            self.serialize_items(self.pages[source], body, skip=("/Parent",))
+            body.write(b">>")
+            return body.getvalue(), None
+
+        obj = self.reader.get_object(IndirectObject(source[0], source[1], self.reader))
+        if number == self.catalog_number:
+            body.write(b"<<\n/Pages %d 0 R\n" % self.pages_number)
+            self.serialize_items(obj, body, skip=("/Pages",))
+            body.write(b">>")
+            return body.getvalue(), None
+        if not isinstance(obj, StreamObject):
+            self.serialize(obj, body)
+            return body.getvalue(), None
+
+        data = obj._data
+        self.reader.resolved_objects.pop((source[1], source[0]), None)
+        body.write(b"<<\n")
+        self.serialize_items(obj, body, skip=("/Length",))
+        body.write(b"/Length %d\n>>" % len(data))
+        return body.getvalue(), data
+
+    def serialize_items(self, dictionary, body, skip=()):
+        for key, value in dict.items(dictionary):
+            if key in skip:
+                continue
+            key.write_to_stream(body, None)
+            body.write(b" ")
+            self.serialize(value, body)
+            body.write(b"\n")
+
+    def serialize(self, value, body):
+        """
+        write a direct value, with the indirect references renumbered
+        """
+        if isinstance(value, IndirectObject):
+            number = self.numbers.get((value.idnum, value.generation))
+            obj = value.get_object() if number is None else None
+            if isinstance(obj, DictionaryObject) and "/Kids" in obj:
+                # All the page tree nodes are replaced by a single one
+                number = self.pages_number
+            body.write(b"null" if number is None else b"%d 0 R" % number)
+        elif isinstance(value, StreamObject):
+            raise ValueError("a stream can't be a direct object")
+        elif isinstance(value, DictionaryObject):
+            body.write(b"<<\n")
+            self.serialize_items(value, body)
+            body.write(b">>")
+        elif isinstance(value, ArrayObject):
+            body.write(b"[")
+            for item in value:
+                body.write(b" ")
+                self.serialize(item, body)
+            body.write(b" ]")
+        else:
+            value.write_to_stream(body, None)
+
+
+def _object_bytes(number, data, stream_data=None):
+    if stream_data is None:
+        return [b"%d 0 obj\n" % number, data, b"\nendobj\n"]
+    return [
+        b"%d 0 obj\n" % number,
+        data,
+        b"\nstream\n",
+        stream_data,
+        b"\nendstream\nendobj\n",
+    ]
+
+
+def _bits(value):
+    return value.bit_length()
+
+
+def _hint_stream_data(layout, lengths, offsets):
+    """
+    build the page offset, shared object and outline hint tables (ISO 32000 annex F.4)
+    :param layout: the _Layout of the file
+    :param lengths: new object number -> length in bytes
+    :param offsets: new object number -> offset as if the hint stream was not there, as
+                    the format wants, may be zeros when measuring
+    :return: (stream data, offset of the shared object hint table in it, offset of the
+             outline hint table or None)
+    """
+    object_counts = [len(part) for part in layout.page_parts]
+    page_lengths = [
+        sum(lengths[number] for number in part) for part in layout.page_parts
+    ]
+    shared_counts = [len(shared) for shared in layout.page_shared]
+    identifiers = [identifier for shared in layout.page_shared for identifier in shared]
+    least_objects = min(object_counts)
+    least_length = min(page_lengths)
+    length_bits = _bits(max(page_lengths) - least_length)
+
+    writer = _BitWriter()
+    writer.write(least_objects, 32)
+    writer.write(offsets[layout.page_numbers[0]], 32)
+    writer.write(_bits(max(object_counts) - least_objects), 16)
+    writer.write(least_length, 32)
+    writer.write(length_bits, 16)
+    # The content stream of a page is described as the whole page, like most linearizers
+    writer.write(0, 32)
+    writer.write(0, 16)
+    writer.write(least_length, 32)
+    writer.write(length_bits, 16)
+    writer.write(_bits(max(shared_counts)), 16)
+    writer.write(_bits(max(identifiers, default=0)), 16)
+    writer.write(0, 16)
+    writer.write(1, 16)
+    for values, least, bits in (
+        (object_counts, least_objects, _bits(max(object_counts) - least_objects)),
+        (page_lengths, least_length, length_bits),
+        (shared_counts, 0, _bits(max(shared_counts))),
+        (identifiers, 0, _bits(max(identifiers, default=0))),
+        ([], 0, 0),  # numerators of the shared references
+        ([0] * len(page_lengths), 0, 0),  # content stream offsets
+        (page_lengths, least_length, length_bits),  # content stream lengths
+    ):
+        for value in values:
+            writer.write(value - least, bits)
+        writer.flush()
+    shared_offset = len(writer.output)
+
+    # One group per object: the first page's objects, then the shared objects section
+    group_lengths = [
+        lengths[number] for number in layout.page_parts[0] + layout.shared_part
+    ]
+    least_group = min(group_lengths)
+    group_bits = _bits(max(group_lengths) - least_group)
+    first_shared = layout.shared_part[0] if layout.shared_part else None
+    writer.write(first_shared or 0, 32)
+    writer.write(offsets[first_shared] if first_shared else 0, 32)
+    writer.write(len(layout.page_parts[0]), 32)
+    writer.write(len(group_lengths), 32)
+    writer.write(0, 16)
+    writer.write(least_group, 32)
+    writer.write(group_bits, 16)
+    for length in group_lengths:
+        writer.write(length - least_group, group_bits)
+    writer.flush()
+    for _ in group_lengths:
+        writer.write(0, 1)  # no MD5 signature
+    writer.flush()
+    if not layout.outline_part:
+        return bytes(writer.output), shared_offset, None
+
+    # The outlines are a single group of objects
+    outline_offset = len(writer.output)
+    writer.write(layout.outline_part[0], 32)
+    writer.write(offsets[layout.outline_part[0]], 32)
+    writer.write(len(layout.outline_part), 32)
+    writer.write(sum(lengths[number] for number in layout.outline_part), 32)
+    return bytes(writer.output), shared_offset, outline_offset
+
+
+def _hint_object(layout, lengths, offsets):
+    data, shared_offset, outline_offset = _hint_stream_data(layout, lengths, offsets)
+    if outline_offset is None:
+        header = b"<< /S %d /Length %d >>" % (shared_offset, len(data))
+    else:
+        header = b"<< /S %d /O %d /Length %d >>" % (
+            shared_offset,
+            outline_offset,
+            len(data),
+        )
+    return _object_bytes(layout.hint_number, header, data)
+
+
+def write_linearized(reader, output_file):
+    """
+    write the pages of a pdf as a linearized ("fast web view") pdf: the first page and all it
+    needs come first, behind a cross-reference section of their own and the hint tables
+    locating the other pages, so a viewer fetching the file over HTTP shows page one after
+    the first few kilobytes. the objects are serialized twice, once to measure them and once
+    to write them, and stream data is copied as is.
+    :param reader: an open PdfReader, not encrypted
+    :param output_file: a binary file object opened for writing
+    :return: the number of pages written
+    """
+    if reader.is_encrypted:
+        raise ValueError("encrypted pdfs can't be linearized")
+    layout = _Layout(reader)
+    order = layout.file_order()
+
+    lengths = {}
+    for number in order:
+        if number == layout.hint_number:
+            continue
+        lengths[number] = sum(
+            len(part)
+            for part in _object_bytes(number, *layout.serialize_object(number))
+        )
+    # The hint tables hold no offset in their variable width fields, so their size doesn't
+    # depend on the layout
+    zeros = dict.fromkeys(order, 0)
+    lengths[layout.hint_number] = sum(
+        len(part) for part in _hint_object(layout, lengths, zeros)
+    )
+
+    def linearization_object(file_length, hint_offset, end_of_first_page, main_xref):
+        linearization = _LINEARIZATION_DICT % (
+            file_length,
+            hint_offset,
+            lengths[layout.hint_number],
+            layout.page_numbers[0],
+            end_of_first_page,
+            len(layout.pages),
+            main_xref,
+        )
+        return _object_bytes(layout.linearization_number, linearization)
+
+    first_count = layout.size - layout.linearization_number
+    info = b" /Info %d 0 R" % layout.info_number if layout.info_number else b""
+    first_xref_offset = len(PDF_HEADER) + sum(
+        len(part) for part in linearization_object(0, 0, 0, 0)
+    )
+    first_xref_length = (
+        len(b"xref\n%d %d\n" % (layout.linearization_number, first_count))
+        + _XREF_ENTRY_SIZE * first_count
+        + len(_FIRST_TRAILER % (layout.size, layout.catalog_number, info, 0))
+    )
+
+    offsets = {layout.linearization_number: len(PDF_HEADER)}
+    position = first_xref_offset + first_xref_length
+    for number in order:
+        offsets[number] = position
+        position += lengths[number]
+        if number == layout.page_parts[0][-1]:
+            end_of_first_page = position
+    main_xref_offset = position
+    # The hint tables locate the objects as if the hint stream was not there
+    table_offsets = {
+        number: (
+            offset - lengths[layout.hint_number]
+            if offset > offsets[layout.hint_number]
+            else offset
+        )
+        for number, offset in offsets.items()
+    }
+    main_xref_header = b"xref\n0 %d" % layout.main_size
+    file_length = (
+        main_xref_offset
+        + len(main_xref_header)
+        + 1
+        + _XREF_ENTRY_SIZE * layout.main_size
+        + len(_MAIN_TRAILER % (layout.main_size, first_xref_offset))
+    )
+
+    def write(parts):
+        for part in parts:
+            output_file.write(part)
+
+    write([PDF_HEADER])
+    write(
+        linearization_object(
+            file_length,
+            offsets[layout.hint_number],
+            end_of_first_page,
+            main_xref_offset + len(main_xref_header),
+        )
+    )
+    write([b"xref\n%d %d\n" % (layout.linearization_number, first_count)])
+    for number in range(layout.linearization_number, layout.size):
+        write([b"%010d 00000 n \n" % offsets[number]])
+    write(
+        [_FIRST_TRAILER % (layout.size, layout.catalog_number, info, main_xref_offset)]
+    )
+    for number in order:
+        if number == layout.hint_number:
+            parts = _hint_object(layout, lengths, table_offsets)
+        else:
+            parts = _object_bytes(number, *layout.serialize_object(number))
+        if sum(len(part) for part in parts) != lengths[number]:
+            raise RuntimeError(f"object {number} changed size between the two passes")
+        write(parts)
+    write([main_xref_header, b"\n0000000000 65535 f \n"])
+    for number in range(1, layout.main_size):
+        write([b"%010d 00000 n \n" % offsets[number]])
+    write([_MAIN_TRAILER % (layout.main_size, first_xref_offset)])
+    return len(layout.pages)
+
+
+def _read_xref(data, offset):
+    """
+    :return: (first object number, list of offsets, end of the section) of a classic
+             cross-reference section with a single subsection
+    """
+    header = _XREF_RE.match(data, offset)
+    if not header:
+        raise ValueError(f"no cross-reference section at {offset}")
+    first, count = int(header.group(1)), int(header.group(2))
+    offsets = []
+    position = header.end()
+    for _ in range(count):
+        entry = _XREF_ENTRY_RE.match(data, position)
+        if not entry:
+            raise ValueError(f"bad cross-reference entry at {position}")
+        offsets.append(int(entry.group(1)) if entry.group(3) == b"n" else None)
+        position = entry.end()
+    return first, offsets, position
+
+
+def check_linearization(pdf_path):
+    """
+    check the layout of a linearized pdf: the linearization dictionary against the file, the
+    first page section before /E, and the page offset hint table against the place of every
+    page and of its objects
+    :param pdf_path: the pdf to check
+    :return: list of the problems found, empty when the file is correctly linearized
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        data = pdf_file.read()
+    match = _LINEARIZED_RE.search(data, 0, 1024)
+    if not match:
+        return ["no linearization dictionary in the first 1024 bytes"]
+    parameters = {
+        name: int(regex.search(match.group(2)).group(1))
+        for name, regex in _PARAMETER_RES.items()
+        if regex.search(match.group(2))
+    }
+    hint = _HINT_RE.search(match.group(2))
+    missing = [name for name in "LOENT" if name not in parameters]
+    if missing or not hint:
+        return [f"the linearization dictionary lacks {missing or ['H']}"]
+    problems = []
+    if parameters["L"] != len(data):
+        problems.append(f"/L is {parameters['L']}, the file is {len(data)} bytes")
+
+    first_number, first_offsets, first_end = _read_xref(data, match.end())
+    prev = _PREV_RE.search(data, first_end, first_end + 256)
+    if not prev:
+        return problems + ["the first page trailer has no /Prev"]
+    main_xref_offset = int(prev.group(1))
+    _, main_offsets, _ = _read_xref(data, main_xref_offset)
+    if parameters["T"] != data.index(b"0000000000", main_xref_offset) - 1:
+        problems.append("/T doesn't point before the first main cross-reference entry")
+    offsets = dict(enumerate(main_offsets))
+    offsets.update(
+        (first_number + position, offset)
+        for position, offset in enumerate(first_offsets)
+    )
+
+    # Each section is written in object number order
+    for section_first, section in ((first_number, first_offsets), (0, main_offsets)):
+        placed = [offset for offset in section if offset is not None]
+        if placed != sorted(placed):
+            problems.append(
+                f"the objects from {section_first} are not in object number order"
+            )
+    late = [
+        first_number + position
+        for position, offset in enumerate(first_offsets)
+        if offset is not None and offset >= parameters["E"]
+    ]
+    if late:
+        problems.append(f"objects {late} of the first page section are after /E")
+
+    reader = PdfReader(BytesIO(data))
+    page_numbers = [page.indirect_reference.idnum for page in reader.pages]
+    if len(page_numbers) != parameters["N"]:
+        problems.append(f"/N is {parameters['N']}, the file has {len(page_numbers)}")
+    if page_numbers[0] != parameters["O"]:
+        problems.append(f"/O is {parameters['O']}, the first page is {page_numbers[0]}")
+
+    hint_offset, hint_length = int(hint.group(1)), int(hint.group(2))
+    hint_object = _HINT_STREAM_RE.match(data, hint_offset)
+    hint_end = hint_offset + hint_length
+    if not hint_object or data[hint_end - 7 : hint_end] != b"endobj\n":
+        return problems + ["/H doesn't point to the hint stream"]
+    hint_dictionary = hint_object.group(2)
+    stream_length = int(re.search(rb"/Length\s+(\d+)", hint_dictionary).group(1))
+    stream = data[hint_object.end() : hint_object.end() + stream_length]
+    if b"/FlateDecode" in hint_dictionary:
+        stream = zlib.decompress(stream)
+
+    bits = _BitReader(stream)
+    least_objects = bits.read(32)
+    first_page_offset = bits.read(32)
+    if first_page_offset >= hint_offset:
+        # The hint tables locate the objects as if the hint stream was not there
+        first_page_offset += hint_length
+    object_bits = bits.read(16)
+    least_length = bits.read(32)
+    length_bits = bits.read(16)
+    bits.read(32)
+    bits.read(16)
+    bits.read(32)
+    bits.read(16)
+    bits.read(16 * 4)
+    count = len(page_numbers)
+    object_counts = [least_objects + bits.read(object_bits) for _ in range(count)]
+    bits.flush()
+    page_lengths = [least_length + bits.read(length_bits) for _ in range(count)]
+
+    if first_page_offset != offsets.get(page_numbers[0]):
+        problems.append("the hint table doesn't locate the first page")
+    elif first_page_offset + page_lengths[0] != parameters["E"]:
+        problems.append("the first page doesn't end at /E")
+    # The other pages follow the first page section, each page object numbered and placed
+    # right after the objects of the page before it
+    number = 1
+    start = parameters["E"]
+    for index in range(1, count):
+        end = start + page_lengths[index]
+        if page_numbers[index] != number or offsets.get(number) != start:
+            problems.append(f"page {index + 1} is not where the hint table puts it")
+            break
+        numbers = range(number, number + object_counts[index])
+        if not all(start <= offsets.get(n, -1) < end for n in numbers):
+            problems.append(f"the objects of page {index + 1} are not with the page")
+            break
+        number += object_counts[index]
+        start = end
+    return problems
@@ -0,0 +1,249 @@
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+
+_hooks = []
+_current_job = contextvars.ContextVar("scan_tools_job", default=None)
+
+STAGES = (
+    "open",
+    "parse",
+    "page_plan",
+    "blank_check",
+    "fingerprint",
+    "optimize",
+    "add_page",
+    "serialize",
+    "fsync",
+    "cleanup",
+)
+
+
+def add_metrics_hook(hook):
+    """
+    register a callable that receives one dict per finished job, with the function name,
+    inputs, output, status, page count, total seconds and the seconds spent in each stage
+    :param hook: callable(record)
+    """
+    _hooks.append(hook)
+
+
+def remove_metrics_hook(hook):
+    if hook in _hooks:
+        _hooks.remove(hook)
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+class NullJobMetrics:
+    """
+    the recorder used when no hook is registered, every call is a no-op
+    """
+
+    def stage(self, name):
+        return _NULL_STAGE
+
+    def set(self, **fields):
+        pass
+
+
+_NULL_JOB = NullJobMetrics()
+
+
+class _Stage:
+    def __init__(self, job, name):
+        self.job = job
+        self.name = name
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc_info):
+        stages = self.job.record["stages"]
+        stages[self.name] = (
+            stages.get(self.name, 0.0) + time.perf_counter() - self.started
+        )
+        return False
+
+
+class JobMetrics:
+    """
+    collect the time spent in each stage of one job. a stage entered several times (add_page)
+    accumulates its time.
+    """
+
+    def __init__(self, function, **fields):
+        self.record = {
+            "function": function,
+            "timestamp": time.time(),
+            "status": "ok",
+            "stages": {},
+        }
+        self.record.update(fields)
+
+    def stage(self, name):
+        return _Stage(self, name)
+
+    def set(self, **fields):
+        self.record.update(fields)
+
+
+def current_metrics():
+    """
+    :return: the recorder of the job running in this thread, or a no-op recorder
+    """
+    return _current_job.get() or _NULL_JOB
+
+
+@contextlib.contextmanager
+def job_metrics(function, **fields):
+    """
+    record the stages of a job and send the record to the hooks when it ends. costs nothing
+    when no hook is registered. a job started inside another one is recorded as part of it.
+    :param function: the name of the scan_tools function
+    :param fields: extra fields of the record, e.g. inputs
+    :return: context manager giving the recorder
+    """
+    if not _hooks or _current_job.get() is not None:
+        yield current_metrics()
+        return
+
+    job = JobMetrics(function, **fields)
+    token = _current_job.set(job)
+    started = time.perf_counter()
+    try:
+        yield job
+    except BaseException:
+        # A cancelled job has already set its status
+        if job.record["status"] == "ok":
+            job.set(status="error")
+        raise
+    finally:
+        _current_job.reset(token)
+        job.set(seconds=time.perf_counter() - started)
+        for hook in list(_hooks):
+            hook(job.record)
+
+
+@contextlib.contextmanager
+def capture_metrics():
+    """
+    collect the records of the jobs run inside the with block
+    :return: context manager giving the list of records
+    """
+    records = []
+    add_metrics_hook(records.append)
+    try:
+        yield records
+    finally:
+        remove_metrics_hook(records.append)
+
+
+class JsonLinesSink:
+    """
+    metrics hook appending one JSON line per job to a file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def __call__(self, record):
+        line = json.dumps(record) + "\n"
+        with self.lock, open(self.path, "a") as metrics_file:
+            metrics_file.write(line)
+
+
+class PrometheusTextSink:
+    """
+    metrics hook keeping cumulative counters and rewriting them to a file in the Prometheus
+    text format, for the node_exporter textfile collector
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+        self.jobs = {}  # (function, status) -> count
+        self.job_seconds = {}  # function -> seconds
+        self.pages = {}  # function -> pages
+        self.stage_seconds = {}  # (function, stage) -> seconds
+        self.cache = {}  # (function, 'hit' or 'miss') -> count
+
+    def __call__(self, record):
+        function = record["function"]
+        with self.lock:
+            key = (function, record["status"])
+            self.jobs[key] = self.jobs.get(key, 0) + 1
+            self.job_seconds[function] = (
+                self.job_seconds.get(function, 0.0) + record["seconds"]
+            )
+            self.pages[function] = self.pages.get(function, 0) + record.get("pages", 0)
+            if "cache" in record:
+                key = (function, record["cache"])
+                self.cache[key] = self.cache.get(key, 0) + 1
+            for stage, seconds in record["stages"].items():
+                self.stage_seconds[(function, stage)] = (
+                    self.stage_seconds.get((function, stage), 0.0) + seconds
+                )
+            self.write()
+
+    def write(self):
+        lines = [
+            "# HELP scan_tools_jobs_total Jobs run by scan_tools.",
+            "# TYPE scan_tools_jobs_total counter",
+        ]
+        for (function, status), count in sorted(self.jobs.items()):
+            lines.append(
+                f'scan_tools_jobs_total{{function="{function}",status="{status}"}} {count}'
+            )
+        lines += [
+            "# HELP scan_tools_job_seconds_total Wall time of the jobs.",
+            "# TYPE scan_tools_job_seconds_total counter",
+        ]
+        for function, seconds in sorted(self.job_seconds.items()):
+            lines.append(
+                f'scan_tools_job_seconds_total{{function="{function}"}} {seconds:.6f}'
+            )
+        lines += [
+            "# HELP scan_tools_pages_total Pages written by the jobs.",
+            "# TYPE scan_tools_pages_total counter",
+        ]
+        for function, pages in sorted(self.pages.items()):
+            lines.append(f'scan_tools_pages_total{{function="{function}"}} {pages}')
+        lines += [
+            "# HELP scan_tools_stage_seconds_total Time spent in each stage of the jobs.",
+            "# TYPE scan_tools_stage_seconds_total counter",
+        ]
+        for (function, stage), seconds in sorted(self.stage_seconds.items()):
+            lines.append(
+                f'scan_tools_stage_seconds_total{{function="{function}",stage="{stage}"}}'
+                f" {seconds:.6f}"
+            )
+
+        lines += [
+            "# HELP scan_tools_cache_total Result cache lookups of the jobs.",
+            "# TYPE scan_tools_cache_total counter",
+        ]
+        for (function, result), count in sorted(self.cache.items()):
+            lines.append(
+                f'scan_tools_cache_total{{function="{function}",result="{result}"}} {count}'
+            )
+
+        # Replace the file at once so the collector never reads half of it
+        temporary_path = f"{self.path}.tmp"
+        with open(temporary_path, "w") as metrics_file:
+            metrics_file.write("\n".join(lines) + "\n")
+        os.replace(temporary_path, self.path)
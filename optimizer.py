@@ -0,0 +1,197 @@
+import zlib
+from io import BytesIO
+
+from PyPDF2.generic import ArrayObject, NameObject, NumberObject
+
+from page_images import (
+    collect_images,
+    decode_image_data,
+    describe_image,
+    page_resources,
+)
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Images are resampled only when they are finer than the target resolution by this factor
+DPI_TOLERANCE = 1.25
+
+# A new encoding replaces a stream only when it is at least this much smaller
+MIN_SAVING = 0.9
+
+# Images with these entries are more than their samples, they are only compressed losslessly
+_LOSSLESS_ONLY_KEYS = ("/SMask", "/Mask", "/Decode", "/ImageMask", "/SMaskInData")
+
+_MODES = {1: "L", 3: "RGB"}
+
+
+def _stream_key(stream):
+    """
+    identify a stream by its indirect reference: the streaming writer frees the page objects
+    after each page, so id() values are reused for other streams
+    :return: (id of the reader, object number, generation), or None for a direct object
+    """
+    reference = getattr(stream, "indirect_reference", None)
+    if reference is None:
+        return None
+    return id(reference.pdf), reference.idnum, reference.generation
+
+
+def extract_page_streams(page, seen):
+    """
+    collect the streams of a page worth optimizing: its content streams stored without a
+    filter and its images. this reads from the pdf, so it must run on the thread that owns
+    the reader.
+    :param page: a PageObject
+    :param seen: set of the keys of the streams already collected, shared by the pages of a
+                 job so a stream used on several pages is optimized once
+    :return: list of tasks for optimize_page_streams, or None if there is nothing to do
+    """
+    tasks = []
+    contents = page.get("/Contents")
+    if contents is not None:
+        contents = contents.get_object()
+        if not isinstance(contents, ArrayObject):
+            contents = [contents]
+        for stream in contents:
+            stream = stream.get_object()
+            key = _stream_key(stream)
+            if key in seen or stream.get("/Filter") is not None:
+                continue
+            if key is not None:
+                seen.add(key)
+            tasks.append({"stream": stream, "kind": "content", "data": stream._data})
+
+    images = []
+    collect_images(page_resources(page), images)
+    # Scans fill the page, so the largest side of the page gives the image resolution
+    page_inches = max(abs(page.mediabox.width), abs(page.mediabox.height)) / 72
+    for image in images:
+        key = _stream_key(image)
+        if key in seen:
+            continue
+        if key is not None:
+            seen.add(key)
+        task = describe_image(image)
+        task.update(
+            stream=image,
+            kind="image",
+            dpi=max(task["width"], task["height"]) / page_inches if page_inches else 0,
+            lossless_only=any(key in image for key in _LOSSLESS_ONLY_KEYS),
+        )
+        tasks.append(task)
+    return tasks or None
+
+
+def _open_picture(image, mode, size):
+    # Decode the samples of an 8 bit gray or RGB image with Pillow
+    if image["filter"] == "/DCTDecode":
+        picture = Image.open(BytesIO(image["data"]))
+        if picture.mode != mode:
+            # CMYK and other JPEG flavours are kept as they are
+            return None
+        # The JPEG decoder can skip the detail that is thrown away anyway
+        picture.draft(mode, size)
+        return picture
+
+    data = decode_image_data(image)
+    width, height = image["width"], image["height"]
+    if data is None or len(data) < width * height * len(mode):
+        return None
+    return Image.frombytes(mode, (width, height), data)
+
+
+def optimize_image(image, image_dpi, image_quality):
+    """
+    downsample an image finer than image_dpi and encode it as a JPEG. images with a mask,
+    a palette, bilevel images and the JPEG images already at the target resolution are at
+    most compressed losslessly.
+    :param image: an image task of extract_page_streams
+    :param image_dpi: the target resolution
+    :param image_quality: the JPEG quality, 1 to 95
+    :return: (new data, dict of the entries to set), or (None, None) to keep the image
+    """
+    scale = 1
+    if image["dpi"] > image_dpi * DPI_TOLERANCE:
+        scale = image_dpi / image["dpi"]
+    mode = _MODES.get(image["components"])
+    if (
+        Image is None
+        or mode is None
+        or image["bits"] != 8
+        or image["lossless_only"]
+        or image["filter"] not in (None, "/FlateDecode", "/LZWDecode", "/DCTDecode")
+        or (image["filter"] == "/DCTDecode" and scale == 1)
+    ):
+        if image["filter"] is None:
+            return zlib.compress(image["data"]), {"/Filter": "/FlateDecode"}
+        return None, None
+
+    size = (
+        max(1, round(image["width"] * scale)),
+        max(1, round(image["height"] * scale)),
+    )
+    try:
+        picture = _open_picture(image, mode, size)
+        if picture is None:
+            return None, None
+        if picture.size != size:
+            picture = picture.resize(size, Image.LANCZOS)
+        output = BytesIO()
+        picture.save(output, "JPEG", quality=image_quality, optimize=True)
+    except (OSError, ValueError):
+        return None, None
+    return output.getvalue(), {
+        "/Filter": "/DCTDecode",
+        "/Width": size[0],
+        "/Height": size[1],
+        "/BitsPerComponent": 8,
+    }
+
+
+def optimize_page_streams(tasks, image_dpi, image_quality):
+    """
+    recompress the streams collected by extract_page_streams, the function executed in the
+    worker threads: zlib and Pillow release the GIL while they work
+    :param tasks: list returned by extract_page_streams
+    :param image_dpi: the target resolution of the images
+    :param image_quality: the JPEG quality of the re-encoded images
+    :return: list of (task, new data, dict of the entries to set) for the streams that shrink
+    """
+    results = []
+    for task in tasks:
+        if task["kind"] == "content":
+            data, entries = zlib.compress(task["data"]), {"/Filter": "/FlateDecode"}
+        else:
+            data, entries = optimize_image(task, image_dpi, image_quality)
+        if data is not None and len(data) < len(task["data"]) * MIN_SAVING:
+            results.append((task, data, entries))
+    return results
+
+
+def apply_optimization(results, report):
+    """
+    replace the streams with their optimized version, on the thread that owns the reader and
+    before the page is handed to the writer
+    :param results: list returned by optimize_page_streams
+    :param report: dict receiving the 'streams', 'images', 'bytes_before' and 'bytes_after'
+                   counters
+    """
+    for task, data, entries in results:
+        stream = task["stream"]
+        stream._data = data
+        stream.decoded_self = None
+        # The new encoding doesn't take the parameters of the old one
+        stream.pop("/DecodeParms", None)
+        for key, value in entries.items():
+            if isinstance(value, str):
+                stream[NameObject(key)] = NameObject(value)
+            else:
+                stream[NameObject(key)] = NumberObject(value)
+
+        counter = "images" if task["kind"] == "image" else "streams"
+        report[counter] = report.get(counter, 0) + 1
+        report["bytes_before"] = report.get("bytes_before", 0) + len(task["data"])
+        report["bytes_after"] = report.get("bytes_after", 0) + len(data)
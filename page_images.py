@@ -0,0 +1,466 @@
+import zlib
+from io import BytesIO
+
+from PyPDF2.filters import CCITTFaxDecode, FlateDecode, LZWDecode
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# A pixel darker than this (0 is black, 255 is white) counts as ink
+DARK_LEVEL = 128
+
+# Share of the page kept out of the score on each side: edge shadows and punch holes
+MARGIN = 0.05
+
+_COMPONENTS = {
+    "/DeviceGray": 1,
+    "/CalGray": 1,
+    "/DeviceRGB": 3,
+    "/CalRGB": 3,
+    "/DeviceCMYK": 4,
+}
+_PILLOW_FILTERS = ("/DCTDecode", "/JPXDecode")
+
+
+def require_numpy():
+    """
+    :raise ImportError: if numpy, needed for the image analysis, is not installed
+    """
+    if numpy is None:
+        raise ImportError("page image analysis needs numpy: pip install numpy")
+
+
+def page_resources(page):
+    """
+    :param page: a PageObject
+    :return: the resources dictionary of the page, which can be inherited from the page tree
+    """
+    node = page
+    while node is not None:
+        resources = node.get("/Resources")
+        if resources is not None:
+            return resources.get_object()
+        node = node.get("/Parent")
+        node = node.get_object() if node is not None else None
+    return None
+
+
+def collect_images(resources, images, depth=0):
+    """
+    :param resources: a resources dictionary
+    :param images: list receiving the image XObjects, including those inside forms
+    """
+    xobjects = resources.get("/XObject") if resources is not None else None
+    if xobjects is None:
+        return
+    for reference in xobjects.get_object().values():
+        xobject = reference.get_object()
+        subtype = xobject.get("/Subtype")
+        if subtype == "/Image":
+            images.append(xobject)
+        elif subtype == "/Form" and depth < 2:
+            # Some scanners wrap the page image in a form
+            collect_images(xobject.get("/Resources"), images, depth + 1)
+
+
+def extract_page_image(page):
+    """
+    find the scan image of a page (its largest image) and read its encoded data. this reads
+    from the pdf, so it must run on the thread that owns the reader.
+    :param page: a PageObject
+    :return: dict describing the encoded image for decode_image, or None if the page has no
+             image in a supported form
+    """
+    images = []
+    collect_images(page_resources(page), images)
+    if not images:
+        return None
+    image = max(images, key=lambda xobject: xobject["/Width"] * xobject["/Height"])
+    description = describe_image(image)
+    if (
+        description["components"] is None
+        and description["filter"] not in _PILLOW_FILTERS
+    ):
+        # Indexed, Separation and other color spaces are not analysed
+        return None
+    return description
+
+
+def describe_image(image):
+    """
+    read the encoded data of an image XObject and the entries needed to decode it
+    :param image: an image XObject
+    :return: dict with the data, filter, parameters, size, bits per component, number of
+             components (None for the color spaces not handled here) and inversion
+    """
+    filters = image.get("/Filter")
+    parameters = image.get("/DecodeParms")
+    if isinstance(filters, list):
+        if len(filters) != 1:
+            filters = list(filters)
+        else:
+            filters = filters[0]
+            parameters = parameters[0] if isinstance(parameters, list) else parameters
+
+    color_space = image.get("/ColorSpace")
+    if color_space is not None:
+        color_space = color_space.get_object()
+    if image.get("/ImageMask"):
+        components = 1
+    elif (
+        isinstance(color_space, list) and color_space and color_space[0] == "/ICCBased"
+    ):
+        components = color_space[1].get_object().get("/N", 3)
+    else:
+        components = _COMPONENTS.get(color_space)
+
+    return {
+        "data": image._data,
+        "filter": filters,
+        "parameters": parameters.get_object() if parameters is not None else None,
+        "width": int(image["/Width"]),
+        "height": int(image["/Height"]),
+        "bits": int(image.get("/BitsPerComponent", 1)),
+        "components": components,
+        "inverted": list(image.get("/Decode", [0, 1]))[:2] == [1, 0],
+    }
+
+
+def _unpack_bits(data, width, height):
+    # 1 bit per pixel, rows padded to a byte: 0 bits become 0 and 1 bits become 255
+    row_size = (width + 7) // 8
+    packed = numpy.frombuffer(data, numpy.uint8, row_size * height)
+    bits_array = numpy.unpackbits(packed.reshape(height, row_size), axis=1)
+    return bits_array[:, :width] * numpy.uint8(255)
+
+
+def decode_image_data(image):
+    """
+    undo the lossless filters of an image read by extract_page_image or describe_image
+    :param image: dict describing the encoded image
+    :return: the raw samples as bytes, or None for the other filters
+    """
+    data = image["data"]
+    filters = image["filter"]
+    if filters == "/FlateDecode":
+        if image["parameters"] and image["parameters"].get("/Predictor", 1) > 1:
+            return FlateDecode.decode(data, image["parameters"])
+        return zlib.decompress(data)
+    if filters == "/LZWDecode":
+        data = LZWDecode.decode(data, image["parameters"])
+        return data.encode("latin-1") if isinstance(data, str) else data
+    if filters is None:
+        return data
+    return None
+
+
+def decode_image(image, max_side=None):
+    """
+    decode an image read by extract_page_image into a grayscale array, 0 is black. safe to
+    call from worker threads: zlib, Pillow and numpy release the GIL while they work.
+    :param image: dict returned by extract_page_image
+    :param max_side: decode JPEG images at a reduced size when they are larger than this
+    :return: 2D uint8 numpy array, or None if the image can't be decoded here
+    """
+    require_numpy()
+    data = image["data"]
+    filters = image["filter"]
+    width, height = image["width"], image["height"]
+
+    if filters in _PILLOW_FILTERS or filters == "/CCITTFaxDecode":
+        if Image is None:
+            # JPEG and fax images need Pillow
+            return None
+        inverted = image["inverted"]
+        if filters == "/CCITTFaxDecode":
+            data = CCITTFaxDecode.decode(data, image["parameters"], height)
+            # The fax runs are decoded as in TIFF, where a white run gives 0 bits. With
+            # BlackIs1 the pdf paints those 0 bits black.
+            if image["parameters"] and image["parameters"].get("/BlackIs1"):
+                inverted = not inverted
+        try:
+            picture = Image.open(BytesIO(data))
+            if max_side and filters == "/DCTDecode":
+                # The JPEG decoder can skip the detail we don't need
+                scale = max(width, height) / max_side
+                picture.draft("L", (int(width / scale), int(height / scale)))
+            if picture.mode == "1":
+                # Bilevel images: unpacking the bits is much faster than convert("L")
+                gray = _unpack_bits(picture.tobytes(), picture.width, picture.height)
+            else:
+                gray = numpy.asarray(picture.convert("L"))
+        except (OSError, ValueError):
+            return None
+        return 255 - gray if inverted else gray
+
+    components, bits = image["components"], image["bits"]
+    try:
+        data = decode_image_data(image)
+        if data is None:
+            return None
+        if bits == 8:
+            row_size = width * components
+            samples = numpy.frombuffer(data, numpy.uint8, row_size * height)
+            samples = samples.reshape(height, width, components)
+            if components == 1:
+                gray = samples[:, :, 0]
+            elif components == 4:
+                # CMYK: the strongest ink decides how dark the pixel is
+                gray = 255 - samples.max(axis=2)
+            else:
+                gray = samples.mean(axis=2, dtype=numpy.float32).astype(numpy.uint8)
+        elif bits == 1 and components == 1:
+            gray = _unpack_bits(data, width, height)
+        else:
+            return None
+    except (zlib.error, ValueError, AttributeError):
+        # Corrupt or truncated streams, or broken decode parameters
+        return None
+    return 255 - gray if image["inverted"] else gray
+
+
+def ink_coverage(gray, dark_level=DARK_LEVEL, margin=MARGIN):
+    """
+    the share of dark pixels of a page image, without its margins. the image is first
+    averaged over small blocks, so paper noise and dithering don't count as ink while text
+    strokes still do.
+    :param gray: 2D uint8 array from decode_image
+    :return: float between 0 and 1
+    """
+    height, width = gray.shape
+    top, left = int(height * margin), int(width * margin)
+    inner = gray[top : height - top or None, left : width - left or None]
+    block = max(1, min(inner.shape) // 600)
+    rows, columns = inner.shape[0] // block, inner.shape[1] // block
+    if rows == 0 or columns == 0:
+        return 0.0
+    inner = inner[: rows * block, : columns * block]
+    sums = inner.reshape(rows, block, columns, block).sum(
+        axis=(1, 3), dtype=numpy.uint32
+    )
+    return float(numpy.count_nonzero(sums < dark_level * block * block)) / sums.size
+
+
+def page_ink_coverage(image, dark_level=DARK_LEVEL, margin=MARGIN):
+    """
+    decode an image read by extract_page_image and measure its ink coverage, the function
+    executed in the worker threads
+    :return: float between 0 and 1, or None if the image can't be decoded
+    """
+    gray = decode_image(image, max_side=1200)
+    if gray is None:
+        return None
+    return ink_coverage(gray, dark_level, margin)
+
+
+# Size of the difference hash grid: 8 x 8 comparisons give a 64 bit fingerprint
+HASH_SIZE = 8
+
+# A page whose shrunk image varies less than this has nothing to fingerprint
+MIN_CONTRAST = 16
+
+
+def shrink(gray, width, height):
+    """
+    average a page image down to width x height, each cell is the mean of its area
+    :param gray: 2D uint8 array from decode_image
+    :return: 2D float array, or None if the image is smaller than the grid
+    """
+    if gray.shape[0] < height or gray.shape[1] < width:
+        return None
+    rows = numpy.linspace(0, gray.shape[0], height + 1).astype(int)
+    columns = numpy.linspace(0, gray.shape[1], width + 1).astype(int)
+    sums = numpy.add.reduceat(gray, rows[:-1], axis=0, dtype=numpy.uint32)
+    sums = numpy.add.reduceat(sums, columns[:-1], axis=1)
+    return sums / numpy.outer(numpy.diff(rows), numpy.diff(columns))
+
+
+def difference_hash(gray, size=HASH_SIZE):
+    """
+    the dHash of a page image: each bit tells if a cell of the shrunk image is brighter than
+    its left neighbour. it survives scan noise, small shifts and compression.
+    :param gray: 2D uint8 array from decode_image
+    :param size: the grid size, the hash has size * size bits
+    :return: the hash as an int, or None for a page without contrast (blank)
+    """
+    small = shrink(gray, size + 1, size)
+    if small is None or small.max() - small.min() < MIN_CONTRAST:
+        return None
+    bits = (small[:, 1:] > small[:, :-1]).flatten()
+    return int.from_bytes(numpy.packbits(bits).tobytes(), "big")
+
+
+def hamming_distance(first, second):
+    """
+    :return: the number of bits that differ between two hashes
+    """
+    return bin(first ^ second).count("1")
+
+
+def page_fingerprint(image, size=HASH_SIZE):
+    """
+    decode an image read by extract_page_image and compute its difference hash, the function
+    executed in the worker threads
+    :return: the hash as an int, or None if the image can't be decoded or is blank
+    """
+    gray = decode_image(image, max_side=256)
+    if gray is None:
+        return None
+    return difference_hash(gray, size)
+
+
+# Side of the grid of the sheet signatures
+SIGNATURE_SIZE = 24
+
+# Pixels lighter than this are paper, where the ink of the other side shows through
+PAPER_LEVEL = 160
+
+# Mean similarity an alternative pairing must gain over the planned one to be reported, and
+# the similarity it must reach
+SHIFT_MARGIN = 0.15
+MIN_MATCH = 0.2
+
+
+def page_signature(image):
+    """
+    decode an image read by extract_page_image and compute what the alignment check needs,
+    the function executed in the worker threads
+    :return: (difference hash or None, share of ink of each cell of a SIGNATURE_SIZE grid,
+             mean darkness of the paper of each cell), or None if the image can't be
+             decoded
+    """
+    gray = decode_image(image, max_side=1000)
+    if gray is None or min(gray.shape) < SIGNATURE_SIZE:
+        return None
+    ink = shrink((gray < DARK_LEVEL).view(numpy.uint8), SIGNATURE_SIZE, SIGNATURE_SIZE)
+    paper_mask = gray >= PAPER_LEVEL
+    paper = shrink(paper_mask.view(numpy.uint8), SIGNATURE_SIZE, SIGNATURE_SIZE)
+    tone = shrink(
+        numpy.where(paper_mask, 255 - gray, 0).astype(numpy.uint8),
+        SIGNATURE_SIZE,
+        SIGNATURE_SIZE,
+    )
+    tone /= numpy.maximum(paper, 1e-3)
+    return difference_hash(gray), ink.astype(numpy.float32), tone.astype(numpy.float32)
+
+
+def _sheet_matrix(signatures, field, mirror):
+    # One row per page, without what all the pages share (margins, letterhead, text block),
+    # so the rows keep what is particular to each sheet, scaled to unit length
+    size = SIGNATURE_SIZE * SIGNATURE_SIZE
+    rows = numpy.zeros((len(signatures), size), numpy.float32)
+    known = numpy.zeros(len(signatures), bool)
+    for row, signature in enumerate(signatures):
+        if signature is not None:
+            cells = signature[field][:, ::-1] if mirror else signature[field]
+            rows[row] = cells.ravel()
+            known[row] = True
+    if known.any():
+        rows[known] -= rows[known].mean(axis=0)
+    rows -= rows.mean(axis=1, keepdims=True)
+    norms = numpy.linalg.norm(rows, axis=1, keepdims=True)
+    rows = numpy.divide(rows, norms, out=numpy.zeros_like(rows), where=norms > 1e-3)
+    rows[~known] = 0
+    return rows
+
+
+def sheet_similarity(fronts, backs):
+    """
+    compare every front with every back side. the ink of a side shows through the paper of
+    the other side, mirrored, so the ink map of the front of a sheet matches the paper tone
+    of its back, and the other way round.
+    :param fronts: the page_signature results of the fronts
+    :param backs: the page_signature results of the backs
+    :return: len(fronts) x len(backs) array of similarities between -1 and 1
+    """
+    return (
+        _sheet_matrix(fronts, 1, False) @ _sheet_matrix(backs, 2, True).T
+        + _sheet_matrix(fronts, 2, False) @ _sheet_matrix(backs, 1, True).T
+    ) / 2
+
+
+def _duplicates(signatures, side, max_distance):
+    issues = []
+    for index in range(len(signatures) - 1):
+        first, second = signatures[index], signatures[index + 1]
+        if first is None or second is None or None in (first[0], second[0]):
+            continue
+        if hamming_distance(first[0], second[0]) <= max_distance:
+            issues.append(
+                f"The {side} sides of sheets {index + 1} and {index + 2} are the same "
+                f"page: a sheet went through the feeder twice."
+            )
+    return issues
+
+
+def alignment_issues(fronts, backs, max_distance, max_shift=3):
+    """
+    check that the back sides line up with the fronts. all the fronts and backs are compared
+    at once with sheet_similarity, and the planned pairing is reported when another one
+    matches clearly better: the backs shifted from a given sheet on (a missing or extra back
+    side), or in reverse order (the stack was not flipped). pages seen twice in a row on one
+    side are reported as duplicates.
+    :param fronts: the page_signature results of the fronts, in sheet order
+    :param backs: the page_signature results of the backs, in the planned sheet order
+    :param max_distance: the fingerprint bits two duplicate pages may differ by
+    :param max_shift: the largest shift, in sheets, that is looked for
+    :return: list of messages, empty when the pages line up
+    """
+    issues = _duplicates(fronts, "front", max_distance)
+    issues += _duplicates(backs, "back", max_distance)
+
+    count = min(len(fronts), len(backs))
+    if count < 3:
+        return issues
+    similarity = sheet_similarity(fronts, backs)
+    planned = numpy.diagonal(similarity)[:count]
+
+    # In reverse order, the back of sheet i is the last but i
+    reversed_pairs = similarity[
+        numpy.arange(count), len(backs) - 1 - numpy.arange(count)
+    ]
+    if (
+        reversed_pairs.mean() - planned.mean() > SHIFT_MARGIN
+        and reversed_pairs.mean() > MIN_MATCH
+    ):
+        issues.append(
+            "The back sides match the fronts in reverse order: the stack was not "
+            "flipped before the even pass."
+        )
+        return issues
+
+    best = None
+    for shift in range(-max_shift, max_shift + 1):
+        if shift == 0:
+            continue
+        sheets = numpy.arange(max(0, -shift), min(len(fronts), len(backs) - shift))
+        if len(sheets) < 2:
+            continue
+        shifted = similarity[sheets, sheets + shift]
+        # The pairing is shifted from some sheet on: keep the start with the largest gain
+        gains = numpy.where(
+            sheets < count, shifted - planned[numpy.minimum(sheets, count - 1)], 0
+        )
+        suffix = numpy.cumsum(gains[::-1])[::-1]
+        lengths = numpy.arange(len(sheets), 0, -1)
+        start = int(numpy.argmax(suffix))
+        gain = suffix[start] / lengths[start]
+        match = shifted[start:].mean()
+        if lengths[start] >= 2 and gain > SHIFT_MARGIN and match > MIN_MATCH:
+            if best is None or gain > best[0]:
+                best = (gain, shift, int(sheets[start]))
+    if best is not None:
+        _, shift, sheet = best
+        issues.append(
+            f"From sheet {sheet + 1} on, the back sides are {abs(shift)} sheet(s) "
+            f"{'late' if shift > 0 else 'early'}: a sheet was skipped or fed twice in "
+            f"one of the passes near sheet {sheet + 1}."
+        )
+    return issues
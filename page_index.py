@@ -0,0 +1,190 @@
+import os
+import sqlite3
+import threading
+import time
+
+from page_images import hamming_distance
+
+# Page fingerprints are 64 bit difference hashes, stored in 4 bands of 16 bits: two hashes
+# within 3 bits of each other have at least one band in common, so a lookup only reads the
+# pages sharing a band with the page it looks for
+INDEX_BANDS = 4
+INDEX_MAX_DISTANCE = INDEX_BANDS - 1
+
+# Share of the fingerprinted pages of a new scan that must be found in an archived file for
+# it to be reported as a likely duplicate
+INDEX_MIN_SHARE = 0.5
+
+_BAND_BITS = 64 // INDEX_BANDS
+_BAND_MASK = (1 << _BAND_BITS) - 1
+_HASH_MASK = (1 << 64) - 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    id INTEGER PRIMARY KEY,
+    path TEXT UNIQUE NOT NULL,
+    pages INTEGER NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pages (
+    file_id INTEGER NOT NULL REFERENCES files(id) ON DELETE CASCADE,
+    hash INTEGER NOT NULL,
+    band0 INTEGER NOT NULL,
+    band1 INTEGER NOT NULL,
+    band2 INTEGER NOT NULL,
+    band3 INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS pages_file ON pages(file_id);
+CREATE INDEX IF NOT EXISTS pages_band0 ON pages(band0, hash, file_id);
+CREATE INDEX IF NOT EXISTS pages_band1 ON pages(band1, hash, file_id);
+CREATE INDEX IF NOT EXISTS pages_band2 ON pages(band2, hash, file_id);
+CREATE INDEX IF NOT EXISTS pages_band3 ON pages(band3, hash, file_id);
+"""
+
+# The band indexes also hold the hash and the file, so a lookup never reads the table
+_LOOKUP_SQL = " UNION ALL ".join(
+    f"SELECT hash, file_id FROM pages WHERE band{band} = ?"
+    for band in range(INDEX_BANDS)
+)
+
+
+def _bands(fingerprint):
+    return [
+        (fingerprint >> (_BAND_BITS * band)) & _BAND_MASK for band in range(INDEX_BANDS)
+    ]
+
+
+def _to_signed(fingerprint):
+    # SQLite integers are signed 64 bit
+    return fingerprint - (1 << 64) if fingerprint >> 63 else fingerprint
+
+
+class PageIndex:
+    """
+    persistent index of the page fingerprints of the collated files, in a SQLite database.
+    the outputs are added as the jobs write them, and the pages of a new scan are looked up
+    before it is collated to find the files it was probably already filed in. several
+    processes can share the same database.
+    """
+
+    def __init__(self, db_path):
+        """
+        :param db_path: the database file, created if needed
+        """
+        self.db_path = db_path
+        self.lock = threading.Lock()
+        folder = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(folder, exist_ok=True)
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        # Readers don't wait for the writer, and the worker processes take turns writing
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA foreign_keys=ON")
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+
+    def add(self, path, fingerprints):
+        """
+        add the pages of a file to the index, replacing what was indexed for this path
+        :param path: the file
+        :param fingerprints: its page hashes, None for the pages without one (blank pages)
+        :return: the number of pages indexed
+        """
+        rows = [
+            [_to_signed(fingerprint)] + _bands(fingerprint)
+            for fingerprint in fingerprints
+            if fingerprint is not None
+        ]
+        path = os.path.abspath(path)
+        with self.lock, self.connection:
+            self.connection.execute("DELETE FROM files WHERE path = ?", (path,))
+            file_id = self.connection.execute(
+                "INSERT INTO files (path, pages, indexed_at) VALUES (?, ?, ?)",
+                (path, len(rows), time.time()),
+            ).lastrowid
+            self.connection.executemany(
+                "INSERT INTO pages (file_id, hash, band0, band1, band2, band3) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [[file_id] + row for row in rows],
+            )
+        return len(rows)
+
+    def remove(self, path):
+        """
+        remove a file from the index
+        :return: True if it was indexed
+        """
+        with self.lock, self.connection:
+            cursor = self.connection.execute(
+                "DELETE FROM files WHERE path = ?", (os.path.abspath(path),)
+            )
+        return cursor.rowcount > 0
+
+    def lookup(
+        self,
+        fingerprints,
+        max_distance=INDEX_MAX_DISTANCE,
+        min_share=INDEX_MIN_SHARE,
+        exclude=(),
+    ):
+        """
+        find the indexed files holding the pages of a new scan
+        :param fingerprints: the page hashes of the scan, None for the pages without one
+        :param max_distance: the bits two hashes of the same page may differ by, at most
+                             INDEX_MAX_DISTANCE to find every match
+        :param min_share: the share of the fingerprinted pages a file must hold
+        :param exclude: paths left out of the results, e.g. the output of the job itself
+        :return: list of dicts with the 'path' of the file, the number of 'pages' of the
+                 scan found in it and its 'indexed_pages', most pages first. the files
+                 deleted since they were indexed are left out.
+        """
+        fingerprints = [
+            fingerprint for fingerprint in fingerprints if fingerprint is not None
+        ]
+        matches = {}  # file id -> positions of the pages found in it
+        with self.lock:
+            for position, fingerprint in enumerate(fingerprints):
+                rows = self.connection.execute(_LOOKUP_SQL, _bands(fingerprint))
+                for stored, file_id in rows:
+                    if (
+                        hamming_distance(stored & _HASH_MASK, fingerprint)
+                        <= max_distance
+                    ):
+                        matches.setdefault(file_id, set()).add(position)
+
+            needed = max(1, min_share * len(fingerprints))
+            found = {
+                file_id: len(positions)
+                for file_id, positions in matches.items()
+                if len(positions) >= needed
+            }
+            files = []
+            for file_id, pages in found.items():
+                path, indexed_pages = self.connection.execute(
+                    "SELECT path, pages FROM files WHERE id = ?", (file_id,)
+                ).fetchone()
+                files.append(
+                    {"path": path, "pages": pages, "indexed_pages": indexed_pages}
+                )
+
+        exclude = {os.path.abspath(path) for path in exclude}
+        files = [
+            file
+            for file in files
+            if file["path"] not in exclude and os.path.exists(file["path"])
+        ]
+        files.sort(key=lambda file: -file["pages"])
+        return files
+
+    def stats(self):
+        """
+        :return: dict with the number of 'files' and 'pages' in the index
+        """
+        with self.lock:
+            files, pages = self.connection.execute(
+                "SELECT COUNT(*), COALESCE(SUM(pages), 0) FROM files"
+            ).fetchone()
+        return {"files": files, "pages": pages}
+
+    def close(self):
+        self.connection.close()
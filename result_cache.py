@@ -0,0 +1,166 @@
+import functools
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from metrics import current_metrics
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_file_digest(path, size, mtime_ns):
+    digest = hashlib.sha256()
+    with open(path, "rb") as input_file:
+        for chunk in iter(lambda: input_file.read(HASH_CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_digest(path):
+    """
+    the sha256 of a file, memoized by path, size and modification time so a file is only
+    hashed again when it changed
+    :param path: the file to hash
+    :return: the hex digest
+    """
+    stat = os.stat(path)
+    return _cached_file_digest(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+
+def place_file(source, destination, link=True):
+    """
+    make destination a copy of source, as a hard link when possible
+    :param link: try a hard link first, otherwise always copy
+    """
+    if os.path.exists(destination):
+        os.remove(destination)
+    if link:
+        try:
+            os.link(source, destination)
+            return
+        except OSError:
+            # Other file system, or links not supported
+            pass
+    shutil.copyfile(source, destination)
+
+
+class ResultCache:
+    """
+    content-addressed cache of job outputs. the key is the hash of the input bytes, the mode
+    and the options, so resubmitting the same scans gives the previous output at once. the
+    cache folder is kept under max_bytes by removing the least recently used entries.
+    several processes can share the same folder.
+    """
+
+    def __init__(self, cache_dir, max_bytes=1024**3, link=True):
+        """
+        :param cache_dir: the folder of the cache, created if needed
+        :param max_bytes: the size above which the oldest entries are evicted
+        :param link: hard link the outputs to the cache entries instead of copying them
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.link = link
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key(self, mode, input_paths, **options):
+        """
+        :param mode: the operation, e.g. 'organize'
+        :param input_paths: the inputs, in order
+        :param options: the options that change the output bytes
+        :return: the cache key as a hex string
+        """
+        description = {
+            "mode": mode,
+            "inputs": [file_digest(path) for path in input_paths],
+            "options": options,
+        }
+        return hashlib.sha256(
+            json.dumps(description, sort_keys=True).encode()
+        ).hexdigest()
+
+    def entry_path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.pdf")
+
+    def fetch(self, key, output_path):
+        """
+        place the cached output of a key at output_path
+        :return: True on a hit, False on a miss
+        """
+        entry = self.entry_path(key)
+        try:
+            place_file(entry, output_path, self.link)
+            # The modification time orders the entries for the eviction
+            os.utime(entry)
+        except FileNotFoundError:
+            with self.lock:
+                self.misses += 1
+            current_metrics().set(cache="miss")
+            return False
+        with self.lock:
+            self.hits += 1
+        current_metrics().set(cache="hit")
+        return True
+
+    def store(self, key, output_path):
+        """
+        add a finished output to the cache, then evict the oldest entries if it is too large
+        """
+        handle, temporary_path = tempfile.mkstemp(
+            prefix=".store_", suffix=".pdf", dir=self.cache_dir
+        )
+        os.close(handle)
+        try:
+            place_file(output_path, temporary_path, self.link)
+            os.replace(temporary_path, self.entry_path(key))
+        except BaseException:
+            if os.path.exists(temporary_path):
+                os.remove(temporary_path)
+            raise
+        self.evict()
+
+    def evict(self):
+        """
+        remove the least recently used entries until the cache fits in max_bytes
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith(".pdf") and not entry.name.startswith("."):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                # Another process evicted it first
+                pass
+            total -= size
+            with self.lock:
+                self.evictions += 1
+
+    def stats(self):
+        """
+        :return: dict with the hit, miss and eviction counters of this process
+        """
+        with self.lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
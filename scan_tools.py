@@ -1,215 +1,1643 @@
-import datetime
-import os
-import string
-from datetime import datetime
-import random
-
-from PyPDF2 import PdfReader, PdfWriter, PdfMerger
-
-
-def generate_output_path(input_pdf_path, prefix="scanned", custom_filename=None):
-    """
-    generate an output path, so it will be saved in the Documents folder
-    :param input_pdf_path: the original path of the pdf
-    :param prefix: to add
-    :param custom_filename: custom filename without extension
-    :return: the path as string
-    """
-    if custom_filename:
-        output_filename = f"{custom_filename}.pdf"
-    else:
-        base_filename = os.path.splitext(os.path.basename(input_pdf_path))[0]
-        output_filename = (
-            f"{base_filename}_{prefix}_{datetime.now().strftime('%H-%M')}.pdf"
-        )
-
-    documents_folder = os.path.join(os.path.expanduser("~"), "Documents")
-    duplex_scan_folder = os.path.join(documents_folder, "Duplex scan")
-
-    # Create the 'Duplex scan' sub-folder if it doesn't exist
-    if not os.path.exists(duplex_scan_folder):
-        os.makedirs(duplex_scan_folder)
-
-    output_path = os.path.join(duplex_scan_folder, output_filename)
-    return output_path
-
-
-def get_total_pages(pdf_path):
-    pdf_reader = PdfReader(open(pdf_path, "rb"))
-    total_pages = len(pdf_reader.pages)
-    pdf_reader.stream.close()
-    return total_pages
-
-
-def generate_random_string(length):
-    """
-    Generate a random string of specified length.
-    :param length: The length of the random string.
-    :return: The generated random string.
-    """
-    letters_and_digits = string.ascii_letters + string.digits
-    return "".join(random.choice(letters_and_digits) for _ in range(length))
-
-
-def reverse_pdf_pages(pdf_path):
-    """
-    Reverse the order of pages in a PDF file and include a random string in the filename.
-    :param pdf_path: The path of the PDF file.
-    :return: The new reversed PDF filename.
-    """
-    pdf_reader = PdfReader(open(pdf_path, "rb"))
-    pdf_writer = PdfWriter()
-
-    for page in reversed(range(len(pdf_reader.pages))):
-        pdf_writer.add_page(pdf_reader.pages[page])
-
-    # Generate a random string of 12 characters
-    random_string = generate_random_string(12)
-    reversed_pdf_filename = "reversed_{}_{}.pdf".format(
-        os.path.splitext(os.path.basename(pdf_path))[0], random_string
-    )
-
-    with open(reversed_pdf_filename, "wb") as f:
-        pdf_writer.write(f)
-
-    return reversed_pdf_filename
-
-
-def close_pdf(pdf_path):
-    """
-    Close a PDF file using PyPDF2's PdfReader.
-    :param pdf_path: The path of the PDF file to close.
-    :return: True if the PDF was closed successfully, False otherwise.
-    """
-    try:
-        pdf_reader = PdfReader(pdf_path)
-        pdf_reader.stream.close()
-        print(f"PDF '{pdf_path}' closed successfully.")
-        return True
-    except Exception as e:
-        print(f"An error occurred while trying to close '{pdf_path}': {e}")
-        return False
-
-
-def remove_file(filename):
-    """
-    Remove a file and handle exceptions using try-catch.
-    :param filename: The name of the file to remove.
-    :return: True if the file was removed successfully, False otherwise.
-    """
-    try:
-        os.remove(filename)
-        print(f"File '{filename}' removed successfully.")
-        return True
-    except OSError as e:
-        print(f"An error occurred while trying to remove '{filename}': {e}")
-        return False
-
-
-def organize_scan_pdf(odd_even_pdf_path, custom_filename=None):
-    """
-     takes the path of a PDF file containing odd pages and  even pages (for example if the pdf contains 14 pages,
-     the first 7 are the odd and the rest is the even pages) ,
-     and then returns a single PDF file with pages arranged in the order of odd-even pairs.
-    :param odd_even_pdf_path: the pdf that contains all the odd + even pages
-    :param custom_filename: custom filename without extension
-    :return: output file path
-    """
-    pdf_reader = PdfReader(open(odd_even_pdf_path, "rb"))
-    total_pages = len(pdf_reader.pages)
-
-    # Reverse only the even pages
-    reversed_even_pdf = reverse_pdf_pages(odd_even_pdf_path)
-    reversed_even_pdf_reader = PdfReader(open(reversed_even_pdf, "rb"))
-
-    # Create a new PDF writer
-    merged_pdf_writer = PdfWriter()
-
-    # Iterate through odd and even pairs and combine them
-    for i in range(total_pages // 2):
-        merged_pdf_writer.add_page(pdf_reader.pages[i])  # Odd page
-        merged_pdf_writer.add_page(reversed_even_pdf_reader.pages[i])  # Even page
-
-    # If there are an odd number of total pages, add the last odd page
-    if total_pages % 2 != 0:
-        merged_pdf_writer.add_page(pdf_reader.pages[total_pages - 1])
-
-    # Generate the output PDF path
-    output_filename = generate_output_path(
-        odd_even_pdf_path, prefix="scanned", custom_filename=custom_filename
-    )
-
-    # Save the merged PDF in the current directory
-    with open(output_filename, "wb") as output_file:
-        merged_pdf_writer.write(output_file)
-
-    print(f"Merged PDF saved as '{output_filename}'.")
-
-    # Close the PDF readers
-    pdf_reader.stream.close()
-    reversed_even_pdf_reader.stream.close()
-
-    # Remove the reversed even PDF file
-    remove_file(reversed_even_pdf)
-
-    return output_filename
-
-
-def merge_2_pdfs_after_scan(odd_pdf, even_pdf, custom_filename=None):
-    """
-    if you scan pages in two steps: 1 for the odd pages and the second for the even pages, use this method to create
-    one pdf file out of this scan
-    :param odd_pdf: the pdf that contains the first scan
-    :param even_pdf: the pdf that contains the second scan
-    :param custom_filename: custom filename without extension
-    :return: output file path
-    """
-    # Reverse the pages in even_pdf
-    reversed_even_pdf = reverse_pdf_pages(even_pdf)
-
-    # Merge the odd and reversed even pages into a new PDF
-    odd_pdf_reader = PdfReader(open(odd_pdf, "rb"))
-    reversed_even_pdf_reader = PdfReader(open(reversed_even_pdf, "rb"))
-
-    new_pdf_writer = PdfWriter()
-    for page in range(len(odd_pdf_reader.pages)):
-        new_pdf_writer.add_page(odd_pdf_reader.pages[page])
-        if page < len(reversed_even_pdf_reader.pages):
-            new_pdf_writer.add_page(reversed_even_pdf_reader.pages[page])
-
-    # Generate the output PDF path
-    output_filename = generate_output_path(
-        odd_pdf, prefix="scanned", custom_filename=custom_filename
-    )
-
-    with open(output_filename, "wb") as f:
-        new_pdf_writer.write(f)
-    reversed_even_pdf_reader.stream.close()
-    # close_pdf(reversed_even_pdf)
-    # Remove the reversed even PDF file
-    remove_file(reversed_even_pdf)
-
-    return output_filename
-
-
-def merge_pdfs(input_paths, output_path):
-    """
-    merge x pdf files into one pdf
-    :param input_paths: the paths of the pdf you want to merge
-    :param output_path: the output file you want to save the pdf
-    :return: true if the operation was successful
-    """
-    merger = PdfMerger()
-
-    # Iterate through each input PDF file
-    for path in input_paths:
-        # Open the PDF file in read-binary mode
-        with open(path, "rb") as file:
-            merger.append(file)
-
-    # Write the merged PDF to the output file
-    with open(output_path, "wb") as output_file:
-        merger.write(output_file)
-
-    print("PDFs merged successfully!")
-    return True
+import contextlib
+import datetime
+import functools
+import itertools
+import mmap
+import os
+import re
+import string
+from datetime import datetime
+import random
+import shutil
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from PyPDF2 import PdfReader, PdfWriter, PdfMerger
+
+from linearize import write_linearized
+from metrics import current_metrics, job_metrics
+from stream_writer import (
+    IncrementalPdfWriter,
+    StreamingPdfWriter,
+    read_update_base,
+)
+
+
+def default_output_dir():
+    """
+    :return: the Documents/Duplex scan folder, where the outputs go by default
+    """
+    return os.path.join(os.path.expanduser("~"), "Documents", "Duplex scan")
+
+
+def unique_name_suffix():
+    """
+    the end of the generated output names: the time to the second and a few random
+    characters, so inputs with the same name from different folders, or runs within the same
+    second, don't overwrite each other's output
+    :return: e.g. '14-05-09_k3Xb'
+    """
+    return f"{datetime.now().strftime('%H-%M-%S')}_{generate_random_string(4)}"
+
+
+def generate_output_path(
+    input_pdf_path, prefix="scanned", custom_filename=None, output_dir=None
+):
+    """
+    generate an output path, so it will be saved in the Documents folder
+    :param input_pdf_path: the original path of the pdf
+    :param prefix: to add
+    :param custom_filename: custom filename without extension
+    :param output_dir: folder to use instead of Documents/Duplex scan
+    :return: the path as string
+    """
+    if custom_filename:
+        output_filename = f"{custom_filename}.pdf"
+    else:
+        base_filename = os.path.splitext(os.path.basename(input_pdf_path))[0]
+        output_filename = f"{base_filename}_{prefix}_{unique_name_suffix()}.pdf"
+
+    duplex_scan_folder = output_dir or default_output_dir()
+
+    # Create the 'Duplex scan' sub-folder if it doesn't exist, parallel jobs may race for it
+    os.makedirs(duplex_scan_folder, exist_ok=True)
+
+    output_path = os.path.join(duplex_scan_folder, output_filename)
+    return output_path
+
+
+_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)")
+_XREF_SUBSECTION_RE = re.compile(rb"\s*(\d+)[ \t]+(\d+)[ \t]*\r?\n")
+_TRAILER_ROOT_RE = re.compile(rb"/Root\s*(\d+)\s+(\d+)\s+R")
+_TRAILER_PREV_RE = re.compile(rb"/Prev\s*(\d+)")
+_CATALOG_PAGES_RE = re.compile(rb"/Pages(?![A-Za-z])\s*(\d+)\s+(\d+)\s+R")
+_PAGES_COUNT_RE = re.compile(rb"/Count\s*(\d+)(?![\d.]|\s+\d+\s+R)")
+_TAIL_SIZE = 2048
+_CHUNK_SIZE = 4096
+
+
+class FastPageCountError(Exception):
+    """raised when the page count can't be read without a full parse"""
+
+
+class OperationCancelled(Exception):
+    """raised when a job is cancelled through its progress callback"""
+
+
+def report_progress(progress_callback, done, total):
+    """
+    send a progress event to the caller. the callback gets (done, total) and may return False
+    to cancel the job.
+    :param progress_callback: callable(done, total) or None
+    :param done: the number of pages processed so far
+    :param total: the total number of pages of the job
+    :raise OperationCancelled: if the callback asked to stop
+    """
+    if progress_callback is not None and progress_callback(done, total) is False:
+        current_metrics().set(status="cancelled")
+        raise OperationCancelled("The operation was cancelled")
+
+
+def _read_indirect_object(pdf_file, offset, object_number):
+    """
+    read the raw bytes of an indirect object, from its header to 'endobj'
+    :param pdf_file: the pdf file opened in binary mode
+    :param offset: the byte offset of the object, taken from the xref table
+    :param object_number: the object number we expect to find at this offset
+    :return: the raw bytes of the object
+    """
+    pdf_file.seek(offset)
+    data = pdf_file.read(_CHUNK_SIZE)
+    header = re.match(rb"\s*(\d+)\s+\d+\s+obj", data)
+    if not header or int(header.group(1)) != object_number:
+        raise FastPageCountError(f"object {object_number} is not at offset {offset}")
+
+    # A page tree root lists every kid, so it can be larger than one chunk
+    while b"endobj" not in data:
+        chunk = pdf_file.read(_CHUNK_SIZE)
+        if not chunk:
+            raise FastPageCountError(f"object {object_number} is not terminated")
+        data += chunk
+    return data[: data.index(b"endobj")]
+
+
+def _read_xref_section(pdf_file, xref_offset):
+    """
+    read a classic xref table and the trailer that follows it
+    :param pdf_file: the pdf file opened in binary mode
+    :param xref_offset: the offset of the 'xref' keyword
+    :return: (table bytes, trailer bytes)
+    """
+    pdf_file.seek(xref_offset)
+    data = pdf_file.read(_CHUNK_SIZE)
+    if not data.lstrip().startswith(b"xref"):
+        # Cross-reference streams need the real parser
+        raise FastPageCountError("not a classic xref table")
+    while b"trailer" not in data:
+        chunk = pdf_file.read(_CHUNK_SIZE * 16)
+        if not chunk:
+            raise FastPageCountError("xref table without trailer")
+        data += chunk
+    table, trailer = data.split(b"trailer", 1)
+    return table, trailer
+
+
+def _find_object_offset(pdf_file, xref_offset, object_number):
+    """
+    walk the chain of classic xref tables, newest first, to find where an object is stored
+    :param pdf_file: the pdf file opened in binary mode
+    :param xref_offset: the offset of the newest xref table (the 'startxref' value)
+    :param object_number: the object to look up
+    :return: the byte offset of the object
+    """
+    visited = set()
+    while xref_offset is not None and xref_offset not in visited:
+        visited.add(xref_offset)
+        table, trailer = _read_xref_section(pdf_file, xref_offset)
+        position = table.index(b"xref") + 4
+        while True:
+            subsection = _XREF_SUBSECTION_RE.match(table, position)
+            if not subsection:
+                break
+            first, count = int(subsection.group(1)), int(subsection.group(2))
+            position = subsection.end()
+            if first <= object_number < first + count:
+                entry_start = position + (object_number - first) * 20
+                entry = table[entry_start : entry_start + 18].split()
+                if len(entry) != 3 or entry[2] != b"n":
+                    raise FastPageCountError(f"object {object_number} is not in use")
+                return int(entry[0])
+            position += count * 20
+
+        prev = _TRAILER_PREV_RE.search(trailer)
+        xref_offset = int(prev.group(1)) if prev else None
+
+    raise FastPageCountError(f"object {object_number} not found in the xref tables")
+
+
+def read_page_count_from_trailer(pdf_path):
+    """
+    read the number of pages of a pdf from its trailer and the /Count of its page tree root,
+    without parsing the rest of the file. only classic xref tables are supported.
+    :param pdf_path: the path of the pdf
+    :return: the number of pages
+    :raise FastPageCountError: if the file doesn't allow a fast count
+    """
+    with open(pdf_path, "rb") as pdf_file:
+        pdf_file.seek(0, os.SEEK_END)
+        file_size = pdf_file.tell()
+        pdf_file.seek(max(0, file_size - _TAIL_SIZE))
+        tail = pdf_file.read()
+
+        startxref = None
+        for startxref in _STARTXREF_RE.finditer(tail):
+            pass
+        if startxref is None:
+            raise FastPageCountError("startxref not found")
+        xref_offset = int(startxref.group(1))
+
+        # The newest trailer holds the current /Root
+        root = _TRAILER_ROOT_RE.search(_read_xref_section(pdf_file, xref_offset)[1])
+        if not root:
+            raise FastPageCountError("trailer without /Root")
+
+        root_number = int(root.group(1))
+        catalog = _read_indirect_object(
+            pdf_file,
+            _find_object_offset(pdf_file, xref_offset, root_number),
+            root_number,
+        )
+        pages = _CATALOG_PAGES_RE.search(catalog)
+        if not pages:
+            raise FastPageCountError("catalog without /Pages")
+
+        pages_number = int(pages.group(1))
+        page_tree = _read_indirect_object(
+            pdf_file,
+            _find_object_offset(pdf_file, xref_offset, pages_number),
+            pages_number,
+        )
+        count = _PAGES_COUNT_RE.search(page_tree)
+        if not count:
+            raise FastPageCountError("page tree without a direct /Count")
+        return int(count.group(1))
+
+
+@functools.lru_cache(maxsize=256)
+def _cached_total_pages(pdf_path, size, mtime_ns):
+    """
+    count the pages of a pdf once per (path, size, mtime_ns), the arguments after the path
+    are only there to invalidate the cache when the file changes
+    """
+    try:
+        return read_page_count_from_trailer(pdf_path)
+    except (FastPageCountError, OSError, ValueError):
+        # Broken or unusual files get the full parse
+        with open_pdf(pdf_path) as pdf_reader:
+            return len(pdf_reader.pages)
+
+
+def get_total_pages(pdf_path):
+    """
+    get the number of pages of a pdf. the page count is read from the trailer and the page tree
+    when possible, and cached until the file changes on disk.
+    :param pdf_path: the path of the pdf
+    :return: the number of pages
+    """
+    stat = os.stat(pdf_path)
+    return _cached_total_pages(
+        os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns
+    )
+
+
+def generate_random_string(length):
+    """
+    Generate a random string of specified length.
+    :param length: The length of the random string.
+    :return: The generated random string.
+    """
+    letters_and_digits = string.ascii_letters + string.digits
+    return "".join(random.choice(letters_and_digits) for _ in range(length))
+
+
+@contextlib.contextmanager
+def open_pdf(pdf_path):
+    """
+    open a pdf for reading through a read-only memory map of the file, so the parser reads
+    from the page cache without another buffer in between. the map and the file descriptor
+    are both released when the with block ends, even on errors.
+    :param pdf_path: the path of the pdf
+    :return: context manager giving a PdfReader, only valid inside the with block
+    """
+    metrics = current_metrics()
+    with metrics.stage("open"):
+        pdf_file = open(pdf_path, "rb")
+        try:
+            mapped_file = mmap.mmap(pdf_file.fileno(), 0, access=mmap.ACCESS_READ)
+        except (ValueError, OSError):
+            # Empty files and special files can't be mapped
+            mapped_file = None
+
+    try:
+        with metrics.stage("parse"):
+            pdf_reader = PdfReader(mapped_file if mapped_file is not None else pdf_file)
+        yield pdf_reader
+    finally:
+        with metrics.stage("cleanup"):
+            if mapped_file is not None:
+                mapped_file.close()
+            pdf_file.close()
+
+
+def preload_pdf(pdf_path):
+    """
+    open and parse a pdf ahead of a job, e.g. while the user is still filling in the form, so
+    the job can start writing right away
+    :param pdf_path: the path of the pdf
+    :return: (PdfReader with its page tree loaded, close function releasing the file)
+    """
+    stack = contextlib.ExitStack()
+    try:
+        pdf_reader = stack.enter_context(open_pdf(pdf_path))
+        len(pdf_reader.pages)
+    except BaseException:
+        stack.close()
+        raise
+    return pdf_reader, stack.close
+
+
+def reuse_or_open_pdf(pdf_path, pdf_reader=None):
+    """
+    :param pdf_path: the path of the pdf
+    :param pdf_reader: a reader of pdf_path opened by the caller (see preload_pdf), or None
+    :return: context manager giving pdf_reader as is, or a new reader from open_pdf
+    """
+    if pdf_reader is not None:
+        return contextlib.nullcontext(pdf_reader)
+    return open_pdf(pdf_path)
+
+
+def reverse_pdf_pages(pdf_path):
+    """
+    Reverse the order of pages in a PDF file and include a random string in the filename.
+    :param pdf_path: The path of the PDF file.
+    :return: The new reversed PDF filename.
+    """
+    # Generate a random string of 12 characters
+    random_string = generate_random_string(12)
+    reversed_pdf_filename = "reversed_{}_{}.pdf".format(
+        os.path.splitext(os.path.basename(pdf_path))[0], random_string
+    )
+
+    with open_pdf(pdf_path) as pdf_reader:
+        pdf_writer = PdfWriter()
+        for page in reversed(range(len(pdf_reader.pages))):
+            pdf_writer.add_page(pdf_reader.pages[page])
+
+        with atomic_output(reversed_pdf_filename) as partial_filename:
+            with open(partial_filename, "wb") as f:
+                pdf_writer.write(f)
+
+    return reversed_pdf_filename
+
+
+def close_pdf(pdf_path):
+    """
+    Close a PDF file using PyPDF2's PdfReader.
+    :param pdf_path: The path of the PDF file to close.
+    :return: True if the PDF was closed successfully, False otherwise.
+    """
+    try:
+        pdf_reader = PdfReader(pdf_path)
+        pdf_reader.stream.close()
+        print(f"PDF '{pdf_path}' closed successfully.")
+        return True
+    except Exception as e:
+        print(f"An error occurred while trying to close '{pdf_path}': {e}")
+        return False
+
+
+def remove_file(filename):
+    """
+    Remove a file and handle exceptions using try-catch.
+    :param filename: The name of the file to remove.
+    :return: True if the file was removed successfully, False otherwise.
+    """
+    try:
+        os.remove(filename)
+        print(f"File '{filename}' removed successfully.")
+        return True
+    except OSError as e:
+        print(f"An error occurred while trying to remove '{filename}': {e}")
+        return False
+
+
+def sync_file(output_file):
+    """
+    flush a written file to the disk, so a finished job survives a power loss
+    :param output_file: a file object opened for writing
+    """
+    with current_metrics().stage("fsync"):
+        output_file.flush()
+        os.fsync(output_file.fileno())
+
+
+def sync_directory(folder):
+    """
+    flush the entries of a folder to the disk, so a renamed output survives a power loss.
+    does nothing where folders can't be opened (Windows).
+    :param folder: the folder
+    """
+    if os.name != "posix":
+        return
+    with current_metrics().stage("fsync"):
+        descriptor = os.open(folder, os.O_RDONLY)
+        try:
+            os.fsync(descriptor)
+        finally:
+            os.close(descriptor)
+
+
+# Outputs are written under this suffix and renamed once complete
+PARTIAL_SUFFIX = ".part"
+
+
+@contextlib.contextmanager
+def atomic_output(output_filename):
+    """
+    write a file under a temporary name next to it, and rename it to output_filename once
+    the with block succeeds: a crash or a failed job never leaves a truncated file under the
+    final name, and the partial file is removed on errors
+    :param output_filename: the path of the file to write
+    :return: context manager giving the path to write to
+    """
+    partial_filename = output_filename + PARTIAL_SUFFIX
+    try:
+        yield partial_filename
+        os.replace(partial_filename, output_filename)
+    except BaseException:
+        if os.path.exists(partial_filename):
+            remove_file(partial_filename)
+        raise
+    sync_directory(os.path.dirname(os.path.abspath(output_filename)))
+
+
+def duplex_page_order(total_pages):
+    """
+    compute the final page order of a single-file duplex scan as a permutation of page indexes.
+    the first half of the file holds the odd pages in order, the second half holds the even pages
+    in reverse order (the stack was flipped), so no page has to be copied to find its place.
+    :param total_pages: the number of pages in the scanned pdf
+    :return: list of page indexes in reading order
+    """
+    odd_count = (total_pages + 1) // 2
+    page_order = []
+    for i in range(total_pages // 2):
+        page_order.append(i)  # Odd page
+        page_order.append(total_pages - 1 - i)  # Even page, counted from the end
+    # If there are an odd number of total pages, the last odd page has no back side
+    if total_pages % 2 != 0:
+        page_order.append(odd_count - 1)
+    return page_order
+
+
+def interleave_page_order(odd_count, even_count):
+    """
+    compute the final page order of a scan made in two steps as (source, page index) pairs,
+    where source 0 is the odd pages pdf and source 1 is the even pages pdf (scanned in reverse order)
+    :param odd_count: the number of pages in the odd pages pdf
+    :param even_count: the number of pages in the even pages pdf
+    :return: list of (source, page index) tuples in reading order
+    """
+    page_order = []
+    for page in range(odd_count):
+        page_order.append((0, page))
+        if page < even_count:
+            page_order.append((1, even_count - 1 - page))
+    return page_order
+
+
+EVEN_BATCH_ORDERS = ("stack", "per_batch")
+
+# Back sides with less ink than this share of their pixels are blank
+BLANK_INK_THRESHOLD = 0.002
+
+# Target of the optimization pass: images finer than this are downsampled, then saved as
+# JPEG with this quality
+OPTIMIZE_IMAGE_DPI = 200
+OPTIMIZE_IMAGE_QUALITY = 75
+
+# Bits (out of 64) a page fingerprint may differ from the separator sheet and still match it
+SEPARATOR_MAX_DISTANCE = 10
+
+# Bits two page fingerprints may differ by when the same page was scanned twice
+DUPLICATE_MAX_DISTANCE = 6
+
+
+def multi_batch_page_order(odd_counts, even_counts, even_order="stack"):
+    """
+    compute the final page order of a document scanned in several feeder batches per side, as
+    (source, page index) pairs. the sources are the odd batches followed by the even batches,
+    each list in scan order.
+    :param odd_counts: the number of pages of each odd batch, in scan order
+    :param even_counts: the number of pages of each even batch, in scan order
+    :param even_order: 'stack' if the whole stack was flipped at once, so the even batches
+                       together hold the even pages from the last one to the first, or
+                       'per_batch' if each batch was flipped on its own, so every even batch
+                       holds the backs of the matching odd batch in reverse order
+    :return: list of (source, page index) tuples in reading order
+    :raise ValueError: if there are more even pages than odd pages
+    """
+    if even_order not in EVEN_BATCH_ORDERS:
+        raise ValueError(f"Unknown even batch order: {even_order}")
+
+    odd_pages = [
+        (source, page)
+        for source, count in enumerate(odd_counts)
+        for page in range(count)
+    ]
+    even_batches = [
+        [(len(odd_counts) + batch, page) for page in range(count)]
+        for batch, count in enumerate(even_counts)
+    ]
+    if even_order == "stack":
+        even_pages = [page for batch in even_batches for page in batch][::-1]
+    else:
+        even_pages = [page for batch in even_batches for page in batch[::-1]]
+
+    if len(even_pages) > len(odd_pages):
+        raise ValueError(
+            f"{len(even_pages)} even pages for only {len(odd_pages)} odd pages"
+        )
+
+    page_order = []
+    for index, odd_page in enumerate(odd_pages):
+        page_order.append(odd_page)
+        if index < len(even_pages):
+            page_order.append(even_pages[index])
+    return page_order
+
+
+def write_page_plan(
+    readers,
+    page_plan,
+    output_filename,
+    progress_callback=None,
+    streaming=False,
+    deduplicate=False,
+    total=None,
+    optimize=False,
+    image_dpi=OPTIMIZE_IMAGE_DPI,
+    image_quality=OPTIMIZE_IMAGE_QUALITY,
+):
+    """
+    write the pages of the given readers in the planned order, in a single pass and without
+    any intermediate file
+    :param readers: list of open PdfReader objects
+    :param page_plan: list of (reader index, page index) tuples in output order, or an
+                      iterator of them (then total is needed for the progress events)
+    :param output_filename: the path of the pdf to write
+    :param progress_callback: optional callable(done, total), return False to cancel
+    :param streaming: write each page as soon as it is copied, with bounded memory
+    :param deduplicate: store identical streams and dictionaries once (implies streaming)
+    :param total: the number of pages for the progress events, defaults to len(page_plan)
+    :param optimize: recompress the streams and images of the pages, see optimize_pages
+    :param image_dpi: the resolution the images are downsampled to when optimizing
+    :param image_quality: the JPEG quality of the images re-encoded when optimizing
+    :return: the number of pages written
+    """
+    if total is None:
+        total = len(page_plan)
+    started = time.perf_counter()
+    report = {}
+    if optimize:
+        page_plan = optimize_pages(readers, page_plan, image_dpi, image_quality, report)
+
+    if streaming or deduplicate:
+        pages = (readers[source].pages[page] for source, page in page_plan)
+        done = stream_pages(
+            pages, total, output_filename, progress_callback, deduplicate=deduplicate
+        )
+    else:
+        metrics = current_metrics()
+        pdf_writer = PdfWriter()
+        done = 0
+        for done, (source, page) in enumerate(page_plan, start=1):
+            with metrics.stage("add_page"):
+                pdf_writer.add_page(readers[source].pages[page])
+            report_progress(progress_callback, done, total)
+
+        with atomic_output(output_filename) as partial_filename:
+            with open(partial_filename, "wb") as output_file:
+                with metrics.stage("serialize"):
+                    pdf_writer.write(output_file)
+                sync_file(output_file)
+
+    if optimize:
+        report_optimization(report, output_filename, time.perf_counter() - started)
+    return done
+
+
+def optimize_pages(readers, page_plan, image_dpi, image_quality, report):
+    """
+    yield the planned pages after recompressing their streams: the content streams stored
+    without a filter get Flate, and the images finer than image_dpi are downsampled and saved
+    as JPEG. the work runs in a thread pool a few pages ahead of the writer, and a stream only
+    replaces the original when it is smaller.
+    :param readers: list of open PdfReader objects, their page objects are modified
+    :param page_plan: iterable of (reader index, page index) tuples in output order
+    :param image_dpi: the resolution the images are downsampled to
+    :param image_quality: the JPEG quality of the re-encoded images
+    :param report: dict receiving the counters of optimizer.apply_optimization
+    :return: generator of (reader index, page index) tuples
+    """
+    # Pillow is only loaded when the outputs are optimized
+    from optimizer import (
+        apply_optimization,
+        extract_page_streams,
+        optimize_page_streams,
+    )
+
+    metrics = current_metrics()
+    analysed_pages = analyse_pages(
+        readers,
+        page_plan,
+        functools.partial(
+            optimize_page_streams, image_dpi=image_dpi, image_quality=image_quality
+        ),
+        "optimize",
+        extract=functools.partial(extract_page_streams, seen=set()),
+    )
+    for entry, results in analysed_pages:
+        if results:
+            with metrics.stage("optimize"):
+                apply_optimization(results, report)
+        yield entry
+
+
+def report_optimization(report, output_filename, seconds):
+    """
+    print the size and time report of the optimization pass and add it to the job metrics
+    :param report: the counters filled by optimize_pages
+    :param output_filename: the optimized output
+    :param seconds: the time spent writing the output, optimization included
+    """
+    before = report.get("bytes_before", 0)
+    after = report.get("bytes_after", 0)
+    saving = 100 * (before - after) / before if before else 0
+    current_metrics().set(optimized_bytes_before=before, optimized_bytes_after=after)
+    print(
+        f"Optimized {report.get('streams', 0)} content streams and "
+        f"{report.get('images', 0)} images in {seconds:.2f} s: "
+        f"{before / 1024**2:.1f} MB -> {after / 1024**2:.1f} MB (-{saving:.0f}%), "
+        f"output {os.path.getsize(output_filename) / 1024**2:.1f} MB."
+    )
+
+
+def linearize_output(output_filename):
+    """
+    rewrite a finished output as a linearized ("fast web view") pdf: the first page comes
+    first with the hint tables locating the others, so a browser shows it before the whole
+    file is downloaded. the new file replaces the output once complete.
+    :param output_filename: the pdf to rewrite
+    :return: the number of pages
+    """
+    metrics = current_metrics()
+    with atomic_output(output_filename) as partial_filename:
+        with open_pdf(output_filename) as pdf_reader, open(
+            partial_filename, "wb"
+        ) as output_file:
+            with metrics.stage("linearize"):
+                pages = write_linearized(pdf_reader, output_file)
+            sync_file(output_file)
+    return pages
+
+
+def analyse_pages(readers, page_plan, analyse, stage, select=None, extract=None):
+    """
+    yield the planned pages with the result of an analysis of their scan image. the images
+    are read on this thread, which owns the readers, and analysed in a thread pool a few pages
+    ahead of the consumer, so the pages are analysed and copied in the same pass.
+    :param readers: list of open PdfReader objects
+    :param page_plan: iterable of (reader index, page index) tuples in output order
+    :param analyse: callable(image) run in the worker threads on what extract returned
+    :param stage: the metrics stage the analysis is timed under
+    :param select: optional callable((reader index, page index)) telling which pages to analyse
+    :param extract: callable(page) reading what the analysis needs from a page, or None when
+                    there is nothing to analyse, page_images.extract_page_image by default
+    :return: generator of ((reader index, page index), result) tuples, the result is None for
+             pages not selected or without anything to analyse
+    """
+    if extract is None:
+        from page_images import extract_page_image as extract
+
+    metrics = current_metrics()
+    workers = os.cpu_count() or 1
+    pending = deque()
+
+    def next_page():
+        entry, future = pending.popleft()
+        if future is None:
+            return entry, None
+        with metrics.stage(stage):
+            return entry, future.result()
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for entry in page_plan:
+            future = None
+            if select is None or select(entry):
+                with metrics.stage(stage):
+                    image = extract(readers[entry[0]].pages[entry[1]])
+                if image is not None:
+                    future = executor.submit(analyse, image)
+            pending.append((entry, future))
+
+            # Keep the pool busy, but hand over the pages whose analysis is over
+            while pending and (
+                len(pending) > workers * 4
+                or pending[0][1] is None
+                or pending[0][1].done()
+            ):
+                yield next_page()
+
+        while pending:
+            yield next_page()
+
+
+def drop_blank_backs(
+    readers, page_plan, is_back, threshold=BLANK_INK_THRESHOLD, removed=None
+):
+    """
+    yield the planned pages without the backs whose scan image is blank. pages without a
+    readable image are kept.
+    :param readers: list of open PdfReader objects
+    :param page_plan: list of (reader index, page index) tuples in output order
+    :param is_back: callable((reader index, page index)) telling if a page is a back side
+    :param threshold: the ink coverage below which a page is blank
+    :param removed: optional list receiving the removed (reader index, page index) tuples
+    :return: generator of (reader index, page index) tuples
+    """
+    # numpy is only loaded when blank pages are removed
+    from page_images import page_ink_coverage, require_numpy
+
+    require_numpy()
+    for entry, coverage in analyse_pages(
+        readers, page_plan, page_ink_coverage, "blank_check", select=is_back
+    ):
+        if coverage is not None and coverage < threshold:
+            if removed is not None:
+                removed.append(entry)
+            continue
+        yield entry
+
+
+def write_collated_pages(
+    readers,
+    page_plan,
+    output_filename,
+    progress_callback=None,
+    streaming=False,
+    deduplicate=False,
+    is_back=None,
+    remove_blank_backs=False,
+    blank_threshold=BLANK_INK_THRESHOLD,
+    optimize=False,
+    image_dpi=OPTIMIZE_IMAGE_DPI,
+    image_quality=OPTIMIZE_IMAGE_QUALITY,
+):
+    """
+    write_page_plan for the collation modes, optionally without the blank back sides
+    :param is_back: callable((reader index, page index)) telling if a page is a back side
+    :param remove_blank_backs: drop the back sides without ink (needs numpy)
+    :param blank_threshold: the ink coverage below which a back side is blank
+    :param optimize: recompress the streams and images, see optimize_pages
+    :param image_dpi: the resolution the images are downsampled to when optimizing
+    :param image_quality: the JPEG quality of the images re-encoded when optimizing
+    :return: the number of pages written
+    """
+    metrics = current_metrics()
+    if not remove_blank_backs:
+        metrics.set(pages=len(page_plan))
+        return write_page_plan(
+            readers,
+            page_plan,
+            output_filename,
+            progress_callback,
+            streaming=streaming,
+            deduplicate=deduplicate,
+            optimize=optimize,
+            image_dpi=image_dpi,
+            image_quality=image_quality,
+        )
+
+    removed = []
+    written = write_page_plan(
+        readers,
+        drop_blank_backs(readers, page_plan, is_back, blank_threshold, removed),
+        output_filename,
+        progress_callback,
+        streaming=streaming,
+        deduplicate=deduplicate,
+        total=len(page_plan),
+        optimize=optimize,
+        image_dpi=image_dpi,
+        image_quality=image_quality,
+    )
+    metrics.set(pages=written, blank_pages=len(removed))
+    print(f"Removed {len(removed)} blank pages.")
+    return written
+
+
+def stream_pages(
+    pages, total, output_filename, progress_callback=None, deduplicate=False
+):
+    """
+    write pages one by one with the StreamingPdfWriter, the peak memory depends on the largest
+    page and not on the page count. the output is renamed into place once complete, a failed
+    or cancelled job doesn't leave a partial file.
+    :param pages: iterable of PageObject, read lazily
+    :param total: the number of pages, for the progress events
+    :param output_filename: the path of the pdf to write
+    :param progress_callback: optional callable(done, total), return False to cancel
+    :param deduplicate: store identical streams and dictionaries only once
+    :return: the number of pages written
+    """
+    metrics = current_metrics()
+    done = 0
+    try:
+        with atomic_output(output_filename) as partial_filename:
+            with open(partial_filename, "wb") as output_file:
+                writer = StreamingPdfWriter(output_file, deduplicate=deduplicate)
+                for done, page in enumerate(pages, start=1):
+                    with metrics.stage("add_page"):
+                        writer.add_page(page)
+                    report_progress(progress_callback, done, total)
+                with metrics.stage("serialize"):
+                    writer.close()
+                sync_file(output_file)
+    finally:
+        # Release the inputs held open by a page generator right away
+        if hasattr(pages, "close"):
+            pages.close()
+
+    if deduplicate:
+        print(
+            f"Deduplicated {writer.deduplicated_objects} objects, "
+            f"saved {writer.deduplicated_bytes} bytes."
+        )
+    return done
+
+
+def iterate_pages(input_paths):
+    """
+    yield the pages of several pdf files, keeping only one file open at a time
+    :param input_paths: the paths of the pdf files
+    :return: generator of PageObject
+    """
+    for path in input_paths:
+        with open_pdf(path) as pdf_reader:
+            yield from pdf_reader.pages
+
+
+def organize_scan_pdf(
+    odd_even_pdf_path,
+    custom_filename=None,
+    progress_callback=None,
+    output_dir=None,
+    streaming=False,
+    deduplicate=False,
+    pdf_reader=None,
+    cache=None,
+    remove_blank_backs=False,
+    blank_threshold=BLANK_INK_THRESHOLD,
+    optimize=False,
+    image_dpi=OPTIMIZE_IMAGE_DPI,
+    image_quality=OPTIMIZE_IMAGE_QUALITY,
+    linearize=False,
+):
+    """
+     takes the path of a PDF file containing odd pages and  even pages (for example if the pdf contains 14 pages,
+     the first 7 are the odd and the rest is the even pages) ,
+     and then returns a single PDF file with pages arranged in the order of odd-even pairs.
+    :param odd_even_pdf_path: the pdf that contains all the odd + even pages
+    :param custom_filename: custom filename without extension
+    :param progress_callback: optional callable(done, total), return False to cancel
+    :param output_dir: folder to use instead of Documents/Duplex scan
+    :param streaming: write pages as they are copied, for scans too large for memory
+    :param deduplicate: store identical images, fonts and profiles only once
+    :param pdf_reader: an already open reader of odd_even_pdf_path to reuse
+    :param cache: a ResultCache, the output of an identical earlier job is reused
+    :param remove_blank_backs: drop the back sides without ink (needs numpy, and Pillow for
+                               JPEG and fax images)
+    :param blank_threshold: the share of dark pixels below which a back side is blank
+    :param optimize: recompress the streams and downsample the images finer than image_dpi
+    :param image_dpi: the resolution the images are downsampled to when optimizing
+    :param image_quality: the JPEG quality of the images re-encoded when optimizing
+    :param linearize: write a linearized ("fast web view") pdf, see linearize_output
+    :return: output file path
+    """
+    # Generate the output PDF path
+    output_filename = generate_output_path(
+        odd_even_pdf_path,
+        prefix="scanned",
+        custom_filename=custom_filename,
+        output_dir=output_dir,
+    )
+
+    with job_metrics(
+        "organize_scan_pdf", inputs=[odd_even_pdf_path], output=output_filename
+    ) as metrics:
+        if cache is not None:
+            cache_key = cache.key(
+                "organize",
+                [odd_even_pdf_path],
+                streaming=streaming,
+                deduplicate=deduplicate,
+                remove_blank_backs=remove_blank_backs,
+                blank_threshold=blank_threshold,
+                optimize=optimize,
+                image_dpi=image_dpi,
+                image_quality=image_quality,
+                linearize=linearize,
+            )
+            if cache.fetch(cache_key, output_filename):
+                print(f"Merged PDF saved as '{output_filename}' (from the cache).")
+                return output_filename
+
+        with reuse_or_open_pdf(odd_even_pdf_path, pdf_reader) as pdf_reader:
+            with metrics.stage("page_plan"):
+                total_pages = len(pdf_reader.pages)
+                page_plan = [(0, page) for page in duplex_page_order(total_pages)]
+            odd_count = (total_pages + 1) // 2
+            write_collated_pages(
+                [pdf_reader],
+                page_plan,
+                output_filename,
+                progress_callback,
+                streaming=streaming,
+                deduplicate=deduplicate,
+                is_back=lambda entry: entry[1] >= odd_count,
+                remove_blank_backs=remove_blank_backs,
+                blank_threshold=blank_threshold,
+                optimize=optimize,
+                image_dpi=image_dpi,
+                image_quality=image_quality,
+            )
+
+        if linearize:
+            linearize_output(output_filename)
+        if cache is not None:
+            cache.store(cache_key, output_filename)
+
+    print(f"Merged PDF saved as '{output_filename}'.")
+
+    return output_filename
+
+
+def merge_2_pdfs_after_scan(
+    odd_pdf,
+    even_pdf,
+    custom_filename=None,
+    progress_callback=None,
+    output_dir=None,
+    streaming=False,
+    deduplicate=False,
+    odd_pdf_reader=None,
+    even_pdf_reader=None,
+    cache=None,
+    remove_blank_backs=False,
+    blank_threshold=BLANK_INK_THRESHOLD,
+    optimize=False,
+    image_dpi=OPTIMIZE_IMAGE_DPI,
+    image_quality=OPTIMIZE_IMAGE_QUALITY,
+    linearize=False,
+):
+    """
+    if you scan pages in two steps: 1 for the odd pages and the second for the even pages, use this method to create
+    one pdf file out of this scan
+    :param odd_pdf: the pdf that contains the first scan
+    :param even_pdf: the pdf that contains the second scan
+    :param custom_filename: custom filename without extension
+    :param progress_callback: optional callable(done, total), return False to cancel
+    :param output_dir: folder to use instead of Documents/Duplex scan
+    :param streaming: write pages as they are copied, for scans too large for memory
+    :param odd_pdf_reader: an already open reader of odd_pdf to reuse
+    :param even_pdf_reader: an already open reader of even_pdf to reuse
+    :param cache: a ResultCache, the output of an identical earlier job is reused
+    :param remove_blank_backs: drop the back sides without ink (needs numpy, and Pillow for
+                               JPEG and fax images)
+    :param blank_threshold: the share of dark pixels below which a back side is blank
+    :param optimize: recompress the streams and downsample the images finer than image_dpi
+    :param image_dpi: the resolution the images are downsampled to when optimizing
+    :param image_quality: the JPEG quality of the images re-encoded when optimizing
+    :param linearize: write a linearized ("fast web view") pdf, see linearize_output
+    :return: output file path
+    """
+    # Generate the output PDF path
+    output_filename = generate_output_path(
+        odd_pdf,
+        prefix="scanned",
+        custom_filename=custom_filename,
+        output_dir=output_dir,
+    )
+
+    with job_metrics(
+        "merge_2_pdfs_after_scan", inputs=[odd_pdf, even_pdf], output=output_filename
+    ) as metrics:
+        if cache is not None:
+            cache_key = cache.key(
+                "merge2",
+                [odd_pdf, even_pdf],
+                streaming=streaming,
+                deduplicate=deduplicate,
+                remove_blank_backs=remove_blank_backs,
+                blank_threshold=blank_threshold,
+                optimize=optimize,
+                image_dpi=image_dpi,
+                image_quality=image_quality,
+                linearize=linearize,
+            )
+            if cache.fetch(cache_key, output_filename):
+                return output_filename
+
+        with reuse_or_open_pdf(
+            odd_pdf, odd_pdf_reader
+        ) as odd_pdf_reader, reuse_or_open_pdf(
+            even_pdf, even_pdf_reader
+        ) as even_pdf_reader:
+            with metrics.stage("page_plan"):
+                page_plan = interleave_page_order(
+                    len(odd_pdf_reader.pages), len(even_pdf_reader.pages)
+                )
+            write_collated_pages(
+                [odd_pdf_reader, even_pdf_reader],
+                page_plan,
+                output_filename,
+                progress_callback,
+                streaming=streaming,
+                deduplicate=deduplicate,
+                is_back=lambda entry: entry[0] == 1,
+                remove_blank_backs=remove_blank_backs,
+                blank_threshold=blank_threshold,
+                optimize=optimize,
+                image_dpi=image_dpi,
+                image_quality=image_quality,
+            )
+
+        if linearize:
+            linearize_output(output_filename)
+        if cache is not None:
+            cache.store(cache_key, output_filename)
+
+    return output_filename
+
+
+def merge_batches_after_scan(
+    odd_pdfs,
+    even_pdfs,
+    custom_filename=None,
+    progress_callback=None,
+    output_dir=None,
+    streaming=False,
+    deduplicate=False,
+    even_order="stack",
+    remove_blank_backs=False,
+    blank_threshold=BLANK_INK_THRESHOLD,
+    optimize=False,
+    image_dpi=OPTIMIZE_IMAGE_DPI,
+    image_quality=OPTIMIZE_IMAGE_QUALITY,
+    linearize=False,
+):
+    """
+    if the feeder can't hold the whole document, the odd sides are scanned in several batches,
+    then the even sides. use this method to create one pdf out of all the batches, in a single
+    pass over the inputs.
+    :param odd_pdfs: the pdf files of the odd side batches, in scan order
+    :param even_pdfs: the pdf files of the even side batches, in scan order
+    :param custom_filename: custom filename without extension
+    :param progress_callback: optional callable(done, total), return False to cancel
+    :param output_dir: folder to use instead of Documents/Duplex scan
+    :param streaming: write pages as they are copied, for scans too large for memory
+    :param deduplicate: store identical images, fonts and profiles only once
+    :param even_order: 'stack' or 'per_batch', see multi_batch_page_order
+    :param remove_blank_backs: drop the back sides without ink (needs numpy, and Pillow for
+                               JPEG and fax images)
+    :param blank_threshold: the share of dark pixels below which a back side is blank
+    :param optimize: recompress the streams and downsample the images finer than image_dpi
+    :param image_dpi: the resolution the images are downsampled to when optimizing
+    :param image_quality: the JPEG quality of the images re-encoded when optimizing
+    :param linearize: write a linearized ("fast web view") pdf, see linearize_output
+    :return: output file path
+    """
+    if not odd_pdfs:
+        raise ValueError("no odd pages batch")
+
+    # Generate the output PDF path
+    output_filename = generate_output_path(
+        odd_pdfs[0],
+        prefix="scanned",
+        custom_filename=custom_filename,
+        output_dir=output_dir,
+    )
+
+    with job_metrics(
+        "merge_batches_after_scan",
+        inputs=list(odd_pdfs) + list(even_pdfs),
+        output=output_filename,
+    ) as metrics, contextlib.ExitStack() as stack:
+        readers = [
+            stack.enter_context(open_pdf(path))
+            for path in list(odd_pdfs) + list(even_pdfs)
+        ]
+        with metrics.stage("page_plan"):
+            counts = [len(reader.pages) for reader in readers]
+            page_plan = multi_batch_page_order(
+                counts[: len(odd_pdfs)], counts[len(odd_pdfs) :], even_order
+            )
+        write_collated_pages(
+            readers,
+            page_plan,
+            output_filename,
+            progress_callback,
+            streaming=streaming,
+            deduplicate=deduplicate,
+            is_back=lambda entry: entry[0] >= len(odd_pdfs),
+            remove_blank_backs=remove_blank_backs,
+            blank_threshold=blank_threshold,
+            optimize=optimize,
+            image_dpi=image_dpi,
+            image_quality=image_quality,
+        )
+        if linearize:
+            linearize_output(output_filename)
+
+    return output_filename
+
+
+def separator_fingerprints(separator_pdf_path):
+    """
+    fingerprint the pages of a scan of the separator sheet
+    :param separator_pdf_path: a pdf with one or both sides of the separator sheet
+    :return: list of page hashes, the blank sides are left out
+    """
+    from page_images import extract_page_image, page_fingerprint
+
+    fingerprints = []
+    with open_pdf(separator_pdf_path) as pdf_reader:
+        for page in pdf_reader.pages:
+            image = extract_page_image(page)
+            fingerprint = page_fingerprint(image) if image is not None else None
+            if fingerprint is not None:
+                fingerprints.append(fingerprint)
+    return fingerprints
+
+
+def group_sheets(analysed_pages):
+    """
+    group the pages of a duplex page plan by sheet: a front and the back that follows it
+    :param analysed_pages: iterable of (entry, result) tuples, see analyse_pages
+    :return: generator of (pages done, list of (entry, result) tuples)
+    """
+    sheet = []
+    done = 0
+    for done, analysed_page in enumerate(analysed_pages, start=1):
+        sheet.append(analysed_page)
+        if len(sheet) == 2:
+            yield done, sheet
+            sheet = []
+    if sheet:
+        yield done, sheet
+
+
+@functools.lru_cache(maxsize=16)
+def _cached_page_signatures(pdf_path, size, mtime_ns):
+    """
+    compute the page signatures of a pdf once per (path, size, mtime_ns), the arguments
+    after the path are only there to invalidate the cache when the file changes
+    """
+    from page_images import page_signature
+
+    with open_pdf(pdf_path) as pdf_reader:
+        page_plan = [(0, page) for page in range(len(pdf_reader.pages))]
+        return tuple(
+            signature
+            for _, signature in analyse_pages(
+                [pdf_reader], page_plan, page_signature, "fingerprint"
+            )
+        )
+
+
+def get_page_signatures(pdf_path):
+    """
+    the fingerprint and sheet signature of every page of a pdf, see
+    page_images.page_signature. the pages are decoded at a reduced size in a thread pool,
+    and the result is cached until the file changes on disk.
+    :param pdf_path: the path of the pdf
+    :return: tuple with one signature per page, None for the pages without a readable image
+    """
+    stat = os.stat(pdf_path)
+    return _cached_page_signatures(
+        os.path.abspath(pdf_path), stat.st_size, stat.st_mtime_ns
+    )
+
+
+def get_page_fingerprints(pdf_path):
+    """
+    the difference hash of every page of a pdf, taken from its page signatures so the
+    alignment check and the page index decode the pages once
+    :param pdf_path: the path of the pdf
+    :return: list with one hash per page, None for the blank pages and the pages without a
+             readable image
+    """
+    from page_images import require_numpy
+
+    require_numpy()
+    return [
+        signature[0] if signature is not None else None
+        for signature in get_page_signatures(pdf_path)
+    ]
+
+
+def verify_scan_alignment(odd_pdf, even_pdf=None, max_distance=DUPLICATE_MAX_DISTANCE):
+    """
+    check from the page images that the back sides of a duplex scan line up with the
+    fronts, before it is collated: duplicate pages, a missing or extra back side and an even
+    stack that was not flipped are reported with the sheet where they happen
+    :param odd_pdf: the single-file scan (the odd pages, then the even pages in reverse
+                    order), or the odd pages pdf of a scan made in two files
+    :param even_pdf: the even pages pdf of a scan made in two files
+    :param max_distance: the fingerprint bits two duplicate pages may differ by
+    :return: list of messages, empty when the pages line up
+    """
+    # numpy is only loaded when the alignment is checked
+    from page_images import alignment_issues, require_numpy
+
+    require_numpy()
+    inputs = [odd_pdf] if even_pdf is None else [odd_pdf, even_pdf]
+    with job_metrics("verify_scan_alignment", inputs=inputs, output=None) as metrics:
+        issues = []
+        signatures = get_page_signatures(odd_pdf)
+        if even_pdf is None:
+            odd_count = (len(signatures) + 1) // 2
+            fronts, backs = signatures[:odd_count], signatures[odd_count:][::-1]
+            if len(signatures) % 2:
+                issues.append(
+                    f"The scan has an odd number of pages ({len(signatures)}): one "
+                    f"side of a sheet is missing."
+                )
+        else:
+            fronts, backs = signatures, get_page_signatures(even_pdf)[::-1]
+            if len(fronts) != len(backs):
+                issues.append(
+                    f"The odd pages file has {len(fronts)} pages and the even pages file "
+                    f"{len(backs)}: the passes don't have the same number of sheets."
+                )
+        issues += alignment_issues(fronts, backs, max_distance)
+        metrics.set(pages=len(fronts) + len(backs), issues=len(issues))
+    return issues
+
+
+def split_scan_pdf(
+    odd_even_pdf_path,
+    separator_pdf_path,
+    custom_filename=None,
+    progress_callback=None,
+    output_dir=None,
+    deduplicate=False,
+    max_distance=SEPARATOR_MAX_DISTANCE,
+    pdf_reader=None,
+):
+    """
+    organize a single-file duplex scan of a whole tray where separator sheets were put between
+    the documents, and write each document to its own pdf. every page is fingerprinted once,
+    in the pass that copies it, and the documents are streamed to their files one after the
+    other. a sheet is dropped as a separator when one of its sides matches the separator scan.
+    :param odd_even_pdf_path: the pdf that contains all the odd + even pages
+    :param separator_pdf_path: a scan of the separator sheet, see separator_fingerprints
+    :param custom_filename: base of the output filenames, the document number is appended
+    :param progress_callback: optional callable(done, total), return False to cancel
+    :param output_dir: folder to use instead of Documents/Duplex scan
+    :param deduplicate: store identical images, fonts and profiles only once
+    :param max_distance: the hash bits a page may differ from the separator and still match
+    :param pdf_reader: an already open reader of odd_even_pdf_path to reuse
+    :return: list of output file paths, one per document
+    """
+    from page_images import hamming_distance, page_fingerprint, require_numpy
+
+    require_numpy()
+    if not custom_filename:
+        base_filename = os.path.splitext(os.path.basename(odd_even_pdf_path))[0]
+        custom_filename = f"{base_filename}_split_{unique_name_suffix()}"
+
+    def is_separator(sheet):
+        return any(
+            fingerprint is not None
+            and any(
+                hamming_distance(fingerprint, separator) <= max_distance
+                for separator in separators
+            )
+            for _, fingerprint in sheet[1]
+        )
+
+    outputs = []
+    written = 0
+    with job_metrics(
+        "split_scan_pdf", inputs=[odd_even_pdf_path, separator_pdf_path], output=None
+    ) as metrics:
+        separators = separator_fingerprints(separator_pdf_path)
+        if not separators:
+            raise ValueError("The separator pdf has no page image to match")
+
+        with reuse_or_open_pdf(odd_even_pdf_path, pdf_reader) as pdf_reader:
+            with metrics.stage("page_plan"):
+                total_pages = len(pdf_reader.pages)
+                page_plan = [(0, page) for page in duplex_page_order(total_pages)]
+
+            def document_pages(document_sheets):
+                for done, sheet in document_sheets:
+                    for (_, page_index), _ in sheet:
+                        yield pdf_reader.pages[page_index]
+                    report_progress(progress_callback, done, total_pages)
+
+            sheets = group_sheets(
+                analyse_pages([pdf_reader], page_plan, page_fingerprint, "fingerprint")
+            )
+            try:
+                with contextlib.closing(sheets):
+                    for separator, document_sheets in itertools.groupby(
+                        sheets, is_separator
+                    ):
+                        if separator:
+                            continue
+                        output_filename = generate_output_path(
+                            odd_even_pdf_path,
+                            custom_filename=f"{custom_filename}_{len(outputs) + 1:03d}",
+                            output_dir=output_dir,
+                        )
+                        written += stream_pages(
+                            document_pages(document_sheets),
+                            total_pages,
+                            output_filename,
+                            deduplicate=deduplicate,
+                        )
+                        outputs.append(output_filename)
+            except BaseException:
+                # Don't leave half of the tray behind, the job is run again as a whole
+                for output_filename in outputs:
+                    remove_file(output_filename)
+                raise
+
+        metrics.set(output=outputs, pages=written, documents=len(outputs))
+
+    print(f"Split into {len(outputs)} documents:")
+    for output_filename in outputs:
+        print(f"  '{output_filename}'")
+    return outputs
+
+
+def merge_pdfs(
+    input_paths,
+    output_path,
+    progress_callback=None,
+    streaming=False,
+    deduplicate=False,
+    optimize=False,
+    image_dpi=OPTIMIZE_IMAGE_DPI,
+    image_quality=OPTIMIZE_IMAGE_QUALITY,
+    linearize=False,
+):
+    """
+    merge x pdf files into one pdf
+    :param input_paths: the paths of the pdf you want to merge
+    :param output_path: the output file you want to save the pdf
+    :param progress_callback: optional callable(done, total) counted in pages, return False to cancel
+    :param streaming: write pages as they are copied, one input open at a time. bookmarks of
+                      the inputs are not kept in this mode.
+    :param deduplicate: store identical images, fonts and profiles of the inputs only once
+                        (implies streaming)
+    :param optimize: recompress the streams and downsample the images finer than image_dpi.
+                     the bookmarks of the inputs are not kept in this mode.
+    :param image_dpi: the resolution the images are downsampled to when optimizing
+    :param image_quality: the JPEG quality of the images re-encoded when optimizing
+    :param linearize: write a linearized ("fast web view") pdf, see linearize_output
+    :return: true if the operation was successful
+    """
+    with job_metrics(
+        "merge_pdfs", inputs=list(input_paths), output=output_path
+    ) as metrics:
+        with metrics.stage("page_plan"):
+            total = sum(get_total_pages(path) for path in input_paths)
+        metrics.set(pages=total)
+        if optimize:
+            with contextlib.ExitStack() as stack:
+                readers = [stack.enter_context(open_pdf(path)) for path in input_paths]
+                page_plan = [
+                    (source, page)
+                    for source, reader in enumerate(readers)
+                    for page in range(len(reader.pages))
+                ]
+                write_page_plan(
+                    readers,
+                    page_plan,
+                    output_path,
+                    progress_callback,
+                    streaming=streaming,
+                    deduplicate=deduplicate,
+                    optimize=True,
+                    image_dpi=image_dpi,
+                    image_quality=image_quality,
+                )
+        else:
+            _merge_pdfs(
+                input_paths,
+                output_path,
+                total,
+                progress_callback,
+                streaming,
+                deduplicate,
+            )
+        if linearize:
+            linearize_output(output_path)
+
+    print("PDFs merged successfully!")
+    return True
+
+
+def _merge_pdfs(
+    input_paths, output_path, total, progress_callback, streaming, deduplicate
+):
+    if streaming or deduplicate:
+        stream_pages(
+            iterate_pages(input_paths),
+            total,
+            output_path,
+            progress_callback,
+            deduplicate=deduplicate,
+        )
+        return
+
+    metrics = current_metrics()
+    merger = PdfMerger()
+    done = 0
+
+    # Iterate through each input PDF file
+    for path in input_paths:
+        # Open the PDF file in read-binary mode
+        with metrics.stage("add_page"), open(path, "rb") as file:
+            merger.append(file)
+        done += get_total_pages(path)
+        report_progress(progress_callback, done, total)
+
+    # Write the merged PDF to the output file
+    with atomic_output(output_path) as partial_path:
+        with open(partial_path, "wb") as output_file:
+            with metrics.stage("serialize"):
+                merger.write(output_file)
+            sync_file(output_file)
+
+
+def merge_pdf_chunk(input_paths, output_path, splice=False):
+    """
+    merge one chunk of a reduction tree, this is the function executed in the worker processes
+    :param input_paths: the pdf files of the chunk, in order
+    :param output_path: the partial result to write
+    :param splice: the inputs are partial results written by StreamingPdfWriter, so they are
+                   spliced as bytes instead of being parsed again
+    :return: the output path
+    """
+    if not splice:
+        stream_pages(iterate_pages(input_paths), None, output_path)
+        return output_path
+
+    with atomic_output(output_path) as partial_path:
+        with open(partial_path, "wb") as output_file:
+            writer = StreamingPdfWriter(output_file)
+            for path in input_paths:
+                writer.append_written_pdf(path)
+            writer.close()
+            sync_file(output_file)
+    return output_path
+
+
+def merge_pdfs_parallel(
+    input_paths, output_path, workers=None, fan_in=8, work_dir=None
+):
+    """
+    merge x pdf files into one pdf with a reduction tree: chunks of inputs are merged in worker
+    processes, then the partial results are combined fan_in at a time until one is left.
+    only the first level parses the inputs, the next levels splice the partial results as bytes.
+    the page order is the same as merge_pdfs, bookmarks of the inputs are not kept.
+    :param input_paths: the paths of the pdf you want to merge
+    :param output_path: the output file you want to save the pdf
+    :param workers: number of worker processes, defaults to the number of CPUs
+    :param fan_in: how many files are combined by each node of the tree
+    :param work_dir: the folder of the partial results, created and removed here (default:
+                     a new MERGE_WORK_DIR_PREFIX folder next to the output)
+    :return: true if the operation was successful
+    """
+    if fan_in < 2:
+        raise ValueError("fan_in must be at least 2")
+    if not input_paths:
+        raise ValueError("no input to merge")
+
+    workers = workers or os.cpu_count() or 1
+    with job_metrics(
+        "merge_pdfs_parallel", inputs=list(input_paths), output=output_path
+    ) as metrics:
+        # The workers run in other processes, only the whole tree is timed here
+        with metrics.stage("serialize"):
+            _merge_tree(input_paths, output_path, workers, fan_in, work_dir)
+
+    print("PDFs merged successfully!")
+    return True
+
+
+# The partial results of merge_pdfs_parallel are kept in a folder with this prefix, next to
+# the output
+MERGE_WORK_DIR_PREFIX = ".merge_"
+
+
+def _merge_tree(input_paths, output_path, workers, fan_in, work_dir=None):
+    if work_dir is None:
+        work_dir = tempfile.mkdtemp(
+            prefix=MERGE_WORK_DIR_PREFIX,
+            dir=os.path.dirname(os.path.abspath(output_path)),
+        )
+    else:
+        os.makedirs(work_dir)
+    try:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            level = list(input_paths)
+            # Small first chunks keep every worker busy when there are few inputs
+            chunk_size = min(fan_in, max(1, -(-len(level) // workers)))
+            depth = 0
+            while True:
+                chunks = [
+                    level[i : i + chunk_size] for i in range(0, len(level), chunk_size)
+                ]
+                if len(chunks) == 1:
+                    outputs = [output_path]
+                else:
+                    outputs = [
+                        os.path.join(work_dir, f"{depth}_{i}.pdf")
+                        for i in range(len(chunks))
+                    ]
+                futures = [
+                    executor.submit(merge_pdf_chunk, chunk, output, depth > 0)
+                    for chunk, output in zip(chunks, outputs)
+                ]
+                for future in futures:
+                    future.result()
+
+                if depth > 0:
+                    # The previous partial results are no longer needed
+                    for path in level:
+                        os.remove(path)
+                if len(chunks) == 1:
+                    break
+                level = outputs
+                chunk_size = fan_in
+                depth += 1
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+
+# While pages are appended, the original size of the pdf is kept in a file next to it, so
+# an append interrupted by a crash can be undone
+APPEND_MARKER_SUFFIX = ".append"
+
+
+def break_hard_link(pdf_path):
+    """
+    give a file its own copy of its bytes before it is changed in place: the outputs placed
+    by the ResultCache are hard links to the cache entries, which must keep their content
+    :param pdf_path: the file about to be written in place
+    :return: True if the file was shared and got copied
+    """
+    if os.stat(pdf_path).st_nlink <= 1:
+        return False
+    with atomic_output(pdf_path) as partial_filename:
+        shutil.copy2(pdf_path, partial_filename)
+    return True
+
+
+def rollback_append(pdf_path):
+    """
+    undo an append to a pdf that didn't finish, by truncating the pdf to its size before
+    the append. does nothing when no append was interrupted.
+    :param pdf_path: the pdf pages were appended to
+    :return: True if an append was undone
+    """
+    marker = pdf_path + APPEND_MARKER_SUFFIX
+    if not os.path.exists(marker):
+        return False
+    with open(marker, encoding="utf-8") as marker_file:
+        original_size = int(marker_file.read())
+    break_hard_link(pdf_path)
+    with open(pdf_path, "r+b") as pdf_file:
+        pdf_file.truncate(original_size)
+        sync_file(pdf_file)
+    os.remove(marker)
+    sync_directory(os.path.dirname(os.path.abspath(pdf_path)))
+    print(f"Undid the unfinished append to '{pdf_path}'.")
+    return True
+
+
+def append_pages(pdf_path, input_paths, progress_callback=None, deduplicate=False):
+    """
+    add the pages of other pdf files at the end of a pdf, as an incremental update written
+    after its existing bytes (see IncrementalPdfWriter): only the trailer and the page tree
+    root of the pdf are read, so adding a late batch to a large output costs the pages added.
+    the bookmarks of the inputs are not kept. a failed or cancelled append is undone, and an
+    append interrupted by a crash is undone by the next one (see rollback_append). a pdf
+    that is a hard link, e.g. an output of the ResultCache, is copied first.
+    :param pdf_path: the pdf to add the pages to, with a classic xref table and not encrypted
+    :param input_paths: the pdf files whose pages are added, in order
+    :param progress_callback: optional callable(done, total) counted in pages, return False to cancel
+    :param deduplicate: store identical images, fonts and profiles of the inputs only once
+    :return: the number of pages added
+    """
+    with job_metrics(
+        "append_pages", inputs=list(input_paths), output=pdf_path
+    ) as metrics:
+        rollback_append(pdf_path)
+        with metrics.stage("page_plan"):
+            total = sum(get_total_pages(path) for path in input_paths)
+        break_hard_link(pdf_path)
+        with open_pdf(pdf_path) as pdf_reader:
+            base = read_update_base(pdf_reader)
+
+        marker = pdf_path + APPEND_MARKER_SUFFIX
+        with open(marker, "w", encoding="utf-8") as marker_file:
+            marker_file.write(str(os.path.getsize(pdf_path)))
+            sync_file(marker_file)
+        sync_directory(os.path.dirname(os.path.abspath(pdf_path)))
+
+        pages = iterate_pages(input_paths)
+        done = 0
+        try:
+            with open(pdf_path, "r+b") as output_file:
+                writer = IncrementalPdfWriter(
+                    output_file, base, deduplicate=deduplicate
+                )
+                for done, page in enumerate(pages, start=1):
+                    with metrics.stage("add_page"):
+                        writer.add_page(page)
+                    report_progress(progress_callback, done, total)
+                with metrics.stage("serialize"):
+                    writer.close()
+                sync_file(output_file)
+        except BaseException:
+            rollback_append(pdf_path)
+            raise
+        finally:
+            pages.close()
+        # A marker left behind would undo this append
+        os.remove(marker)
+        sync_directory(os.path.dirname(os.path.abspath(pdf_path)))
+        metrics.set(pages=done)
+
+    print(f"Appended {done} pages to '{pdf_path}'.")
+    return done
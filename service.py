@@ -0,0 +1,533 @@
+import argparse
+import json
+import os
+import re
+import secrets
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cli import run_job
+
+DEFAULT_PORT = 8765
+DEFAULT_MAX_UPLOAD_MB = 2048
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# The number of uploads each mode takes, None for any number
+SERVICE_MODES = {"organize": 1, "merge2": 2, "merge": None}
+
+# The job options a client can set, with their JSON type
+JOB_OPTIONS = {
+    "streaming": bool,
+    "deduplicate": bool,
+    "remove_blank_backs": bool,
+    "blank_threshold": float,
+    "optimize": bool,
+    "image_dpi": int,
+    "image_quality": int,
+    "linearize": bool,
+    "verify": bool,
+}
+
+# The options that default to something else than off, as in the CLI and the hot folder
+JOB_DEFAULTS = {"verify": True}
+
+_JOB_PATH_RE = re.compile(r"^/jobs/([0-9a-f]+)(/result)?$")
+_UPLOAD_PATH_RE = re.compile(r"^/uploads/([0-9a-f]+)$")
+
+
+class ServiceError(Exception):
+    """raised with the HTTP status to answer when a request can't be served"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+def option_value(name, value):
+    """
+    check the JSON value of a job option: booleans must be true or false, not "false" or 0,
+    and numbers must be numbers
+    :param name: a key of JOB_OPTIONS
+    :param value: the value of the request
+    :return: the value
+    :raise ServiceError: 400 if the value has the wrong type
+    """
+    kind = JOB_OPTIONS[name]
+    if kind is bool:
+        valid = isinstance(value, bool)
+    elif kind is float:
+        valid = isinstance(value, (int, float)) and not isinstance(value, bool)
+    else:
+        valid = isinstance(value, kind) and not isinstance(value, bool)
+    if not valid:
+        raise ServiceError(400, f"{name} must be a JSON {kind.__name__}")
+    return kind(value)
+
+
+class JobService:
+    """
+    the state of the job service: the uploaded files, the jobs and the worker pool. the jobs
+    run in worker processes; at most workers + max_pending jobs are accepted at once, and the
+    requests above that are refused so the clients retry later instead of piling up.
+    """
+
+    def __init__(
+        self,
+        work_dir=None,
+        workers=None,
+        max_pending=None,
+        max_upload_bytes=DEFAULT_MAX_UPLOAD_MB * 1024**2,
+        keep_seconds=3600,
+    ):
+        """
+        :param work_dir: the folder of the uploads and results, a temporary one by default
+        :param workers: number of worker processes, defaults to the number of CPUs
+        :param max_pending: jobs accepted while all the workers are busy (default: 2 per
+                            worker)
+        :param max_upload_bytes: the largest upload accepted
+        :param keep_seconds: finished jobs and uploads are removed after this time
+        """
+        self.temporary = work_dir is None
+        self.work_dir = work_dir or tempfile.mkdtemp(prefix="duplex_service_")
+        self.upload_dir = os.path.join(self.work_dir, "uploads")
+        self.result_dir = os.path.join(self.work_dir, "results")
+        os.makedirs(self.upload_dir, exist_ok=True)
+        os.makedirs(self.result_dir, exist_ok=True)
+        self.workers = workers or os.cpu_count() or 1
+        max_pending = self.workers * 2 if max_pending is None else max_pending
+        self.capacity = self.workers + max_pending
+        self.max_upload_bytes = max_upload_bytes
+        self.keep_seconds = keep_seconds
+
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.capacity)
+        self.uploads = {}  # upload id -> {"path", "bytes", "created"}
+        self.jobs = {}  # job id -> job record
+        # One thread per worker process waits for its job, so a job is running exactly
+        # while its thread holds it
+        self.processes = ProcessPoolExecutor(max_workers=self.workers)
+        self.dispatcher = ThreadPoolExecutor(max_workers=self.workers)
+
+    def add_upload(self, stream, length):
+        """
+        copy a request body to the upload folder in chunks, so large scans are never held
+        in memory
+        :param stream: the request body
+        :param length: the Content-Length of the request
+        :return: the upload record
+        """
+        if length > self.max_upload_bytes:
+            raise ServiceError(
+                413, f"uploads are limited to {self.max_upload_bytes} bytes"
+            )
+        self.purge()
+        upload_id = secrets.token_hex(8)
+        path = os.path.join(self.upload_dir, f"{upload_id}.pdf")
+        try:
+            with open(path, "wb") as upload_file:
+                remaining = length
+                while remaining:
+                    chunk = stream.read(min(UPLOAD_CHUNK_SIZE, remaining))
+                    if not chunk:
+                        raise ServiceError(400, "the upload ended early")
+                    if remaining == length and not chunk.startswith(b"%PDF"):
+                        raise ServiceError(415, "the upload is not a pdf")
+                    upload_file.write(chunk)
+                    remaining -= len(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+
+        upload = {"upload": upload_id, "bytes": length, "created": time.time()}
+        with self.lock:
+            self.uploads[upload_id] = dict(upload, path=path)
+        return upload
+
+    def submit(self, request):
+        """
+        queue a job, or refuse it when the pool is saturated
+        :param request: dict with 'mode' (see SERVICE_MODES), 'inputs' (upload ids) and the
+                        optional JOB_OPTIONS, the missing ones are off but for JOB_DEFAULTS
+        :return: the job status
+        """
+        mode = request.get("mode")
+        if mode not in SERVICE_MODES:
+            raise ServiceError(400, f"mode must be one of {', '.join(SERVICE_MODES)}")
+        inputs = request.get("inputs")
+        expected = SERVICE_MODES[mode]
+        if (
+            not isinstance(inputs, list)
+            or not inputs
+            or expected not in (None, len(inputs))
+        ):
+            raise ServiceError(400, f"{mode} takes {expected or 'one or more'} uploads")
+        if not all(isinstance(upload, str) for upload in inputs):
+            raise ServiceError(400, "inputs must be a list of upload ids")
+        options = dict(JOB_DEFAULTS)
+        for name, value in request.items():
+            if name in ("mode", "inputs"):
+                continue
+            if name not in JOB_OPTIONS:
+                raise ServiceError(400, f"unknown option: {name}")
+            options[name] = option_value(name, value)
+
+        self.purge()
+        with self.lock:
+            missing = [upload for upload in inputs if upload not in self.uploads]
+            if missing:
+                raise ServiceError(
+                    404, f"unknown uploads: {', '.join(map(str, missing))}"
+                )
+            paths = [self.uploads[upload]["path"] for upload in inputs]
+
+        if not self.slots.acquire(blocking=False):
+            raise ServiceError(429, "all the workers are busy and the queue is full")
+
+        job_id = secrets.token_hex(8)
+        output_dir = os.path.join(self.result_dir, job_id)
+        os.makedirs(output_dir)
+        job = dict(
+            options,
+            job=job_id,
+            mode=mode,
+            inputs=paths,
+            output_dir=output_dir,
+            custom_filename=job_id,
+            output=os.path.join(output_dir, f"{job_id}.pdf"),
+        )
+        with self.lock:
+            self.jobs[job_id] = {
+                "job": job_id,
+                "mode": mode,
+                "inputs": list(inputs),
+                "status": "queued",
+                "created": time.time(),
+                "summary": None,
+            }
+        self.dispatcher.submit(self.execute, job)
+        return self.job_status(job_id)
+
+    def execute(self, job):
+        """dispatcher thread body: run a job in a worker process and record its summary"""
+        record = self.jobs[job["job"]]
+        with self.lock:
+            record.update(status="running", started=time.time())
+        try:
+            summary = self.processes.submit(run_job, job).result()
+        except Exception as e:
+            summary = {"status": "error", "error": f"{type(e).__name__}: {e}"}
+        finally:
+            self.slots.release()
+        with self.lock:
+            record.update(
+                status="done" if summary["status"] == "ok" else "error",
+                finished=time.time(),
+                summary=summary,
+            )
+
+    def job_status(self, job_id):
+        """
+        :return: the public status of a job, without the server paths
+        """
+        with self.lock:
+            record = self.jobs.get(job_id)
+            if record is None:
+                raise ServiceError(404, "unknown job")
+            status = {
+                key: record[key]
+                for key in ("job", "mode", "inputs", "status", "created", "started")
+                if key in record
+            }
+            summary = record["summary"] or {}
+        for key in ("pages", "bytes", "seconds", "error", "alignment"):
+            if key in summary:
+                status[key] = summary[key]
+        if record["status"] == "done":
+            status["result"] = f"/jobs/{job_id}/result"
+        return status
+
+    def queue_status(self):
+        """
+        :return: the queue depth and the number of jobs in each state
+        """
+        with self.lock:
+            states = [record["status"] for record in self.jobs.values()]
+            uploads = len(self.uploads)
+        return {
+            "workers": self.workers,
+            "capacity": self.capacity,
+            "queued": states.count("queued"),
+            "running": states.count("running"),
+            "done": states.count("done"),
+            "error": states.count("error"),
+            "uploads": uploads,
+        }
+
+    def result_path(self, job_id):
+        """
+        :return: the output file of a finished job
+        """
+        with self.lock:
+            record = self.jobs.get(job_id)
+            if record is None:
+                raise ServiceError(404, "unknown job")
+            if record["status"] != "done":
+                raise ServiceError(409, f"the job is {record['status']}")
+            return record["summary"]["output"]
+
+    def uploads_in_use(self):
+        """
+        :return: the ids of the uploads of the queued and running jobs, call with the lock
+        """
+        return {
+            upload
+            for record in self.jobs.values()
+            if record["status"] in ("queued", "running")
+            for upload in record["inputs"]
+        }
+
+    def remove_files(self, job_ids, uploads):
+        """
+        remove the results of jobs and the files of uploads already taken out of the
+        records, ignoring what is already gone
+        :param job_ids: list of job ids
+        :param uploads: list of upload records
+        """
+        for job_id in job_ids:
+            shutil.rmtree(os.path.join(self.result_dir, job_id), ignore_errors=True)
+        for upload in uploads:
+            try:
+                os.remove(upload["path"])
+            except FileNotFoundError:
+                pass
+
+    def delete_job(self, job_id):
+        with self.lock:
+            record = self.jobs.get(job_id)
+            if record is None:
+                raise ServiceError(404, "unknown job")
+            if record["status"] in ("queued", "running"):
+                raise ServiceError(409, f"the job is {record['status']}")
+            del self.jobs[job_id]
+        self.remove_files([job_id], [])
+
+    def delete_upload(self, upload_id):
+        with self.lock:
+            if upload_id not in self.uploads:
+                raise ServiceError(404, "unknown upload")
+            if upload_id in self.uploads_in_use():
+                raise ServiceError(409, "the upload is used by a queued or running job")
+            upload = self.uploads.pop(upload_id)
+        self.remove_files([], [upload])
+
+    def purge(self):
+        """
+        remove the finished jobs and the uploads older than keep_seconds. the records are
+        taken out under the lock, so concurrent requests never purge the same one twice.
+        """
+        limit = time.time() - self.keep_seconds
+        with self.lock:
+            in_use = self.uploads_in_use()
+            jobs = [
+                job_id
+                for job_id, record in self.jobs.items()
+                if record.get("finished", time.time()) < limit
+            ]
+            for job_id in jobs:
+                del self.jobs[job_id]
+            uploads = [
+                self.uploads.pop(upload_id)
+                for upload_id, upload in list(self.uploads.items())
+                if upload["created"] < limit and upload_id not in in_use
+            ]
+        self.remove_files(jobs, uploads)
+
+    def close(self):
+        self.dispatcher.shutdown(wait=False, cancel_futures=True)
+        self.processes.shutdown(wait=False, cancel_futures=True)
+        if self.temporary:
+            shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+class ServiceRequestHandler(BaseHTTPRequestHandler):
+    """
+    the HTTP interface of a JobService, which is the service attribute of the server
+
+    POST /uploads            the body is a pdf, answers its upload id
+    POST /jobs               JSON {"mode": ..., "inputs": [upload ids], options}, 429 when full
+    GET  /jobs/<id>          the status of a job
+    GET  /jobs/<id>/result   the output pdf of a finished job
+    GET  /queue              the queue depth and the number of jobs in each state
+    DELETE /jobs/<id>, DELETE /uploads/<id>
+    """
+
+    server_version = "DuplexScanService/1.0"
+    protocol_version = "HTTP/1.1"
+
+    def send_json(self, status, body, headers=None):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def send_error_json(self, error):
+        headers = {}
+        if error.status == 429:
+            headers["Retry-After"] = "1"
+        if error.status in (400, 411, 413, 415):
+            # The rest of the body may not have been read
+            self.close_connection = True
+            headers["Connection"] = "close"
+        self.send_json(error.status, {"error": str(error)}, headers)
+
+    def content_length(self):
+        length = self.headers.get("Content-Length")
+        if length is None or not length.isdigit():
+            raise ServiceError(411, "Content-Length is required")
+        return int(length)
+
+    def do_POST(self):
+        service = self.server.service
+        try:
+            if self.path == "/uploads":
+                upload = service.add_upload(self.rfile, self.content_length())
+                self.send_json(201, upload)
+            elif self.path == "/jobs":
+                length = self.content_length()
+                if length > 65536:
+                    raise ServiceError(413, "the job request is too large")
+                try:
+                    request = json.loads(self.rfile.read(length))
+                except ValueError:
+                    raise ServiceError(400, "the job request is not JSON")
+                if not isinstance(request, dict):
+                    raise ServiceError(400, "the job request must be a JSON object")
+                self.send_json(202, service.submit(request))
+            else:
+                raise ServiceError(404, "not found")
+        except ServiceError as e:
+            self.send_error_json(e)
+
+    def do_GET(self):
+        service = self.server.service
+        try:
+            match = _JOB_PATH_RE.match(self.path)
+            if self.path == "/queue":
+                self.send_json(200, service.queue_status())
+            elif match and match.group(2):
+                self.send_result(service.result_path(match.group(1)))
+            elif match:
+                self.send_json(200, service.job_status(match.group(1)))
+            else:
+                raise ServiceError(404, "not found")
+        except ServiceError as e:
+            self.send_error_json(e)
+
+    def do_DELETE(self):
+        service = self.server.service
+        try:
+            job_match = _JOB_PATH_RE.match(self.path)
+            upload_match = _UPLOAD_PATH_RE.match(self.path)
+            if job_match and not job_match.group(2):
+                service.delete_job(job_match.group(1))
+            elif upload_match:
+                service.delete_upload(upload_match.group(1))
+            else:
+                raise ServiceError(404, "not found")
+            self.send_json(200, {"deleted": self.path})
+        except ServiceError as e:
+            self.send_error_json(e)
+
+    def send_result(self, path):
+        try:
+            result_file = open(path, "rb")
+        except FileNotFoundError:
+            raise ServiceError(404, "the result is no longer available")
+        with result_file:
+            size = os.fstat(result_file.fileno()).st_size
+            self.send_response(200)
+            self.send_header("Content-Type", "application/pdf")
+            self.send_header("Content-Length", str(size))
+            self.send_header(
+                "Content-Disposition",
+                f'attachment; filename="{os.path.basename(path)}"',
+            )
+            self.end_headers()
+            self.wfile.flush()
+            # The kernel copies the file to the socket, it never goes through Python
+            self.connection.sendfile(result_file)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the collation over HTTP, for the workstations without the GUI."
+    )
+    parser.add_argument(
+        "--host",
+        default="127.0.0.1",
+        help="the address to listen on (default: 127.0.0.1, this computer only)",
+    )
+    parser.add_argument("-p", "--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=None,
+        help="number of worker processes (default: number of CPUs)",
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=None,
+        help="jobs queued while all the workers are busy, more are refused with 429 "
+        "(default: 2 per worker)",
+    )
+    parser.add_argument(
+        "--work-dir",
+        help="folder of the uploads and results (default: a temporary one)",
+    )
+    parser.add_argument(
+        "--max-upload",
+        type=int,
+        default=DEFAULT_MAX_UPLOAD_MB,
+        help=f"largest upload in MB (default: {DEFAULT_MAX_UPLOAD_MB})",
+    )
+    parser.add_argument(
+        "--keep-minutes",
+        type=float,
+        default=60,
+        help="finished jobs and uploads are removed after this time (default: 60)",
+    )
+    args = parser.parse_args(argv)
+
+    service = JobService(
+        work_dir=args.work_dir,
+        workers=args.workers,
+        max_pending=args.max_pending,
+        max_upload_bytes=args.max_upload * 1024**2,
+        keep_seconds=args.keep_minutes * 60,
+    )
+    server = ThreadingHTTPServer((args.host, args.port), ServiceRequestHandler)
+    server.service = service
+    print(f"Listening on http://{args.host}:{server.server_port}", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,530 @@
+import hashlib
+import mmap
+import os
+import re
+import time
+import weakref
+from io import BytesIO
+
+from PyPDF2.generic import (
+    ArrayObject,
+    DictionaryObject,
+    IndirectObject,
+    NameObject,
+    NumberObject,
+    StreamObject,
+)
+
+PDF_HEADER = b"%PDF-1.7\n%\xe2\xe3\xcf\xd3\n"
+
+# Object numbers reserved for the document catalog and the page tree root,
+# both written last because they only depend on the list of pages
+CATALOG_NUMBER = 1
+PAGES_NUMBER = 2
+
+# Keys that point back into the source document rather than down to the page content
+_EXCLUDED_PAGE_KEYS = ("/Parent", "/StructParents")
+_PAGE_TREE_TYPES = ("/Page", "/Pages")
+
+# Placeholder number of an object whose children are still being copied
+_PENDING = 0
+
+_XREF_ENTRY_RE = re.compile(rb"(\d{10}) (\d{5}) ([nf]) \n")
+_STARTXREF_RE = re.compile(rb"startxref\n(\d+)\n%%EOF\n$")
+_OBJECT_HEADER_RE = re.compile(rb"(\d+) 0 obj\n")
+_STREAM_START_RE = re.compile(rb"/Length (\d+)\n>>\nstream\n")
+_KIDS_RE = re.compile(rb"(\d+) 0 R")
+# Literal strings are skipped so that their text is never renumbered
+_REFERENCE_TOKEN_RE = re.compile(rb"\\.|\(|\)|(?<![\d.])(\d+) 0 R(?!\w)")
+
+
+class StreamingPdfWriter:
+    """
+    write a pdf page by page. the objects used by a page are written as soon as the page is
+    added and dropped from the reader cache, so the memory used depends on the largest page,
+    not on the number of pages. objects shared between pages (fonts, color profiles) are
+    written once, and the cross-reference table is written by close().
+    with deduplicate=True, objects with identical content are also written once when they
+    come from different documents or are stored several times in the same document.
+    """
+
+    def __init__(self, output_file, deduplicate=False):
+        """
+        :param output_file: a binary file object opened for writing
+        :param deduplicate: store identical streams and dictionaries only once
+        """
+        self.output_file = output_file
+        self.position = 0
+        self.offsets = {}  # object number -> byte offset
+        self.next_number = PAGES_NUMBER + 1
+        self.parent_number = PAGES_NUMBER  # the page tree node of the pages added
+        self.kids = []
+        # reader -> {(idnum, generation): object number in the output}
+        self.copied = weakref.WeakKeyDictionary()
+        self.page_reader = None
+        self.page_key = None
+        self.page_number = None
+        self.page_resolved = []
+        self.closed = False
+        self.deduplicate = deduplicate
+        self.digests = {}  # content hash -> object number
+        self.deduplicated_objects = 0
+        self.deduplicated_bytes = 0
+        self.start()
+
+    def start(self):
+        """
+        write what comes before the first object
+        """
+        self.write(PDF_HEADER)
+
+    def write(self, data):
+        self.output_file.write(data)
+        self.position += len(data)
+
+    def allocate_number(self):
+        number = self.next_number
+        self.next_number += 1
+        return number
+
+    def add_page(self, page):
+        """
+        copy a page of an open PdfReader, with everything it references
+        :param page: a PageObject read from a PdfReader
+        :return: the object number of the page in the output
+        """
+        reader = page.indirect_reference.pdf
+        self.page_reader = reader
+        self.page_key = (
+            page.indirect_reference.idnum,
+            page.indirect_reference.generation,
+        )
+        self.page_number = self.allocate_number()
+        self.page_resolved = []
+
+        body = BytesIO()
+        body.write(b"<<\n/Parent %d 0 R\n" % self.parent_number)
+        for key, value in dict.items(page):
+            if key in _EXCLUDED_PAGE_KEYS:
+                continue
+            key.write_to_stream(body, None)
+            body.write(b" ")
+            self.serialize(value, body)
+            body.write(b"\n")
+        body.write(b">>")
+        self.write_object(self.page_number, body.getvalue())
+        self.kids.append(self.page_number)
+
+        # The page is on disk: let the reader forget the objects it parsed for it
+        for key in self.page_resolved:
+            reader.resolved_objects.pop(key, None)
+        self.page_resolved = []
+        return self.page_number
+
+    def copy_reference(self, reference):
+        """
+        copy an indirect object and its children, children first
+        :param reference: IndirectObject of the reader of the current page
+        :return: the object number in the output, or None if it must not be copied
+        """
+        reader = reference.pdf
+        copied = self.copied.setdefault(reader, {})
+        key = (reference.idnum, reference.generation)
+        if key in copied:
+            if copied[key] == _PENDING:
+                # A reference cycle: this object keeps its own number
+                copied[key] = self.allocate_number()
+            return copied[key]
+
+        if reader is self.page_reader and key == self.page_key:
+            return self.page_number
+
+        obj = reference.get_object()
+        self.page_resolved.append((reference.generation, reference.idnum))
+        if isinstance(obj, DictionaryObject) and obj.get("/Type") in _PAGE_TREE_TYPES:
+            # Links to other pages would pull in their whole content
+            return None
+
+        if not self.deduplicate:
+            # Allocate before recursing, so reference cycles resolve to this number
+            number = self.allocate_number()
+            copied[key] = number
+            self.write_object(number, *self.serialize_object(obj))
+            return number
+
+        # The children are copied (and deduplicated) first, so two objects with the same
+        # content end up with the same bytes and the same hash
+        copied[key] = _PENDING
+        data, stream_data = self.serialize_object(obj)
+        number = copied[key]
+        if number == _PENDING:
+            digest = hashlib.sha256(data)
+            if stream_data is not None:
+                digest.update(b"stream")
+                digest.update(stream_data)
+            digest = digest.digest()
+            if digest in self.digests:
+                copied[key] = self.digests[digest]
+                self.deduplicated_objects += 1
+                self.deduplicated_bytes += len(data) + len(stream_data or b"")
+                return copied[key]
+            number = self.allocate_number()
+            self.digests[digest] = number
+            copied[key] = number
+        self.write_object(number, data, stream_data)
+        return number
+
+    def serialize_object(self, obj):
+        """
+        serialize a top level object
+        :return: (bytes of the object, stream data or None); the stream data is kept apart
+                 so it is written as is, without another copy
+        """
+        body = BytesIO()
+        if not isinstance(obj, StreamObject):
+            self.serialize(obj, body)
+            return body.getvalue(), None
+
+        data = obj._data
+        body.write(b"<<\n")
+        for key, value in dict.items(obj):
+            if key == "/Length":
+                continue
+            key.write_to_stream(body, None)
+            body.write(b" ")
+            self.serialize(value, body)
+            body.write(b"\n")
+        body.write(b"/Length %d\n>>" % len(data))
+        return body.getvalue(), data
+
+    def serialize(self, value, body):
+        """
+        write a direct value, replacing the indirect references by their copy in the output
+        """
+        if isinstance(value, IndirectObject):
+            number = self.copy_reference(value)
+            body.write(b"null" if number is None else b"%d 0 R" % number)
+        elif isinstance(value, StreamObject):
+            raise ValueError("a stream can't be a direct object")
+        elif isinstance(value, DictionaryObject):
+            body.write(b"<<\n")
+            for key, item in dict.items(value):
+                key.write_to_stream(body, None)
+                body.write(b" ")
+                self.serialize(item, body)
+                body.write(b"\n")
+            body.write(b">>")
+        elif isinstance(value, ArrayObject):
+            body.write(b"[")
+            for item in value:
+                body.write(b" ")
+                self.serialize(item, body)
+            body.write(b" ]")
+        else:
+            value.write_to_stream(body, None)
+
+    def write_object(self, number, data, stream_data=None):
+        self.offsets[number] = self.position
+        self.write(b"%d 0 obj\n" % number)
+        self.write(data)
+        if stream_data is not None:
+            self.write(b"\nstream\n")
+            self.write(stream_data)
+            self.write(b"\nendstream")
+        self.write(b"\nendobj\n")
+
+    def append_written_pdf(self, pdf_path):
+        """
+        append the pages of a pdf previously written by a StreamingPdfWriter, without parsing
+        it: the objects are copied as bytes, only their references are renumbered, and stream
+        data is copied as is. this is what makes combining partial results cheap.
+        :param pdf_path: a pdf written by StreamingPdfWriter
+        :return: the number of pages appended
+        """
+        with open(pdf_path, "rb") as pdf_file, mmap.mmap(
+            pdf_file.fileno(), 0, access=mmap.ACCESS_READ
+        ) as data:
+            if data[: len(PDF_HEADER)] != PDF_HEADER:
+                raise ValueError(f"'{pdf_path}' was not written by StreamingPdfWriter")
+            startxref = _STARTXREF_RE.search(data, len(data) - 64)
+            if not startxref:
+                raise ValueError(f"'{pdf_path}' has no trailing startxref")
+            xref_offset = int(startxref.group(1))
+
+            offsets = {}
+            for number, entry in enumerate(
+                _XREF_ENTRY_RE.finditer(data, xref_offset, len(data))
+            ):
+                if entry.group(3) == b"n":
+                    offsets[number] = int(entry.group(1))
+
+            # Objects 1 and 2 are the catalog and page tree, the rest is renumbered after
+            # the objects already written
+            base = self.next_number - (PAGES_NUMBER + 1)
+            ends = sorted(offsets.values()) + [xref_offset]
+            end_of = dict(zip(ends, ends[1:]))
+
+            def renumber(match):
+                if match.group(1) is None:
+                    return match.group(0)
+                number = int(match.group(1))
+                if number == PAGES_NUMBER:
+                    return match.group(0)
+                return b"%d 0 R" % (number + base)
+
+            def renumber_body(body):
+                # Only references outside literal strings are renumbered
+                depth = 0
+                output = []
+                position = 0
+                for match in _REFERENCE_TOKEN_RE.finditer(body):
+                    token = match.group(0)
+                    if token == b"(":
+                        depth += 1
+                    elif token == b")":
+                        depth = max(0, depth - 1)
+                    elif match.group(1) is not None and depth == 0:
+                        output.append(body[position : match.start()])
+                        output.append(renumber(match))
+                        position = match.end()
+                output.append(body[position:])
+                return b"".join(output)
+
+            kids = []
+            for number in sorted(offsets):
+                start = offsets[number]
+                end = end_of[start]
+                header = _OBJECT_HEADER_RE.match(data, start)
+                if not header or int(header.group(1)) != number:
+                    raise ValueError(f"object {number} of '{pdf_path}' is misplaced")
+                body_end = end - len(b"\nendobj\n")
+
+                if number == PAGES_NUMBER:
+                    page_tree = data[header.end() : body_end]
+                    kids_start = page_tree.index(b"/Kids [") + len(b"/Kids [")
+                    kids_end = page_tree.index(b"]", kids_start)
+                    kids = [
+                        int(kid) + base
+                        for kid in _KIDS_RE.findall(page_tree[kids_start:kids_end])
+                    ]
+                    continue
+                if number == CATALOG_NUMBER:
+                    continue
+
+                stream_start = _STREAM_START_RE.search(data, header.end(), body_end)
+                if stream_start and stream_start.end() + int(
+                    stream_start.group(1)
+                ) == body_end - len(b"\nendstream"):
+                    body = data[header.end() : stream_start.start()]
+                    body += b"/Length %s\n>>" % stream_start.group(1)
+                    stream_data = memoryview(data)[
+                        stream_start.end() : body_end - len(b"\nendstream")
+                    ]
+                    self.write_object(number + base, renumber_body(body), stream_data)
+                    stream_data.release()
+                else:
+                    body = data[header.end() : body_end]
+                    self.write_object(number + base, renumber_body(body))
+
+            self.next_number = max(offsets) + base + 1
+            self.kids.extend(kids)
+            return len(kids)
+
+    def close(self):
+        """
+        write the page tree, the catalog, the cross-reference table and the trailer
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        kids = b" ".join(b"%d 0 R" % number for number in self.kids)
+        self.write_object(
+            PAGES_NUMBER,
+            b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.kids)),
+        )
+        self.write_object(
+            CATALOG_NUMBER, b"<< /Type /Catalog /Pages %d 0 R >>" % PAGES_NUMBER
+        )
+
+        xref_offset = self.position
+        size = self.next_number
+        xref = [b"xref\n0 %d\n0000000000 65535 f \n" % size]
+        for number in range(1, size):
+            if number in self.offsets:
+                xref.append(b"%010d 00000 n \n" % self.offsets[number])
+            else:
+                xref.append(b"0000000000 00000 f \n")
+        self.write(b"".join(xref))
+        self.write(
+            b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (size, CATALOG_NUMBER, xref_offset)
+        )
+
+
+# Trailer entries that describe a cross-reference section rather than the document, and the
+# file identifier, whose second element changes with every update
+_SECTION_TRAILER_KEYS = ("/Size", "/Prev", "/XRefStm", "/ID")
+_LAST_STARTXREF_RE = re.compile(rb"startxref\s+(\d+)\s+%%EOF\s*$")
+
+
+def read_update_base(reader):
+    """
+    read what an incremental update of a pdf needs: its last trailer and its page tree
+    root. the pages and the rest of the objects are not parsed.
+    :param reader: a PdfReader of the pdf
+    :return: dict with the 'xref_offset' of the last cross-reference section, the 'size' of
+             the object numbering, the other 'trailer' entries as bytes, the permanent
+             identifier 'id' of the file (the first element of /ID) as bytes or None, the
+             'pages_number' and 'pages_generation' of the page tree root and its
+             'page_tree' dictionary
+    """
+    if "/Encrypt" in reader.trailer:
+        raise ValueError("pages can't be appended to an encrypted pdf")
+    stream = reader.stream
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(max(0, size - 1024))
+    startxref = _LAST_STARTXREF_RE.search(stream.read())
+    if not startxref:
+        raise ValueError("the pdf doesn't end with startxref and %%EOF")
+    xref_offset = int(startxref.group(1))
+    stream.seek(xref_offset)
+    if not stream.read(64).lstrip().startswith(b"xref"):
+        # An update of a file with cross-reference streams needs one as well
+        raise ValueError("pages can only be appended to a pdf with an xref table")
+
+    trailer = BytesIO()
+    for key, value in dict.items(reader.trailer):
+        if key in _SECTION_TRAILER_KEYS:
+            continue
+        key.write_to_stream(trailer, None)
+        trailer.write(b" ")
+        value.write_to_stream(trailer, None)
+        trailer.write(b"\n")
+
+    permanent_id = None
+    identifier = reader.trailer.get("/ID")
+    if isinstance(identifier, ArrayObject) and identifier:
+        # Identifiers that happen to decode as text are read as TextStringObject
+        element = identifier[0].get_object()
+        element = getattr(element, "original_bytes", element)
+        if isinstance(element, bytes):
+            permanent_id = b"<%s>" % element.hex().encode()
+
+    catalog = reader.trailer["/Root"]
+    pages = catalog.raw_get("/Pages")
+    if not isinstance(pages, IndirectObject):
+        raise ValueError("the page tree root is not an indirect object")
+    # The update is written once the reader is closed, so nothing is left to resolve
+    page_tree = DictionaryObject(pages.get_object())
+    page_tree[NameObject("/Kids")] = ArrayObject(page_tree["/Kids"])
+    page_tree[NameObject("/Count")] = NumberObject(page_tree["/Count"])
+    return {
+        "xref_offset": xref_offset,
+        "size": int(reader.trailer["/Size"]),
+        "trailer": trailer.getvalue(),
+        "id": permanent_id,
+        "pages_number": pages.idnum,
+        "pages_generation": pages.generation,
+        "page_tree": page_tree,
+    }
+
+
+class IncrementalPdfWriter(StreamingPdfWriter):
+    """
+    append pages to an existing pdf as an incremental update: the new pages and their
+    objects, a page tree node holding them and the updated page tree root are written after
+    the existing bytes, then a cross-reference section for these objects only, chained to
+    the previous one. the existing bytes are never rewritten, so the cost depends on the
+    pages added and not on the size of the pdf. a linearized pdf is no longer linearized
+    once updated.
+    """
+
+    def __init__(self, output_file, base, deduplicate=False):
+        """
+        :param output_file: the pdf opened in 'r+b' mode, the update is written at its end
+        :param base: the dict of read_update_base for this pdf
+        :param deduplicate: store identical streams and dictionaries of the new pages once
+        """
+        self.base = base
+        super().__init__(output_file, deduplicate=deduplicate)
+        self.next_number = base["size"]
+        self.parent_number = self.allocate_number()
+
+    def start(self):
+        self.output_file.seek(0, os.SEEK_END)
+        self.position = self.output_file.tell()
+        self.output_file.seek(-1, os.SEEK_END)
+        if self.output_file.read(1) not in b"\r\n":
+            self.write(b"\n")
+
+    def close(self):
+        """
+        write the page tree node of the new pages, the updated root, the cross-reference
+        section of the update and its trailer
+        """
+        if self.closed:
+            return
+        self.closed = True
+
+        base = self.base
+        kids = b" ".join(b"%d 0 R" % number for number in self.kids)
+        self.write_object(
+            self.parent_number,
+            b"<< /Type /Pages /Parent %d %d R /Kids [%s] /Count %d >>"
+            % (
+                base["pages_number"],
+                base["pages_generation"],
+                kids,
+                len(self.kids),
+            ),
+        )
+
+        # The root gains one kid, whatever the number of pages appended
+        page_tree = base["page_tree"]
+        root = DictionaryObject(page_tree)
+        root[NameObject("/Kids")] = ArrayObject(
+            page_tree["/Kids"] + [IndirectObject(self.parent_number, 0, None)]
+        )
+        root[NameObject("/Count")] = NumberObject(page_tree["/Count"] + len(self.kids))
+        body = BytesIO()
+        root.write_to_stream(body, None)
+        root_offset = self.position
+        self.write(b"%d %d obj\n" % (base["pages_number"], base["pages_generation"]))
+        self.write(body.getvalue())
+        self.write(b"\nendobj\n")
+
+        xref_offset = self.position
+        first = base["size"]
+        size = self.next_number
+        xref = [
+            b"xref\n%d 1\n%010d %05d n \n"
+            % (base["pages_number"], root_offset, base["pages_generation"]),
+            b"%d %d\n" % (first, size - first),
+        ]
+        for number in range(first, size):
+            if number in self.offsets:
+                xref.append(b"%010d 00000 n \n" % self.offsets[number])
+            else:
+                xref.append(b"0000000000 00000 f \n")
+        self.write(b"".join(xref))
+
+        # The first element of /ID stays, the second one identifies this version of the file
+        digest = hashlib.md5(
+            b"%s %d %d %d"
+            % (base["id"] or b"", base["xref_offset"], xref_offset, time.time_ns())
+        )
+        update_id = b"<%s>" % digest.hexdigest().encode()
+        self.write(
+            b"trailer\n<<\n/Size %d\n/Prev %d\n%s/ID [%s %s]\n>>\n"
+            b"startxref\n%d\n%%%%EOF\n"
+            % (
+                size,
+                base["xref_offset"],
+                base["trailer"],
+                base["id"] or update_id,
+                update_id,
+                xref_offset,
+            )
+        )
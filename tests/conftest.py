@@ -0,0 +1,42 @@
+import os
+import re
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmark import write_synthetic_pdf  # noqa: E402
+
+
+@pytest.fixture
+def make_pdf(tmp_path):
+    """
+    write a synthetic scan in the test folder
+    :return: callable(name, page_numbers, image_kb=0) returning the path of the pdf
+    """
+
+    def make(name, page_numbers, image_kb=0):
+        path = str(tmp_path / name)
+        write_synthetic_pdf(path, list(page_numbers), image_kb=image_kb)
+        return path
+
+    return make
+
+
+@pytest.fixture
+def page_numbers():
+    """
+    read back the numbers written on the pages by write_synthetic_pdf
+    :return: callable(path) returning the list of page numbers in file order
+    """
+    from PyPDF2 import PdfReader
+
+    def read(path):
+        pdf_reader = PdfReader(path)
+        return [
+            int(re.search(rb"\(Page (\d+)\)", page.get_contents().get_data()).group(1))
+            for page in pdf_reader.pages
+        ]
+
+    return read
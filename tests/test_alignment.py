@@ -0,0 +1,110 @@
+import zlib
+
+import pytest
+from PyPDF2.generic import NullObject
+
+import cli
+from page_images import decode_image
+
+pytest.importorskip("numpy")
+
+CORRUPT_IMAGES = {
+    "not_zlib": (b"/Filter /FlateDecode", b"this is not zlib data"),
+    "truncated": (b"", b"\x80" * 100),
+    "null_parameters": (
+        b"/Filter /FlateDecode /DecodeParms null",
+        zlib.compress(b"\x80" * 64 * 64),
+    ),
+}
+
+
+def image(name):
+    """
+    :return: the dict of extract_page_image for one of CORRUPT_IMAGES
+    """
+    entries, data = CORRUPT_IMAGES[name]
+    return {
+        "data": data,
+        "filter": "/FlateDecode" if entries else None,
+        # What PyPDF2 reads for /DecodeParms null
+        "parameters": NullObject() if name == "null_parameters" else None,
+        "width": 64,
+        "height": 64,
+        "bits": 8,
+        "components": 1,
+        "inverted": False,
+    }
+
+
+@pytest.mark.parametrize("name", sorted(CORRUPT_IMAGES))
+def test_corrupt_images_are_not_decoded(name):
+    assert decode_image(image(name)) is None
+
+
+def write_scan(path, images):
+    """
+    write a scan whose pages each hold one 64x64 gray image
+    :param images: list of (extra dictionary entries, stream data), one per page
+    """
+    offsets = {}
+    with open(path, "wb") as pdf_file:
+
+        def write_object(number, data):
+            offsets[number] = pdf_file.tell()
+            pdf_file.write(b"%d 0 obj\n" % number + data + b"\nendobj\n")
+
+        pdf_file.write(b"%PDF-1.4\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        content = b"q 612 0 0 792 0 0 cm /Im0 Do Q"
+        write_object(
+            3, b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream"
+        )
+        kids = []
+        number = 4
+        for entries, data in images:
+            write_object(
+                number,
+                b"<< /Type /XObject /Subtype /Image /Width 64 /Height 64 "
+                b"/ColorSpace /DeviceGray /BitsPerComponent 8 %s /Length %d >>\n"
+                b"stream\n" % (entries, len(data)) + data + b"\nendstream",
+            )
+            write_object(
+                number + 1,
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                b"/Resources << /XObject << /Im0 %d 0 R >> >> /Contents 3 0 R >>"
+                % number,
+            )
+            kids.append(number + 1)
+            number += 2
+        write_object(
+            2,
+            b"<< /Type /Pages /Kids [%s] /Count %d >>"
+            % (b" ".join(b"%d 0 R" % kid for kid in kids), len(kids)),
+        )
+        xref_offset = pdf_file.tell()
+        pdf_file.write(b"xref\n0 %d\n0000000000 65535 f \n" % number)
+        for object_number in range(1, number):
+            pdf_file.write(b"%010d 00000 n \n" % offsets[object_number])
+        pdf_file.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (number, xref_offset)
+        )
+
+
+def test_corrupt_images_dont_fail_the_job(tmp_path):
+    scan = str(tmp_path / "scan.pdf")
+    good = (b"", b"\xff" * 64 * 64)
+    write_scan(scan, [good] + [CORRUPT_IMAGES[name] for name in sorted(CORRUPT_IMAGES)])
+
+    summary = cli.run_job(
+        {
+            "mode": "organize",
+            "inputs": [scan],
+            "output_dir": str(tmp_path / "out"),
+            "verify": True,
+        }
+    )
+
+    assert summary["status"] == "ok", summary.get("error")
+    assert summary["pages"] == 4
+    assert isinstance(summary["alignment"], list)
@@ -0,0 +1,63 @@
+import os
+
+from PyPDF2 import PdfReader
+
+from result_cache import ResultCache
+from scan_tools import append_pages, get_total_pages, organize_scan_pdf
+
+
+def test_append_after_a_cache_hit_keeps_the_cache_entry(tmp_path, make_pdf):
+    scan = make_pdf("scan.pdf", [1, 3, 5, 7, 9, 8, 6, 4, 2])
+    late = make_pdf("late.pdf", [10, 11, 12, 13, 14])
+    cache = ResultCache(str(tmp_path / "cache"))
+
+    first = organize_scan_pdf(scan, output_dir=str(tmp_path / "first"), cache=cache)
+    output = organize_scan_pdf(scan, output_dir=str(tmp_path / "second"), cache=cache)
+    assert cache.stats()["hits"] == 1
+
+    assert append_pages(output, [late]) == 5
+
+    assert get_total_pages(output) == 14
+    assert os.stat(output).st_nlink == 1
+    again = organize_scan_pdf(scan, output_dir=str(tmp_path / "third"), cache=cache)
+    assert cache.stats()["hits"] == 2
+    assert get_total_pages(again) == 9
+    assert get_total_pages(first) == 9
+
+
+def id_bytes(element):
+    # PyPDF2 reads the identifiers that happen to decode as text as TextStringObject
+    return getattr(element, "original_bytes", element)
+
+
+def test_append_keeps_the_permanent_id_and_writes_a_new_one(tmp_path, make_pdf):
+    pdf_path = make_pdf("archive.pdf", [1, 2])
+    with open(pdf_path, "rb") as pdf_file:
+        data = pdf_file.read()
+    original = b"0123456789abcdef0123456789abcdef"
+    with open(pdf_path, "wb") as pdf_file:
+        pdf_file.write(
+            data.replace(
+                b"/Root 1 0 R", b"/Root 1 0 R /ID [<%s> <%s>]" % (original, original)
+            )
+        )
+    late = make_pdf("late.pdf", [3])
+
+    identifiers = []
+    for _ in range(2):
+        append_pages(pdf_path, [late])
+        identifier = PdfReader(pdf_path).trailer["/ID"]
+        identifiers.append(id_bytes(identifier[1]).hex())
+        assert id_bytes(identifier[0]).hex() == original.decode()
+
+    assert original.decode() not in identifiers
+    assert identifiers[0] != identifiers[1]
+    assert get_total_pages(pdf_path) == 4
+
+
+def test_append_gives_an_id_to_a_file_without_one(tmp_path, make_pdf):
+    pdf_path = make_pdf("archive.pdf", [1, 2])
+
+    append_pages(pdf_path, [make_pdf("late.pdf", [3])])
+
+    assert len(PdfReader(pdf_path).trailer["/ID"]) == 2
@@ -0,0 +1,54 @@
+import pytest
+
+from scan_tools import merge_batches_after_scan, multi_batch_page_order
+
+
+def test_stack_order():
+    # Sources 0-1 are the odd batches, 2-3 the even batches
+    assert multi_batch_page_order([3, 2], [3, 2], "stack") == [
+        (0, 0), (3, 1), (0, 1), (3, 0), (0, 2), (2, 2),
+        (1, 0), (2, 1), (1, 1), (2, 0),
+    ]  # fmt: skip
+
+
+def test_per_batch_order():
+    assert multi_batch_page_order([3, 2], [3, 2], "per_batch") == [
+        (0, 0), (2, 2), (0, 1), (2, 1), (0, 2), (2, 0),
+        (1, 0), (3, 1), (1, 1), (3, 0),
+    ]  # fmt: skip
+
+
+def test_more_even_pages_than_odd_pages():
+    with pytest.raises(ValueError, match="4 even pages for only 3 odd pages"):
+        multi_batch_page_order([2, 1], [2, 2])
+
+
+@pytest.mark.parametrize(
+    "even_order, even_batches",
+    [
+        # The whole even stack was flipped at once, the last page comes first
+        ("stack", [[10, 8, 6], [4, 2]]),
+        # Each batch was flipped on its own, it holds the backs of its odd batch
+        ("per_batch", [[6, 4, 2], [10, 8]]),
+    ],
+)
+def test_merged_batches(tmp_path, make_pdf, page_numbers, even_order, even_batches):
+    odd = [make_pdf("odd_1.pdf", [1, 3, 5]), make_pdf("odd_2.pdf", [7, 9])]
+    even = [
+        make_pdf(f"even_{index}.pdf", pages)
+        for index, pages in enumerate(even_batches, start=1)
+    ]
+
+    output = merge_batches_after_scan(
+        odd, even, output_dir=str(tmp_path / "out"), even_order=even_order
+    )
+
+    assert page_numbers(output) == list(range(1, 11))
+
+
+def test_merged_batches_refuse_extra_even_pages(tmp_path, make_pdf):
+    odd = [make_pdf("odd.pdf", [1, 3])]
+    even = [make_pdf("even.pdf", [6, 4, 2])]
+
+    with pytest.raises(ValueError, match="3 even pages for only 2 odd pages"):
+        merge_batches_after_scan(odd, even, output_dir=str(tmp_path / "out"))
@@ -0,0 +1,29 @@
+import json
+import os
+
+import cli
+
+
+def run_cli(capsys, argv):
+    """
+    :return: (exit status, list of the job summaries printed)
+    """
+    status = cli.main(argv)
+    lines = capsys.readouterr().out.splitlines()
+    return status, [json.loads(line) for line in lines if line.startswith("{")]
+
+
+def test_same_input_names_get_their_own_outputs(tmp_path, make_pdf, capsys):
+    os.makedirs(tmp_path / "a")
+    os.makedirs(tmp_path / "b")
+    inputs = [make_pdf("a/scan.pdf", [1, 3, 4, 2]), make_pdf("b/scan.pdf", [1, 2])]
+    output_dir = str(tmp_path / "out")
+
+    status, summaries = run_cli(
+        capsys, ["organize", *inputs, "-d", output_dir, "-w", "2"]
+    )
+
+    assert status == 0
+    outputs = {summary["output"] for summary in summaries}
+    assert len(outputs) == 2
+    assert sorted(os.listdir(output_dir)) == sorted(map(os.path.basename, outputs))
@@ -0,0 +1,38 @@
+import itertools
+
+import pytest
+
+import cli
+from benchmark import open_descriptors
+
+pytestmark = pytest.mark.skipif(
+    open_descriptors() is None, reason="needs /proc/self/fd"
+)
+
+
+def test_thousands_of_jobs_keep_the_descriptor_count(tmp_path, make_pdf):
+    scan = make_pdf("scan.pdf", [1, 3, 5, 6, 4, 2])
+    odd = make_pdf("scan_odd.pdf", [1, 3, 5])
+    even = make_pdf("scan_even.pdf", [6, 4, 2])
+    templates = itertools.cycle(
+        [
+            {"mode": "organize", "inputs": [scan]},
+            {"mode": "organize", "inputs": [scan], "streaming": True},
+            {"mode": "merge2", "inputs": [odd, even]},
+            {"mode": "merge", "inputs": [odd, even], "output": ""},
+        ]
+    )
+    jobs = []
+    for job_id in range(1, 2001):
+        job = dict(next(templates), job=job_id, output_dir=str(tmp_path / "out"))
+        if job["mode"] == "merge":
+            job["output"] = str(tmp_path / "out" / f"merged_{job_id}.pdf")
+        jobs.append(job)
+
+    # Warm up the imports and caches that open files once
+    list(cli.run_jobs(jobs[:4], workers=1))
+    before = open_descriptors()
+    summaries = list(cli.run_jobs(jobs[4:], workers=1))
+
+    assert all(summary["status"] == "ok" for summary in summaries)
+    assert open_descriptors() == before
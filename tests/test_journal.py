@@ -0,0 +1,91 @@
+import json
+import os
+
+import cli
+from journal import BatchJournal, job_key, job_partial_outputs, plan_job_outputs
+
+
+def run_cli(capsys, argv):
+    status = cli.main(argv)
+    lines = capsys.readouterr().out.splitlines()
+    return status, [json.loads(line) for line in lines if line.startswith("{")]
+
+
+def test_journaled_batch_keeps_inputs_and_reports_missing_ones(
+    tmp_path, make_pdf, monkeypatch, capsys
+):
+    monkeypatch.chdir(tmp_path)
+    contract = make_pdf("reversed_contract.pdf", [1, 3, 4, 2])
+    argv = ["organize", "-d", "out", "-w", "1", "--journal", "batch.jsonl"]
+
+    status, summaries = run_cli(capsys, argv + [contract, "missing.pdf"])
+
+    assert status == 1
+    assert os.path.exists(contract)
+    statuses = {summary["inputs"][0]: summary for summary in summaries}
+    assert statuses[contract]["status"] == "ok"
+    assert "FileNotFoundError" in statuses["missing.pdf"]["error"]
+
+    # The next run skips the job done and still leaves the input alone
+    status, summaries = run_cli(capsys, argv + [contract])
+
+    assert status == 0
+    assert summaries[0]["journal"] == "skipped"
+    assert os.path.exists(contract)
+
+
+def test_resume_removes_only_the_partial_files_of_the_interrupted_job(
+    tmp_path, make_pdf, monkeypatch, capsys
+):
+    monkeypatch.chdir(tmp_path)
+    scan = make_pdf("scan.pdf", [1, 3, 4, 2])
+    argv = ["organize", scan, "-d", "out", "-w", "1", "--journal", "batch.jsonl"]
+
+    # A crash left the job started, with its partial output
+    args = cli.build_parser().parse_args(argv)
+    job = cli.build_jobs(args)[0][0]
+    journal = BatchJournal("batch.jsonl")
+    planned = plan_job_outputs(job)
+    journal.record(job_key(job), "started", **job_partial_outputs(planned))
+    journal.close()
+    interrupted = os.path.join("out", planned["custom_filename"] + ".pdf.part")
+    # Files of other jobs writing to the same folder right now
+    others = [
+        os.path.join("out", "scan2_scanned_10-00-00_abcd.pdf.part"),
+        os.path.join("out", "scan_scanned_10-00-00_abcd.pdf.part"),
+    ]
+    for path in [interrupted] + others:
+        with open(path, "wb") as partial_file:
+            partial_file.write(b"%PDF-1.4\n")
+    os.makedirs(os.path.join("out", ".merge_live"))
+
+    status, summaries = run_cli(capsys, argv)
+
+    assert status == 0
+    assert summaries[0]["status"] == "ok"
+    assert not os.path.exists(interrupted)
+    assert all(os.path.exists(path) for path in others)
+    assert os.path.isdir(os.path.join("out", ".merge_live"))
+
+
+def test_interrupted_parallel_merge_removes_its_own_work_folder(
+    tmp_path, make_pdf, monkeypatch, capsys
+):
+    monkeypatch.chdir(tmp_path)
+    parts = [make_pdf(f"part_{index}.pdf", [index]) for index in range(1, 5)]
+    argv = ["merge", *parts, "-o", "merged.pdf", "--parallel", "--journal", "j.jsonl"]
+
+    args = cli.build_parser().parse_args(argv)
+    job = cli.build_jobs(args)[0][0]
+    journal = BatchJournal("j.jsonl")
+    planned = plan_job_outputs(job)
+    journal.record(job_key(job), "started", **job_partial_outputs(planned))
+    journal.close()
+    os.makedirs(planned["work_dir"])
+    os.makedirs(".merge_live")
+
+    status, summaries = run_cli(capsys, argv)
+
+    assert status == 0
+    assert not os.path.exists(planned["work_dir"])
+    assert os.path.isdir(".merge_live")
@@ -0,0 +1,48 @@
+import pytest
+
+from linearize import check_linearization
+from scan_tools import get_total_pages, merge_pdfs, organize_scan_pdf
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_organized_output_is_linearized(tmp_path, make_pdf, streaming):
+    scan = make_pdf("scan.pdf", [1, 3, 5, 7, 8, 6, 4, 2], image_kb=8)
+
+    output = organize_scan_pdf(
+        scan, output_dir=str(tmp_path / "out"), streaming=streaming, linearize=True
+    )
+
+    assert check_linearization(output) == []
+    assert get_total_pages(output) == 8
+
+
+def test_merged_output_is_linearized(tmp_path, make_pdf):
+    parts = [make_pdf(f"part_{index}.pdf", range(1, 4)) for index in range(3)]
+    output = str(tmp_path / "merged.pdf")
+
+    merge_pdfs(parts, output, linearize=True)
+
+    assert check_linearization(output) == []
+
+
+def test_moved_bytes_are_reported(tmp_path, make_pdf):
+    scan = make_pdf("scan.pdf", [1, 3, 4, 2])
+    output = organize_scan_pdf(scan, output_dir=str(tmp_path / "out"), linearize=True)
+    with open(output, "rb") as pdf_file:
+        data = pdf_file.read()
+    # One more byte before the first page objects shifts every offset after it
+    position = data.index(b"endobj") + len(b"endobj")
+    with open(output, "wb") as pdf_file:
+        pdf_file.write(data[:position] + b"\n" + data[position:])
+
+    assert check_linearization(output) != []
+
+
+def test_plain_output_has_no_linearization_dictionary(tmp_path, make_pdf):
+    scan = make_pdf("scan.pdf", [1, 3, 4, 2])
+
+    output = organize_scan_pdf(scan, output_dir=str(tmp_path / "out"))
+
+    assert check_linearization(output) == [
+        "no linearization dictionary in the first 1024 bytes"
+    ]
@@ -0,0 +1,54 @@
+import os
+
+from PyPDF2 import PdfReader
+
+from page_images import collect_images, page_resources
+from scan_tools import merge_pdfs, merge_pdfs_parallel
+
+
+def page_contents(path):
+    """
+    :return: for each page, its content stream and the data of its images
+    """
+    contents = []
+    for page in PdfReader(path).pages:
+        images = []
+        collect_images(page_resources(page), images)
+        contents.append(
+            (page.get_contents().get_data(), [image.get_data() for image in images])
+        )
+    return contents
+
+
+def test_deduplicated_merge_is_smaller_with_the_same_pages(tmp_path, make_pdf):
+    scan = make_pdf("scan.pdf", range(1, 6), image_kb=16)
+    plain = str(tmp_path / "plain.pdf")
+    deduplicated = str(tmp_path / "deduplicated.pdf")
+
+    merge_pdfs([scan] * 4, plain, streaming=True)
+    merge_pdfs([scan] * 4, deduplicated, deduplicate=True)
+
+    # The images of the 3 copies are stored once
+    assert os.path.getsize(deduplicated) < os.path.getsize(plain) / 2
+    assert page_contents(deduplicated) == page_contents(plain)
+    assert len(page_contents(deduplicated)) == 20
+
+
+def test_parallel_merge_keeps_the_page_order(tmp_path, make_pdf, page_numbers):
+    parts = [
+        make_pdf(f"part_{index:02d}.pdf", range(index * 3 + 1, index * 3 + 4))
+        for index in range(12)
+    ]
+    serial = str(tmp_path / "serial.pdf")
+    parallel = str(tmp_path / "parallel.pdf")
+
+    merge_pdfs(parts, serial)
+    # Chunks of 2: 12 inputs -> 6 -> 3 -> 2 -> 1, three levels of byte splicing
+    merge_pdfs_parallel(parts, parallel, workers=4, fan_in=2)
+
+    assert page_numbers(parallel) == page_numbers(serial) == list(range(1, 37))
+    assert page_contents(parallel) == page_contents(serial)
+    # The work folder of the partial results is gone
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [os.path.basename(path) for path in parts] + ["serial.pdf", "parallel.pdf"]
+    )
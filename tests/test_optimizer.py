@@ -0,0 +1,30 @@
+import pytest
+
+import scan_tools
+
+pytest.importorskip("PIL")
+
+
+@pytest.mark.parametrize("streaming", [False, True])
+def test_every_image_is_recompressed(tmp_path, make_pdf, monkeypatch, streaming):
+    scan = make_pdf("scan.pdf", range(1, 41), image_kb=64)
+    reports = []
+    monkeypatch.setattr(
+        scan_tools,
+        "report_optimization",
+        lambda report, output_filename, seconds: reports.append(report),
+    )
+
+    with scan_tools.open_pdf(scan) as pdf_reader:
+        scan_tools.write_collated_pages(
+            [pdf_reader],
+            [(0, page) for page in range(40)],
+            str(tmp_path / "out.pdf"),
+            streaming=streaming,
+            optimize=True,
+            image_dpi=10,
+        )
+
+    # The streaming writer frees the pages as it goes, the images must not be mistaken
+    # for ones already optimized
+    assert reports[0]["images"] == 40
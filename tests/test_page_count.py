@@ -0,0 +1,45 @@
+from scan_tools import get_total_pages, read_page_count_from_trailer
+
+
+def test_direct_count(make_pdf):
+    path = make_pdf("scan.pdf", range(1, 8))
+    assert read_page_count_from_trailer(path) == 7
+    assert get_total_pages(path) == 7
+
+
+def test_indirect_count_falls_back_to_the_reader(tmp_path):
+    # The page tree root holds /Count 15 0 R, only the real parser can resolve it
+    path = str(tmp_path / "indirect.pdf")
+    offsets = {}
+    kids = [3 + index for index in range(12)]
+    with open(path, "wb") as pdf_file:
+
+        def write_object(number, data):
+            offsets[number] = pdf_file.tell()
+            pdf_file.write(b"%d 0 obj\n" % number + data + b"\nendobj\n")
+
+        pdf_file.write(b"%PDF-1.4\n")
+        write_object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        write_object(
+            2,
+            b"<< /Type /Pages /Kids [%s] /Count 15 0 R >>"
+            % b" ".join(b"%d 0 R" % kid for kid in kids),
+        )
+        for kid in kids:
+            write_object(
+                kid,
+                b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents 16 0 R >>",
+            )
+        write_object(15, b"12")
+        write_object(16, b"<< /Length 0 >>\nstream\n\nendstream")
+        size = 17
+        xref_offset = pdf_file.tell()
+        pdf_file.write(b"xref\n0 %d\n0000000000 65535 f \n" % size)
+        for number in range(1, size):
+            pdf_file.write(b"%010d 00000 n \n" % offsets[number])
+        pdf_file.write(
+            b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n"
+            % (size, xref_offset)
+        )
+
+    assert get_total_pages(path) == 12
@@ -0,0 +1,69 @@
+import pytest
+
+from scan_tools import (
+    duplex_page_order,
+    interleave_page_order,
+    merge_2_pdfs_after_scan,
+    organize_scan_pdf,
+)
+
+
+@pytest.mark.parametrize(
+    "total_pages, expected",
+    [
+        (1, [0]),
+        (2, [0, 1]),
+        (6, [0, 5, 1, 4, 2, 3]),
+        (7, [0, 6, 1, 5, 2, 4, 3]),
+    ],
+)
+def test_duplex_page_order(total_pages, expected):
+    assert duplex_page_order(total_pages) == expected
+
+
+@pytest.mark.parametrize(
+    "odd_count, even_count, expected",
+    [
+        (3, 3, [(0, 0), (1, 2), (0, 1), (1, 1), (0, 2), (1, 0)]),
+        (3, 2, [(0, 0), (1, 1), (0, 1), (1, 0), (0, 2)]),
+        (1, 0, [(0, 0)]),
+    ],
+)
+def test_interleave_page_order(odd_count, even_count, expected):
+    assert interleave_page_order(odd_count, even_count) == expected
+
+
+@pytest.mark.parametrize(
+    "scan, expected",
+    [
+        # The even pages were scanned after flipping the stack, last one first
+        ([1, 3, 5, 6, 4, 2], [1, 2, 3, 4, 5, 6]),
+        # The last sheet has no back side, its front must not be repeated
+        ([1, 3, 5, 7, 6, 4, 2], [1, 2, 3, 4, 5, 6, 7]),
+    ],
+)
+def test_organized_pages(tmp_path, make_pdf, page_numbers, scan, expected):
+    output = organize_scan_pdf(
+        make_pdf("scan.pdf", scan), output_dir=str(tmp_path / "out")
+    )
+
+    assert page_numbers(output) == expected
+
+
+@pytest.mark.parametrize(
+    "odd, even, expected",
+    [
+        ([1, 3, 5], [6, 4, 2], [1, 2, 3, 4, 5, 6]),
+        ([1, 3, 5, 7], [6, 4, 2], [1, 2, 3, 4, 5, 6, 7]),
+    ],
+)
+def test_merged_odd_and_even_pages(
+    tmp_path, make_pdf, page_numbers, odd, even, expected
+):
+    output = merge_2_pdfs_after_scan(
+        make_pdf("odd.pdf", odd),
+        make_pdf("even.pdf", even),
+        output_dir=str(tmp_path / "out"),
+    )
+
+    assert page_numbers(output) == expected
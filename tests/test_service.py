@@ -0,0 +1,138 @@
+import http.client
+import json
+import os
+import threading
+import time
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+import page_images
+from scan_tools import get_total_pages
+from service import JobService, ServiceRequestHandler
+
+
+@pytest.fixture
+def service(tmp_path):
+    """
+    a job service on a free port of localhost, with one worker and no queue
+    :return: (JobService, port)
+    """
+    job_service = JobService(
+        work_dir=str(tmp_path / "service"), workers=1, max_pending=0
+    )
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ServiceRequestHandler)
+    server.service = job_service
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield job_service, server.server_port
+    server.shutdown()
+    server.server_close()
+    job_service.close()
+
+
+def request(port, method, path, body=None):
+    """
+    :return: (status, body), the body decoded when it is JSON
+    """
+    connection = http.client.HTTPConnection("127.0.0.1", port, timeout=30)
+    try:
+        if isinstance(body, (dict, list)):
+            body = json.dumps(body).encode()
+        connection.request(method, path, body=body)
+        response = connection.getresponse()
+        data = response.read()
+        if response.getheader("Content-Type") == "application/json":
+            data = json.loads(data)
+        return response.status, data
+    finally:
+        connection.close()
+
+
+def upload(port, path):
+    with open(path, "rb") as pdf_file:
+        status, body = request(port, "POST", "/uploads", pdf_file.read())
+    assert status == 201
+    return body["upload"]
+
+
+def test_upload_submit_backpressure_and_result(service, make_pdf, tmp_path):
+    job_service, port = service
+    small = upload(port, make_pdf("small.pdf", [1, 3, 4, 2]))
+    # Large enough to keep the only worker busy while the next job is submitted
+    large = upload(port, make_pdf("large.pdf", range(1, 401), image_kb=16))
+
+    status, job = request(
+        port, "POST", "/jobs", {"mode": "organize", "inputs": [large]}
+    )
+    assert status == 202
+    status, body = request(
+        port, "POST", "/jobs", {"mode": "organize", "inputs": [small]}
+    )
+    assert status == 429
+    status, body = request(port, "DELETE", f"/uploads/{large}")
+    assert status == 409
+
+    deadline = time.monotonic() + 60
+    while job["status"] in ("queued", "running") and time.monotonic() < deadline:
+        time.sleep(0.05)
+        status, job = request(port, "GET", f"/jobs/{job['job']}")
+    assert job["status"] == "done"
+    if page_images.numpy is not None:
+        # The alignment is checked by default, as in the CLI
+        assert "alignment" in job
+
+    status, data = request(port, "GET", job["result"])
+    assert status == 200
+    result = tmp_path / "result.pdf"
+    result.write_bytes(data)
+    assert get_total_pages(str(result)) == 400
+
+    os.remove(job_service.result_path(job["job"]))
+    status, body = request(port, "GET", job["result"])
+    assert status == 404
+
+
+@pytest.mark.parametrize(
+    "job",
+    [
+        {"mode": "organize", "inputs": [["nested"]]},
+        {"mode": "organize", "inputs": [{"id": 1}]},
+        {"mode": "organize", "inputs": [1]},
+        {"mode": "organize", "inputs": ["0"], "streaming": "false"},
+        {"mode": "organize", "inputs": ["0"], "verify": 0},
+        {"mode": "organize", "inputs": ["0"], "image_dpi": "150"},
+    ],
+)
+def test_invalid_jobs_are_refused(service, job):
+    _, port = service
+    status, body = request(port, "POST", "/jobs", job)
+    assert status == 400
+    assert "error" in body
+
+
+def test_concurrent_purges_remove_each_record_once(service, make_pdf):
+    job_service, port = service
+    uploads = [
+        upload(port, make_pdf(f"scan_{index}.pdf", [1, 2])) for index in range(20)
+    ]
+    # One of the files is already gone
+    os.remove(job_service.uploads[uploads[0]]["path"])
+    job_service.keep_seconds = -1
+    errors = []
+
+    def purge():
+        try:
+            job_service.purge()
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=purge) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert errors == []
+    assert job_service.uploads == {}
+    assert os.listdir(job_service.upload_dir) == []
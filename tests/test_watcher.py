@@ -0,0 +1,55 @@
+import json
+import os
+
+import watcher
+from watcher import HotFolderWatcher
+
+
+def settle(hot_folder, paths):
+    """
+    :return: the jobs made of the paths once they are stable
+    """
+    hot_folder.add_candidates(paths)
+    hot_folder.collect_stable_files()
+    hot_folder.collect_stable_files()
+    return list(hot_folder.next_jobs())
+
+
+def test_removed_and_changed_files_are_forgotten(tmp_path, make_pdf, monkeypatch):
+    monkeypatch.setattr(watcher, "PRUNE_INTERVAL", 0.0)
+    hot_folder = HotFolderWatcher(str(tmp_path), settle_seconds=0)
+    removed = make_pdf("removed.pdf", [1, 2])
+    changed = make_pdf("changed.pdf", [1, 2])
+    kept = make_pdf("kept.pdf", [1, 2])
+
+    assert len(settle(hot_folder, [removed, changed, kept])) == 3
+    os.remove(removed)
+    make_pdf("changed.pdf", [1, 2, 3])
+    hot_folder.prune_processed()
+
+    assert list(hot_folder.processed) == [kept]
+    # The new version of a file is processed again
+    assert settle(hot_folder, [changed])[0]["inputs"] == [changed]
+
+
+def test_unpaired_files_are_reported_and_dropped(tmp_path, make_pdf, capsys):
+    hot_folder = HotFolderWatcher(
+        str(tmp_path), mode="merge2", settle_seconds=0, unpaired_seconds=3600
+    )
+    odd = make_pdf("a_odd.pdf", [1, 3])
+    lonely = make_pdf("b_odd.pdf", [1, 3])
+
+    assert settle(hot_folder, [odd, lonely]) == []
+    assert sorted(hot_folder.ready) == [odd, lonely]
+
+    # The partner of one of them arrives, the other one waits too long
+    even = make_pdf("a_even.pdf", [4, 2])
+    hot_folder.unpaired_seconds = 0
+    jobs = settle(hot_folder, [even])
+
+    assert [job["inputs"] for job in jobs] == [[odd, even]]
+    assert hot_folder.ready == []
+    assert hot_folder.ready_since == {}
+    summary = json.loads(capsys.readouterr().out)
+    assert summary["inputs"] == [lonely]
+    assert summary["status"] == "error"
@@ -0,0 +1,132 @@
+import threading
+from collections import OrderedDict
+
+from page_images import decode_image, extract_page_image, numpy, require_numpy, shrink
+from scan_tools import preload_pdf
+
+# The box a thumbnail fits in, in pixels
+THUMBNAIL_SIZE = (96, 128)
+
+# The thumbnails kept in memory, about 12 KB each at the default size
+THUMBNAIL_CACHE_BYTES = 32 * 1024**2
+
+
+def thumbnail_pgm(gray, size=THUMBNAIL_SIZE, rotation=0):
+    """
+    shrink a page image into a box and encode it as a binary PGM, a format Tk reads without
+    Pillow
+    :param gray: 2D uint8 array from decode_image
+    :param size: (width, height) of the box
+    :param rotation: the /Rotate of the page, in degrees clockwise
+    :return: the PGM bytes
+    """
+    if rotation % 360:
+        gray = numpy.rot90(gray, -(rotation // 90))
+    height, width = gray.shape
+    scale = min(size[0] / width, size[1] / height)
+    thumbnail_width = max(1, round(width * scale))
+    thumbnail_height = max(1, round(height * scale))
+    small = shrink(gray, thumbnail_width, thumbnail_height)
+    if small is None:
+        # Tiny images are enlarged instead
+        rows = numpy.arange(thumbnail_height) * height // thumbnail_height
+        columns = numpy.arange(thumbnail_width) * width // thumbnail_width
+        small = gray[rows][:, columns]
+    header = f"P5 {thumbnail_width} {thumbnail_height} 255\n".encode()
+    return header + numpy.asarray(small, numpy.uint8).tobytes()
+
+
+class ThumbnailRenderer:
+    """
+    render the thumbnails of pdf pages from their scan image. the renderer opens its own
+    reader of each file, shared by the calling threads: a page is read under the lock of its
+    file and decoded outside of it. the thumbnails are kept in a LRU cache bounded by
+    max_bytes, so scrolling back over a long scan doesn't decode the pages again.
+    """
+
+    def __init__(self, size=THUMBNAIL_SIZE, max_bytes=THUMBNAIL_CACHE_BYTES):
+        """
+        :param size: (width, height) of the box the thumbnails fit in
+        :param max_bytes: the size above which the least recently used thumbnails are dropped
+        """
+        require_numpy()
+        self.size = size
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.cache = OrderedDict()  # (path, page index) -> PGM bytes
+        self.cache_bytes = 0
+        self.files = {}  # path -> {"lock", "reader", "close", "closed"}
+
+    def cached(self, path, page_index):
+        """
+        :return: the PGM bytes of a thumbnail already rendered, or None
+        """
+        with self.lock:
+            data = self.cache.get((path, page_index))
+            if data is not None:
+                self.cache.move_to_end((path, page_index))
+            return data
+
+    def render(self, path, page_index):
+        """
+        render a thumbnail, or take it from the cache. safe to call from several threads.
+        :param path: the pdf
+        :param page_index: the page in the pdf
+        :return: the PGM bytes, or None for a page without a readable scan image
+        """
+        data = self.cached(path, page_index)
+        if data is not None:
+            return data
+
+        with self.lock:
+            record = self.files.get(path)
+            if record is None:
+                record = self.files[path] = {
+                    "lock": threading.Lock(),
+                    "reader": None,
+                    "close": None,
+                    "closed": False,
+                }
+        with record["lock"]:
+            if record["closed"]:
+                return None
+            if record["reader"] is None:
+                record["reader"], record["close"] = preload_pdf(path)
+            page = record["reader"].pages[page_index]
+            image = extract_page_image(page)
+            rotation = int(page.get("/Rotate", 0))
+        if image is None:
+            return None
+        gray = decode_image(image, max_side=max(self.size) * 2)
+        if gray is None or not gray.size:
+            return None
+        data = thumbnail_pgm(gray, self.size, rotation)
+
+        with self.lock:
+            if record["closed"]:
+                return data
+            self.cache[(path, page_index)] = data
+            self.cache_bytes += len(data)
+            while self.cache_bytes > self.max_bytes:
+                _, evicted = self.cache.popitem(last=False)
+                self.cache_bytes -= len(evicted)
+        return data
+
+    def forget(self, path):
+        """
+        close the reader of a file and drop its thumbnails, when it is no longer selected or
+        changed on disk
+        """
+        with self.lock:
+            record = self.files.pop(path, None)
+            for key in [key for key in self.cache if key[0] == path]:
+                self.cache_bytes -= len(self.cache.pop(key))
+        if record is not None:
+            with record["lock"]:
+                record["closed"] = True
+                if record["close"] is not None:
+                    record["close"]()
+
+    def close(self):
+        for path in list(self.files):
+            self.forget(path)
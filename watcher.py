@@ -0,0 +1,418 @@
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cli import (
+    DEFAULT_CACHE_MB,
+    export_metrics,
+    open_metrics_sinks,
+    pair_odd_even,
+    run_job,
+)
+
+# inotify constants from <sys/inotify.h>
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+_EVENT_HEADER = struct.Struct("iIII")
+
+# How often the watcher forgets the files processed that were removed or changed since
+PRUNE_INTERVAL = 60.0
+
+
+class InotifyEvents:
+    """
+    report the files written or moved into a folder, using Linux inotify through libc
+    """
+
+    def __init__(self, folder):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.folder = folder
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        watch = libc.inotify_add_watch(
+            self.fd, os.fsencode(folder), IN_CLOSE_WRITE | IN_MOVED_TO
+        )
+        if watch < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), f"can't watch '{folder}'")
+
+    def wait(self, timeout):
+        """
+        wait for events
+        :param timeout: the maximum time to wait, in seconds
+        :return: list of the paths that were written
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return []
+
+        paths = []
+        buffer = os.read(self.fd, 64 * 1024)
+        position = 0
+        while position < len(buffer):
+            _, _, _, name_length = _EVENT_HEADER.unpack_from(buffer, position)
+            position += _EVENT_HEADER.size
+            name = buffer[position : position + name_length].rstrip(b"\0")
+            position += name_length
+            if name:
+                paths.append(os.path.join(self.folder, os.fsdecode(name)))
+        return paths
+
+    def close(self):
+        os.close(self.fd)
+
+
+class PollingEvents:
+    """
+    report every file of a folder at a fixed interval, for systems without inotify
+    """
+
+    def __init__(self, folder):
+        self.folder = folder
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        with os.scandir(self.folder) as entries:
+            return [entry.path for entry in entries if entry.is_file()]
+
+    def close(self):
+        pass
+
+
+def open_event_source(folder, use_polling=False):
+    """
+    watch the folder with inotify where available, and fall back to polling
+    :param folder: the folder to watch
+    :param use_polling: force polling, for network shares that don't report changes
+    :return: an event source with wait(timeout) and close()
+    """
+    if not use_polling and sys.platform.startswith("linux"):
+        try:
+            return InotifyEvents(folder)
+        except (OSError, AttributeError):
+            pass
+    return PollingEvents(folder)
+
+
+class HotFolderWatcher:
+    """
+    collate the PDFs dropped by the scanners into a folder. a file is only picked up once its
+    size and modification time have been stable for settle_seconds, and each version of a
+    file is processed once. in merge2 mode, a file still without its odd/even partner after
+    unpaired_seconds is reported as an error and dropped.
+    """
+
+    def __init__(
+        self,
+        folder,
+        mode="organize",
+        output_dir=None,
+        workers=None,
+        max_pending=None,
+        settle_seconds=2.0,
+        interval=0.5,
+        odd_suffix="_odd",
+        even_suffix="_even",
+        use_polling=False,
+        skip_existing=False,
+        streaming=False,
+        deduplicate=False,
+        metrics_sinks=None,
+        cache_dir=None,
+        cache_max_bytes=None,
+        verify=True,
+        index=None,
+        unpaired_seconds=3600.0,
+    ):
+        self.folder = os.path.abspath(folder)
+        self.mode = mode
+        self.output_dir = output_dir
+        self.workers = workers or os.cpu_count() or 1
+        self.settle_seconds = settle_seconds
+        self.interval = interval
+        self.odd_suffix = odd_suffix
+        self.even_suffix = even_suffix
+        self.use_polling = use_polling
+        self.skip_existing = skip_existing
+        self.streaming = streaming
+        self.deduplicate = deduplicate
+        self.metrics_sinks = metrics_sinks or []
+        self.cache_dir = cache_dir
+        self.cache_max_bytes = cache_max_bytes or DEFAULT_CACHE_MB * 1024**2
+        self.verify = verify
+        self.index = index
+        self.unpaired_seconds = unpaired_seconds
+
+        # Backpressure: at most workers + max_pending jobs are queued in the pool
+        max_pending = self.workers * 2 if max_pending is None else max_pending
+        self.slots = threading.BoundedSemaphore(self.workers + max_pending)
+
+        self.candidates = {}  # path -> ((size, mtime_ns), stable since)
+        self.ready = []  # stable files waiting for their odd/even partner
+        self.ready_since = (
+            {}
+        )  # path -> when it became ready, to expire the unpaired files
+        self.processed = {}  # path -> (size, mtime_ns) of the version already submitted
+        self.pruned_at = time.monotonic()
+        self.outputs = set()  # our own outputs, when written into the watched folder
+        self.stop_event = threading.Event()
+        self.job_count = 0
+
+    def file_key(self, path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return stat.st_size, stat.st_mtime_ns
+
+    def add_candidates(self, paths):
+        for path in paths:
+            if path.lower().endswith(".pdf") and path not in self.outputs:
+                self.candidates.setdefault(path, (None, 0.0))
+
+    def collect_stable_files(self):
+        """
+        move the candidates whose size and mtime stopped changing to the ready list
+        """
+        now = time.monotonic()
+        for path, (previous_key, since) in list(self.candidates.items()):
+            key = self.file_key(path)
+            if key is None or self.processed.get(path) == key or path in self.outputs:
+                del self.candidates[path]
+            elif key != previous_key or key[0] == 0:
+                self.candidates[path] = (key, now)
+            elif now - since >= self.settle_seconds:
+                del self.candidates[path]
+                self.processed[path] = key
+                self.ready.append(path)
+                self.ready_since[path] = now
+
+    def prune_processed(self):
+        """
+        forget the processed files that were removed or changed since, so a long-running
+        watcher only remembers the files still in the folder. a changed file is picked up
+        again through its write event.
+        """
+        now = time.monotonic()
+        if now - self.pruned_at < PRUNE_INTERVAL:
+            return
+        self.pruned_at = now
+        for path, key in list(self.processed.items()):
+            if path not in self.ready_since and self.file_key(path) != key:
+                del self.processed[path]
+
+    def expire_unpaired(self, unpaired):
+        """
+        report and drop the ready files that waited unpaired_seconds for their partner, or
+        that were removed meanwhile
+        :param unpaired: the ready files left after pairing
+        :return: the files still waiting
+        """
+        now = time.monotonic()
+        waiting = []
+        for path in unpaired:
+            if self.file_key(path) is None:
+                self.ready_since.pop(path, None)
+            elif now - self.ready_since.get(path, now) >= self.unpaired_seconds:
+                self.ready_since.pop(path, None)
+                print(
+                    json.dumps(
+                        {
+                            "job": None,
+                            "mode": self.mode,
+                            "inputs": [path],
+                            "output": None,
+                            "status": "error",
+                            "error": "no matching odd/even file",
+                            "seconds": 0.0,
+                        }
+                    ),
+                    flush=True,
+                )
+            else:
+                waiting.append(path)
+        return waiting
+
+    def next_jobs(self):
+        """
+        turn the ready files into jobs, pairing odd and even files in merge2 mode
+        """
+        if self.mode == "organize":
+            jobs = [[path] for path in self.ready]
+            self.ready = []
+        else:
+            pairs, unpaired = pair_odd_even(
+                sorted(self.ready), "suffix", self.odd_suffix, self.even_suffix
+            )
+            self.ready = self.expire_unpaired(unpaired)
+            jobs = [list(pair) for pair in pairs]
+
+        for inputs in jobs:
+            for path in inputs:
+                self.ready_since.pop(path, None)
+            self.job_count += 1
+            yield {
+                "job": self.job_count,
+                "mode": self.mode,
+                "inputs": inputs,
+                "output_dir": self.output_dir,
+                "streaming": self.streaming,
+                "deduplicate": self.deduplicate,
+                "metrics": bool(self.metrics_sinks),
+                "cache_dir": self.cache_dir,
+                "cache_max_bytes": self.cache_max_bytes,
+                "verify": self.verify,
+                "index": self.index,
+            }
+
+    def on_job_done(self, future):
+        self.slots.release()
+        summary = future.result()
+        if summary.get("output"):
+            self.outputs.add(os.path.abspath(summary["output"]))
+        export_metrics(summary, self.metrics_sinks)
+        print(json.dumps(summary), flush=True)
+
+    def submit(self, executor, job):
+        # Blocks the watcher while the pool is saturated; the files wait on disk
+        while not self.slots.acquire(timeout=self.interval):
+            if self.stop_event.is_set():
+                return
+        executor.submit(run_job, job).add_done_callback(self.on_job_done)
+
+    def run(self):
+        events = open_event_source(self.folder, self.use_polling)
+        with os.scandir(self.folder) as entries:
+            existing = [entry.path for entry in entries if entry.is_file()]
+        if self.skip_existing:
+            for path in existing:
+                key = self.file_key(path)
+                if key is not None:
+                    self.processed[path] = key
+        else:
+            self.add_candidates(existing)
+
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as executor:
+                while not self.stop_event.is_set():
+                    self.add_candidates(events.wait(self.interval))
+                    self.collect_stable_files()
+                    self.prune_processed()
+                    for job in self.next_jobs():
+                        self.submit(executor, job)
+        finally:
+            events.close()
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Watch a folder and collate every scan dropped into it. "
+        "Prints one JSON summary line per job."
+    )
+    parser.add_argument("folder", help="the folder the scanners write into")
+    parser.add_argument("--mode", choices=("organize", "merge2"), default="organize")
+    parser.add_argument("-d", "--output-dir", default=None)
+    parser.add_argument("-w", "--workers", type=int, default=None)
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=None,
+        help="jobs queued beyond the running ones (default: 2 per worker)",
+    )
+    parser.add_argument(
+        "--settle",
+        type=float,
+        default=2.0,
+        help="seconds a file must stay unchanged before it is processed",
+    )
+    parser.add_argument("--interval", type=float, default=0.5)
+    parser.add_argument(
+        "--unpaired-timeout",
+        type=float,
+        default=3600.0,
+        help="merge2: seconds an odd or even file waits for its partner before it is "
+        "reported and dropped (default: 3600)",
+    )
+    parser.add_argument("--odd-suffix", default="_odd")
+    parser.add_argument("--even-suffix", default="_even")
+    parser.add_argument("--poll", action="store_true", help="don't use inotify")
+    parser.add_argument(
+        "--skip-existing",
+        action="store_true",
+        help="ignore the files already in the folder at startup",
+    )
+    parser.add_argument(
+        "--streaming",
+        action="store_true",
+        help="write pages as they are copied, for scans too large for memory",
+    )
+    parser.add_argument(
+        "--deduplicate",
+        action="store_true",
+        help="store identical images, fonts and profiles only once in the output",
+    )
+    parser.add_argument("--metrics-jsonl", metavar="PATH")
+    parser.add_argument("--metrics-prom", metavar="PATH")
+    parser.add_argument(
+        "--cache-dir", help="reuse the output of scans already collated"
+    )
+    parser.add_argument(
+        "--cache-size", type=int, default=DEFAULT_CACHE_MB, help="cache size in MB"
+    )
+    parser.add_argument(
+        "--no-verify",
+        dest="verify",
+        action="store_false",
+        help="don't check that the back sides line up with the fronts",
+    )
+    parser.add_argument(
+        "--index",
+        metavar="DB",
+        help="page index: report the scans already collated, and add the outputs",
+    )
+    args = parser.parse_args(argv)
+
+    watcher = HotFolderWatcher(
+        args.folder,
+        mode=args.mode,
+        output_dir=args.output_dir,
+        workers=args.workers,
+        max_pending=args.max_pending,
+        settle_seconds=args.settle,
+        interval=args.interval,
+        odd_suffix=args.odd_suffix,
+        even_suffix=args.even_suffix,
+        use_polling=args.poll,
+        skip_existing=args.skip_existing,
+        streaming=args.streaming,
+        deduplicate=args.deduplicate,
+        metrics_sinks=open_metrics_sinks(args.metrics_jsonl, args.metrics_prom),
+        cache_dir=args.cache_dir,
+        cache_max_bytes=args.cache_size * 1024**2,
+        verify=args.verify,
+        index=args.index,
+        unpaired_seconds=args.unpaired_timeout,
+    )
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        watcher.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())